@@ -0,0 +1,169 @@
+"""Module responsible for generating the synthetic catalogs the benchmarks run on."""
+import os
+import random
+import struct
+from bisect import bisect_left
+from datetime import date, timedelta
+from itertools import accumulate
+from tools.repository import Repository
+
+
+class Zipf:
+    """Samples ranks 1..n with probabilities proportional to 1 / rank^s, like the popularity of artists and tags."""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        """
+        Initializes the Zipf class.
+
+            - n: int - the number of ranks
+            - s: float - the exponent of the distribution (the higher, the more the first ranks dominate)
+            - rng: random.Random - the seeded random generator
+
+        Returns: None
+        """
+        self.n = n
+        self._weights = list(accumulate(1 / rank**s for rank in range(1, n + 1)))
+        self._rng = rng
+
+    def sample(self) -> int:
+        """Returns a rank, between 1 and n."""
+        return bisect_left(self._weights, self._rng.random() * self._weights[-1]) + 1
+
+    def distinct(self, k: int) -> list[int]:
+        """Returns k distinct ranks (at most n)."""
+        ranks = {}
+        while len(ranks) < min(k, self.n):
+            ranks[self.sample()] = None
+        return list(ranks)
+
+
+class CatalogGenerator:
+    """
+    Generates a reproducible catalog of songs: the same seed and size always give the same songs.
+
+    The artists and tags of the songs follow Zipf distributions, so a few of them are on many songs (broad searches)
+    and most of them on a few songs (selective searches). Every song gets a small dummy WAV or MP3 file in the storage
+    folder; the files are hard links to one template per format when the filesystem supports it, so large catalogs
+    don't fill the disk.
+    """
+
+    FORMATS = ("mp3", "wav")
+    BATCH_SIZE = 5000
+
+    def __init__(
+        self,
+        size: int,
+        seed: int = 42,
+        artists: int = None,
+        tags: int = None,
+        exponent: float = 1.1,
+    ):
+        """
+        Initializes the CatalogGenerator class.
+
+            - size: int - the number of songs
+            - seed: int - the seed of the random generator (optional)
+            - artists: int - the number of distinct artists (optional, size / 10 by default)
+            - tags: int - the number of distinct tags (optional, 500 by default)
+            - exponent: float - the exponent of the Zipf distributions (optional)
+
+        Returns: None
+        """
+        self.size = size
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.artists = Zipf(artists or max(size // 10, 10), exponent, self.rng)
+        self.tags = Zipf(tags or 500, exponent, self.rng)
+
+    @staticmethod
+    def artist(rank: int) -> str:
+        """Returns the name of the artist with a popularity rank."""
+        return f"artist{rank:07d}"
+
+    @staticmethod
+    def tag(rank: int) -> str:
+        """Returns the name of the tag with a popularity rank."""
+        return f"tag{rank:05d}"
+
+    def songs(self, storage: str):
+        """
+        Generates the songs of the catalog.
+
+            - storage: str - the path to the storage folder
+
+        Returns: Iterator[tuple] - the (filePath, name, releaseDate, format, [artists], [tags], digest) of the songs
+        """
+        first = date(1960, 1, 1)
+        for index in range(self.size):
+            format = self.rng.choice(CatalogGenerator.FORMATS)
+            artists = [CatalogGenerator.artist(rank) for rank in self.artists.distinct(self.rng.choice((1, 1, 1, 2, 3)))]
+            tags = [CatalogGenerator.tag(rank) for rank in self.tags.distinct(self.rng.randint(0, 4))]
+            released = first + timedelta(days=self.rng.randrange(365 * 65))
+            yield (
+                os.path.join(storage, f"song{index:07d}.{format}"),
+                f"Song {index}",
+                released.isoformat(),
+                format,
+                artists,
+                tags,
+                None,
+            )
+
+    def generate(self, repository: Repository, storage: str, report=None) -> int:
+        """
+        Writes the catalog into the database and the storage folder, in batches of BATCH_SIZE songs.
+
+            - repository: Repository - the repository object, whose tables should be empty
+            - storage: str - the path to the storage folder
+            - report: callable - receives the progress messages (optional)
+
+        Returns: int - the number of songs generated
+        """
+        templates = {format: CatalogGenerator.write_dummy(os.path.join(storage, f".template.{format}"), format)
+                     for format in CatalogGenerator.FORMATS}
+        batch, generated = [], 0
+        for song in self.songs(storage):
+            CatalogGenerator.place(templates[song[3]], song[0])
+            batch.append(song)
+            if len(batch) == CatalogGenerator.BATCH_SIZE:
+                generated += len(repository.insert_songs(batch))
+                batch = []
+                if report is not None:
+                    report(f"Generated {generated}/{self.size} songs.")
+        generated += len(repository.insert_songs(batch))
+        for template in templates.values():
+            os.remove(template)
+        return generated
+
+    @staticmethod
+    def place(template: str, path: str) -> None:
+        """Links the template at 'path', or copies it if the filesystem doesn't support hard links."""
+        try:
+            os.link(template, path)
+        except OSError:
+            with open(template, "rb") as source, open(path, "wb") as target:
+                target.write(source.read())
+
+    @staticmethod
+    def write_dummy(path: str, format: str) -> str:
+        """
+        Writes a small dummy audio file: 0.1 seconds of silence for WAV, a few silent MPEG frames for MP3.
+
+            - path: str - the path of the file
+            - format: str - 'wav' or 'mp3'
+
+        Returns: str - the path of the file
+        """
+        if format == "wav":
+            rate, samples = 8000, 800
+            data = bytes(samples * 2)
+            header = b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+            header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16)
+            header += b"data" + struct.pack("<I", len(data))
+            content = header + data
+        else:
+            # MPEG-1 Layer III, 128 kbps, 44.1 kHz frames of 417 bytes
+            content = (b"\xff\xfb\x90\x64" + bytes(413)) * 4
+        with open(path, "wb") as file:
+            file.write(content)
+        return path
@@ -0,0 +1,329 @@
+"""
+Runs the benchmark suite: generates synthetic catalogs of the requested sizes and times the main operations on them.
+
+Usage: python -m benchmarks.run --settings <appsettings.json> [--sizes 1000,10000] [--baseline baseline.json]
+
+The database and the storage folder of the settings are wiped, so they must be dedicated to the benchmarks
+('restart' must be true). The results are printed (or written to --output) as JSON; with --baseline, the medians
+are compared to those of a previous run and the exit code is 1 if one of them regressed by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.catalog import CatalogGenerator
+from commands.archive import Archive
+from commands.create import Create
+from commands.delete import Delete
+from commands.search import Search
+from commands.update import Update
+from tools.handler import Handler
+from tools.repository import Repository
+from tools.validator import Validator
+
+
+class Benchmark:
+    """Times the operations of the application on the catalog loaded in a started Handler."""
+
+    def __init__(self, handler: Handler, repeat: int, workdir: str):
+        """
+        Initializes the Benchmark class.
+
+            - handler: Handler - the started handler, whose database and storage folder the catalog is loaded into
+            - repeat: int - the number of timed runs of every operation
+            - workdir: str - a temporary folder for the json option files and the files of the created songs
+
+        Returns: None
+        """
+        self.handler = handler
+        self.repository = handler.repository
+        self.storage = handler.storage
+        self.repeat = repeat
+        self.workdir = workdir
+        self._files = 0
+        self._created = []
+
+    def run(self, size: int, seed: int, report) -> dict:
+        """
+        Loads a catalog of 'size' songs and times every operation on it.
+
+            - size: int - the number of songs of the catalog
+            - seed: int - the seed of the catalog generator
+            - report: callable - receives the progress messages
+
+        Returns: dict - the statistics of every operation, by name
+        """
+        self.handler.refresh(True)
+        self.handler.migrate_db()
+        generator = CatalogGenerator(size, seed)
+        started = time.perf_counter()
+        generator.generate(self.repository, self.storage, report)
+        results = {"generate": Benchmark.summarize([time.perf_counter() - started])}
+        if self.repository.catalog is not None:
+            self.handler.load_catalog()
+
+        for name, operation in (
+            ("sync_db", self.sync_db),
+            ("search_selective", self.search_selective),
+            ("search_broad", self.search_broad),
+            ("create", self.create),
+            ("update", self.update),
+            ("delete", self.delete),
+            ("archive", self.archive),
+        ):
+            report(f"[{size}] {name}...")
+            results[name] = Benchmark.summarize(operation())
+        return results
+
+    def sync_db(self) -> list[float]:
+        """Times the reconciliation of the database with the storage folder, as done at startup."""
+        return [Benchmark.time(self.handler.sync_db) for _ in range(self.repeat)]
+
+    def search_selective(self) -> list[float]:
+        """Times a search by the artist with the fewest songs."""
+        artist = self.repository.execute(
+            'SELECT "Artist".name FROM "Artist" JOIN "SongArtist" ON "SongArtist".artistid = "Artist".id '
+            'GROUP BY "Artist".name ORDER BY count(*), "Artist".name LIMIT 1',
+            Repository.QUERY,
+        )[0][0]
+        return self._search({"artists": [artist]})
+
+    def search_broad(self) -> list[float]:
+        """Times a search by the tag with the most songs."""
+        tag = self.repository.execute(
+            'SELECT "Tag".name FROM "Tag" JOIN "SongTag" ON "SongTag".tagid = "Tag".id '
+            'GROUP BY "Tag".name ORDER BY count(*) DESC, "Tag".name LIMIT 1',
+            Repository.QUERY,
+        )[0][0]
+        return self._search({"tags": [tag]})
+
+    def _search(self, criteria: dict) -> list[float]:
+        """Times Search.serve with the given criteria, emptying the search cache before every run."""
+        jsonPath = self._options({"name": "", "format": "", "releaseDate": [], "artists": [], "tags": [], **criteria})
+        timings = []
+        for _ in range(self.repeat):
+            self.repository.search_cache.clear()
+            timings.append(Benchmark.time(Search.serve, jsonPath, self.repository))
+        return timings
+
+    def create(self) -> list[float]:
+        """Times the creation of songs, whose ids are kept for the update and delete benchmarks."""
+        template = CatalogGenerator.write_dummy(os.path.join(self.workdir, "template.wav"), "wav")
+        self._created, timings = [], []
+        for index in range(self.repeat):
+            source = os.path.join(self.workdir, f"benchmark{index:05d}.wav")
+            CatalogGenerator.place(template, source)
+            jsonPath = self._options(
+                {
+                    "filePath": source,
+                    "name": f"Benchmark {index}",
+                    "format": "wav",
+                    "releaseDate": "2024-01-01",
+                    "artists": [CatalogGenerator.artist(1), "benchmark"],
+                    "tags": [CatalogGenerator.tag(1)],
+                    "auto": False,
+                }
+            )
+            started = time.perf_counter()
+            self._created.append(
+                Create.serve(jsonPath, self.repository, self.storage, self.handler.ingest)
+            )
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def update(self) -> list[float]:
+        """Times the update of the songs created by the create benchmark."""
+        timings = []
+        for id in self._created:
+            jsonPath = self._options(
+                {
+                    "id": id,
+                    "newName": f"Benchmark {id} (updated)",
+                    "newFormat": "",
+                    "newReleaseDate": "2024-06-01",
+                    "newArtists": [CatalogGenerator.artist(2)],
+                    "newTags": [CatalogGenerator.tag(2), "updated"],
+                }
+            )
+            timings.append(Benchmark.time(Update.serve, jsonPath, self.repository))
+        return timings
+
+    def delete(self) -> list[float]:
+        """Times the deletion of the songs created by the create benchmark."""
+        timings = []
+        for id in self._created:
+            jsonPath = self._options({"id": id})
+            timings.append(Benchmark.time(Delete.serve, jsonPath, self.repository))
+        return timings
+
+    def archive(self) -> list[float]:
+        """Times the archiving of up to 1000 songs of the catalog, removing the archive after every run."""
+        jsonPath = self._options({"name": "", "format": "", "releaseDate": [], "artists": [], "tags": [], "limit": 1000})
+        songs = Search.serve(jsonPath, self.repository)
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            name = Archive.archive_songs(songs, [(0, len(songs))], self.storage, self.handler.archiver)
+            timings.append(time.perf_counter() - started)
+            os.remove(os.path.join(self.storage, f"{name}{self.handler.archiver.extension}"))
+        return timings
+
+    def _options(self, data: dict) -> str:
+        """Writes the options of a command to a json file of the work folder and returns its path."""
+        self._files += 1
+        jsonPath = os.path.join(self.workdir, f"options{self._files:05d}.json")
+        with open(jsonPath, "w") as file:
+            json.dump(data, file)
+        return jsonPath
+
+    @staticmethod
+    def time(function, *args) -> float:
+        """Returns the seconds taken by a call of 'function' with 'args'."""
+        started = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - started
+
+    @staticmethod
+    def summarize(timings: list[float]) -> dict:
+        """
+        Computes the statistics of the timings of an operation.
+
+            - timings: list[float] - the durations of the runs, in seconds
+
+        Returns: dict - the number of runs and the min, median, mean, p95 and max durations
+        """
+        ordered = sorted(timings)
+        return {
+            "runs": len(ordered),
+            "min": ordered[0],
+            "median": statistics.median(ordered),
+            "mean": statistics.fmean(ordered),
+            "p95": ordered[min(round(0.95 * (len(ordered) - 1)), len(ordered) - 1)],
+            "max": ordered[-1],
+        }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Compares the medians of a run with the ones of a baseline run.
+
+        - results: dict - the results of the run
+        - baseline: dict - the results of the baseline run
+        - threshold: float - the relative slowdown above which an operation regressed (e.g. 0.2 for 20%)
+
+    Returns: list[str] - the operations which regressed, as '<size>/<operation>'
+    """
+    regressions = []
+    for size, operations in results["results"].items():
+        for name, stats in operations.items():
+            reference = baseline.get("results", {}).get(size, {}).get(name)
+            if reference is None or reference["median"] <= 0:
+                continue
+            ratio = stats["median"] / reference["median"]
+            regressed = ratio > 1 + threshold
+            print(
+                f"{size:>8} {name:<17} {reference['median'] * 1000:10.2f} ms -> {stats['median'] * 1000:10.2f} ms "
+                f"({ratio:5.2f}x){'  REGRESSION' if regressed else ''}",
+                file=sys.stderr,
+            )
+            if regressed:
+                regressions.append(f"{size}/{name}")
+    return regressions
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the song storage on synthetic catalogs. The database and storage folder are wiped."
+    )
+    parser.add_argument("--settings", required=True, help="the path to an appsettings.json file with restart true")
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000",
+        help="the numbers of songs of the catalogs, separated by commas (default: 1000,10000)",
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="the number of runs of every operation (default: 20)")
+    parser.add_argument("--seed", type=int, default=42, help="the seed of the catalog generator (default: 42)")
+    parser.add_argument("--output", help="the file the JSON results are written to (default: stdout)")
+    parser.add_argument("--baseline", help="the JSON results of a previous run to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="the relative slowdown of a median which counts as a regression (default: 0.2)",
+    )
+    args = parser.parse_args(argv)
+    try:
+        args.sizes = [int(size) for size in args.sizes.split(",")]
+    except ValueError:
+        parser.error("--sizes must be integers separated by commas")
+    if any(size < 1 for size in args.sizes) or args.repeat < 1:
+        parser.error("--sizes and --repeat must be at least 1")
+    return args
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Runs the benchmarks.
+
+        - argv: list[str] - the command line arguments (optional, sys.argv by default)
+
+    Returns: int - the exit code: 0, 1 if an operation regressed compared to the baseline, 2 on errors
+    """
+    args = parse_args(argv)
+    settings = Validator.validate_appsettings(args.settings)
+    if not settings["restart"]:
+        print("The benchmarks wipe the database and storage folder, set 'restart' to true.", file=sys.stderr)
+        return 2
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    report = lambda msg: print(msg, file=sys.stderr)
+    handler = Handler(args.settings)
+    handler.start()
+    results = {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "catalog": settings["catalog"]["enabled"],
+            "ingest": settings["ingest"]["strategy"],
+            "archive": settings["archive"],
+        },
+        "results": {},
+    }
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            benchmark = Benchmark(handler, args.repeat, workdir)
+            for size in args.sizes:
+                results["results"][str(size)] = benchmark.run(size, args.seed, report)
+    finally:
+        handler.stop()
+
+    text = json.dumps(results, indent=4)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
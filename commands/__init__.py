@@ -1 +1 @@
-__all__ = ["create", "delete", "update", "search", "play", "archive"]
+__all__ = ["create", "delete", "update", "search", "play", "archive", "restore"]
@@ -1,33 +1,165 @@
 """This module is reponsible for the archive command. It allows the user to archive songs from the storage folder."""
 
+import os
 import re
-from zipfile import ZipFile
 import string
 import secrets
+from datetime import datetime
 from commands.search import Search
+from tools.validator import Validator
 from tools.repository import Repository
+from tools.ingest import Ingest
+from tools.archiver import Archiver
 
 
 class Archive:
-    """A class which provides static methods to archive the songs from the storage."""
+    """
+    A class which provides static methods to archive the songs from the storage.
+
+    Every archive starts with a manifest listing the songs it covers: their metadata, their storage path, the size,
+    modification time and digest of their file, and the archive holding the file. An incremental archive (with a
+    'base') only holds the files added or changed since its base, its other songs pointing to the archives of the
+    chain which hold them, so the latest manifest of a chain describes the whole set (see the restore command).
+    """
+
+    MANIFEST_VERSION = 1
 
     @staticmethod
-    def serve(jsonPath: str, repository: Repository, storage: str) -> str:
+    def serve(
+        jsonPath: str,
+        repository: Repository,
+        storage: str,
+        archiver: Archiver = None,
+        interactive: bool = True,
+        stdout=None,
+    ) -> dict:
         """
         Serves the archive command, defining the logic behind it.
+        Without a 'selection' in the options, the songs to archive are asked on the console; without an 'output', the
+        archive is placed in the storage folder under a random name. With a 'base' archive, only the songs whose file
+        was added or changed since are written.
 
             - jsonPath: str - the path to archive options json file
             - repository: Repository - the repository object
             - storage: str - the path to the storage folder
+            - archiver: Archiver - writes the archive (optional, a zip archive by default)
+            - interactive: bool - whether the songs can be asked on the console (optional)
+            - stdout: BinaryIO - the stream written to when the 'output' is '-' (optional, streaming is refused if None)
 
-        Returns: str - the name of the archive created
+        Returns: dict - the 'archive' written (its name in the storage folder, its path or '-'), its 'id', the number
+        of 'songs' written, the number of songs 'unchanged' since the base and the number of 'bytes' written
         """
+        data = Validator.validate_archive(jsonPath)
+        if data["output"] == "-" and stdout is None:
+            raise ValueError(
+                "Archives can only be written to stdout from a script whose results go to a file (--results)."
+            )
+        if data["selection"] is None and not interactive:
+            raise ValueError("The archive command needs a 'selection' to run from a script.")
+        base = Archiver.read_manifest(Archive.locate(data["base"], storage)) if data["base"] is not None else None
 
-        songs = Search.serve(jsonPath, repository)
+        songs = Search.find(data, repository)
 
         if not songs:
             raise ValueError("No songs found.")
 
+        if data["selection"] is not None:
+            intervals = Archive.parse_selection(data["selection"], len(songs))
+        else:
+            intervals = Archive.ask_selection(songs)
+
+        archiver = archiver or Archiver()
+        songs_to_archive = Archive.select(songs, intervals)
+        manifest, changed = Archive.manifest(songs_to_archive, base)
+        if data["output"] is None:
+            archive = f"{Archive.generate_random_name()}{archiver.extension}"
+            stats = Archive.write_songs(changed, os.path.join(storage, archive), archiver, manifest)
+        elif data["output"] == "-":
+            archive = "-"
+            stats = Archive.write_songs(changed, stdout, archiver, manifest)
+        else:
+            archive = data["output"]
+            stats = Archive.write_songs(changed, archive, archiver, manifest)
+
+        return {
+            "archive": archive,
+            "id": manifest["id"],
+            "songs": len(changed),
+            "unchanged": len(songs_to_archive) - len(changed),
+            "bytes": stats["written"],
+        }
+
+    @staticmethod
+    def manifest(songs: list[tuple], base: dict = None) -> tuple[dict, list[tuple]]:
+        """
+        Creates the manifest of an archive and finds the songs whose file must be written in it: all of them, or
+        with a base, the ones whose file isn't in the base with the same size and modification time.
+
+            - songs: list[tuple] - the songs of the archive
+            - base: dict - the manifest of the base archive (optional)
+
+        Returns: tuple[dict, list[tuple]] - the manifest and the songs whose file must be written
+        """
+        id = Archive.generate_random_name(16)
+        previous = {record["path"]: record for record in base["songs"]} if base is not None else {}
+        records, changed = [], []
+        for song in songs:
+            stat = os.stat(song[0])
+            file_name = os.path.basename(song[0])
+            record = {
+                "id": song[6],
+                "name": song[1],
+                "releaseDate": str(song[2]),
+                "format": song[3],
+                "artists": list(song[4]),
+                "tags": list(song[5]),
+                "path": song[0],
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "digest": file_name.rsplit(".", 1)[0] if Ingest.is_content_addressed(file_name) else None,
+                "entry": Archive.arcname(song),
+                "archive": id,
+            }
+            old = previous.get(song[0])
+            if old is not None and (old["size"], old["mtime"]) == (record["size"], record["mtime"]):
+                record["entry"], record["archive"] = old["entry"], old["archive"]
+            else:
+                changed.append(song)
+            records.append(record)
+
+        manifest = {
+            "version": Archive.MANIFEST_VERSION,
+            "id": id,
+            "base": base["id"] if base is not None else None,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "songs": records,
+        }
+        return manifest, changed
+
+    @staticmethod
+    def locate(archive: str, storage: str) -> str:
+        """
+        Finds an archive given by its path or by its name in the storage folder.
+
+            - archive: str - the path or the name of the archive
+            - storage: str - the path to the storage folder
+
+        Returns: str - the path of the archive, raises an exception if it doesn't exist
+        """
+        for path in (archive, os.path.join(storage, archive)):
+            if os.path.isfile(path):
+                return path
+        raise ValueError(f"Archive {archive} not found.")
+
+    @staticmethod
+    def ask_selection(songs: list[tuple]) -> list[tuple]:
+        """
+        Asks on the console which of the songs found to archive, until the answer is valid.
+
+            - songs: list[tuple] - the songs found
+
+        Returns: list[tuple] - the intervals of the songs to archive
+        """
         print(Archive.display_songs(songs))
 
         overlapping = True
@@ -45,32 +177,107 @@ class Archive:
             else:
                 overlapping = False
 
-        archive_name = Archive.archive_songs(songs, intervals, storage)
-        print(f"Archive created successfully. Name: {archive_name}")
+        return intervals
 
     @staticmethod
-    def archive_songs(songs: list[tuple], intervals: list[tuple], storage: str) -> str:
+    def parse_selection(selection: str, count: int) -> list[tuple]:
         """
-        Archive the songs from 'songs' list after applying the intervals from 'intervals' and place them in the 'storage' folder.
+        Parses the 'selection' of the archive options: 'all' or Opt,Opt,... where Opt = <number> or
+        <number>..<number>, the numbers being the positions of the songs found (1-indexed).
 
-            - songs: list[tuple] - the list of songs to archive
-            - intervals: list[tuple] - the list of intervals to archive the songs
-            - storage: str - the path to the storage folder
+            - selection: str - the selection
+            - count: int - the number of songs found
+
+        Returns: list[tuple] - the intervals of the songs to archive
+        """
+        selection = selection.strip()
+        if selection.lower() == "all":
+            return [(0, count)]
+        if not Archive.command_matches(selection):
+            raise ValueError(
+                "Invalid selection. Syntax: 'all' or Opt,Opt,... where Opt = <number> or <number>..<number>"
+            )
+
+        intervals = Archive.parse_command(selection)
+        if Archive.intervals_overlap(intervals):
+            raise ValueError("Overlapping intervals in the selection.")
+        if any(start < 0 or start >= end or end > count for start, end in intervals):
+            raise ValueError(f"Selection out of range, {count} song(s) found.")
+        return intervals
 
-        Returns: str - the name of the archive created
+    @staticmethod
+    def select(songs: list[tuple], intervals: list[tuple]) -> list[tuple]:
         """
+        Applies the intervals from 'intervals' to the 'songs' list.
+
+            - songs: list[tuple] - the list of songs found
+            - intervals: list[tuple] - the list of intervals to archive the songs
 
+        Returns: list[tuple] - the songs to archive
+        """
         songs_to_archive = []
         for interval in intervals:
             songs_to_archive.extend(songs[interval[0] : interval[1]])
+        return songs_to_archive
 
-        archive_name = Archive.generate_random_name()
-        with ZipFile(f"{storage}/{archive_name}.zip", "w") as archive:
-            for song in songs_to_archive:
-                archive.write(song[0], arcname=song[0].rsplit("/", 1)[1])
+    @staticmethod
+    def archive_songs(
+        songs: list[tuple], intervals: list[tuple], storage: str, archiver: Archiver = None
+    ) -> str:
+        """
+        Archive the songs from 'songs' list after applying the intervals from 'intervals' and place them in the 'storage' folder.
 
+            - songs: list[tuple] - the list of songs to archive
+            - intervals: list[tuple] - the list of intervals to archive the songs
+            - storage: str - the path to the storage folder
+            - archiver: Archiver - writes the archive (optional, a zip archive by default)
+
+        Returns: str - the name of the archive created, without its extension
+        """
+        archiver = archiver or Archiver()
+        archive_name = Archive.generate_random_name()
+        songs_to_archive = Archive.select(songs, intervals)
+        Archive.write_songs(
+            songs_to_archive,
+            os.path.join(storage, f"{archive_name}{archiver.extension}"),
+            archiver,
+            Archive.manifest(songs_to_archive)[0],
+        )
         return archive_name
 
+    @staticmethod
+    def write_songs(songs: list[tuple], output, archiver: Archiver = None, manifest: dict = None) -> dict:
+        """
+        Writes an archive of the songs to a file or a stream.
+
+            - songs: list[tuple] - the songs to archive
+            - output: str | BinaryIO - the path of the archive or the stream it is written to
+            - archiver: Archiver - writes the archive (optional, a zip archive by default)
+            - manifest: dict - the manifest of the archive, written as its first entry (optional)
+
+        Returns: dict - the statistics of the archive (see Archiver.write)
+        """
+        archiver = archiver or Archiver()
+        entries = [(song[0], Archive.arcname(song)) for song in songs]
+        if isinstance(output, str):
+            return archiver.create(entries, output, manifest)
+        return archiver.write(entries, output, "-", manifest)
+
+    @staticmethod
+    def arcname(song: tuple) -> str:
+        """
+        Returns the name of a song inside the archive: the name of its file or, if the file is named after its digest
+        (content-addressed layout), Artist1,Artist2-Name-<id>.format, the id keeping apart the songs sharing a file.
+
+            - song: tuple - the song, as returned by the search command
+
+        Returns: str - the name of the song inside the archive
+        """
+        file_name = song[0].rsplit("/", 1)[1]
+        if not Ingest.is_content_addressed(file_name):
+            return file_name
+        return f"{','.join(song[4])}-{song[1]}-{song[6]}.{song[3]}"
+
     @staticmethod
     def generate_random_name(length: int = 8) -> str:
         """
@@ -1,10 +1,10 @@
 """Module responsible for the create command."""
 import re
 import os
-import shutil
 from tools.validator import Validator
 from tools.repository import Repository
 from tools.checker import Checker
+from tools.ingest import Ingest
 from datetime import datetime
 from common import extensions
 
@@ -13,13 +13,16 @@ class Create:
     """A class which provides static methods to create a new song in the storage and database."""
 
     @staticmethod
-    def serve(jsonPath: str, repository: Repository, storage: str) -> int:
+    def serve(jsonPath: str, repository: Repository, storage: str, ingest: Ingest = None) -> int:
         """
         Serves the create command, defining the logic behind it.
+        The song is inserted and its file placed in the storage folder in one transaction, committed once both succeeded;
+        if the commit fails, the file is removed again.
 
             - jsonPath: str - the path to create options json file
             - repository: Repository - the repository object
             - storage: str - the path to the storage folder
+            - ingest: Ingest - places the file in the storage folder (optional, the file is copied by default)
 
         Returns: int - the id of the song created
         """
@@ -32,25 +35,37 @@ class Create:
             else raw_data
         )
 
-        if Checker.check_file_existence(data["filePath"], storage):
+        ingest = ingest or Ingest()
+        if not ingest.content_addressed and Checker.check_file_existence(data["filePath"], storage):
             raise ValueError(f"File {data['filePath']} already exists in storage.")
 
-        storage_file = os.path.join(storage, data["filePath"].rsplit("/", 1)[1])
+        storage_file, digest = ingest.destination(data["filePath"], storage, data["format"])
 
-        command = "INSERT INTO \"Song\" (filepath, name, releasedate, format) VALUES ('{}', '{}', '{}', '{}') RETURNING id".format(
-            storage_file, data["name"], data["releaseDate"], data["format"]
-        )
+        params = (storage_file, data["name"], data["releaseDate"], data["format"], digest)
+        with repository.transaction():
+            result = repository.run("insert_song", params, Repository.COMMAND)
 
-        result = repository.execute(command, Repository.COMMAND)
+            song_id = result[0][0]
+            artists_id = repository.resolve_artists(data["artists"])
+            tags_id = repository.resolve_tags(data["tags"])
 
-        song_id = result[0][0]
-        artists_id = [repository.create_artist(artist) for artist in data["artists"]]
-        tags_id = [repository.create_tag(tag) for tag in data["tags"]]
+            repository.create_song_artists(song_id, artists_id)
+            repository.create_song_tags(song_id, tags_id)
 
-        repository.create_song_artists(song_id, artists_id)
-        repository.create_song_tags(song_id, tags_id)
+            if repository.catalog is not None:
+                repository.on_commit(
+                    lambda: repository.catalog.add_song(
+                        song_id,
+                        *params[:4],
+                        dict(zip(artists_id, dict.fromkeys(data["artists"]))),
+                        dict(zip(tags_id, dict.fromkeys(data["tags"]))),
+                    )
+                )
 
-        shutil.copy(data["filePath"], storage)
+            ingest.place(data["filePath"], storage_file)
+            repository.on_commit(lambda: Ingest.release([storage_file]))
+            repository.on_commit(lambda: ingest.remove_sources([data["filePath"]]))
+            repository.on_rollback(lambda: Ingest.discard([storage_file], repository))
 
         return song_id
 
@@ -92,6 +107,7 @@ class Create:
             "auto": True,
         }
 
+        Validator.check_lengths(result)
         return result
 
     @staticmethod
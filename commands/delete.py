@@ -1,7 +1,7 @@
 """Module responsible for the delete command."""
-import os
 from tools.repository import Repository
 from tools.validator import Validator
+from tools.ingest import Ingest
 
 
 class Delete:
@@ -11,6 +11,7 @@ class Delete:
     def serve(jsonPath: str, repository: Repository) -> None:
         """
         Serves the delete command, defining the logic behind it.
+        The song's file is removed once the deletion is committed, unless other songs share it (content-addressed layout).
 
             - jsonPath: str - the path to delete options json file
             - repository: Repository - the repository object
@@ -19,13 +20,15 @@ class Delete:
         """
         data = Validator.validate_delete(jsonPath)
 
-        command = 'SELECT filepath FROM "Song" WHERE id = {}'.format(data["id"])
-        filePath = repository.execute(command, Repository.COMMAND)
-        if len(filePath) == 0:
-            raise ValueError(f"Song with id {data['id']} does not exist.")
+        with repository.transaction():
+            filePath = repository.run("fetch_song_filepath", (data["id"],), Repository.QUERY)
+            if len(filePath) == 0:
+                raise ValueError(f"Song with id {data['id']} does not exist.")
 
-        repository.delete_song("id", data["id"])
-        os.remove(filePath[0][0])
+            repository.delete_song("id", data["id"])
+            if repository.catalog is not None:
+                repository.on_commit(lambda: repository.catalog.remove_songs([data["id"]]))
+            repository.on_commit(lambda: Ingest.remove_unreferenced(filePath[0][0], repository))
 
     @staticmethod
     def help() -> str:
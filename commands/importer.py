@@ -0,0 +1,331 @@
+"""Module responsible for the import command."""
+import json
+import os
+import psycopg2
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from itertools import islice
+from typing import Iterator
+from tools.validator import Validator
+from tools.repository import Repository
+from tools.ingest import Ingest
+from commands.create import Create
+
+
+class Import:
+    """
+    A class which provides static methods to import many songs at once, from a directory or a JSONL manifest.
+
+    The records are validated one by one while they are read and loaded in batches: the files of a batch are copied
+    on a worker pool, then the songs and their relations are inserted with multi-row statements in one transaction.
+    The progress is saved in a checkpoint after every batch, so an interrupted import can be resumed.
+    """
+
+    CHECKPOINT = ".import-checkpoint.json"
+
+    @staticmethod
+    def serve(
+        jsonPath: str,
+        repository: Repository,
+        storage: str,
+        settings: dict,
+        report=print,
+        ingest: Ingest = None,
+    ) -> dict:
+        """
+        Serves the import command, defining the logic behind it.
+
+            - jsonPath: str - the path to import options json file
+            - repository: Repository - the repository object
+            - storage: str - the path to the storage folder
+            - settings: dict - the import settings (batchSize, workers)
+            - report: callable - receives the progress and error messages (optional)
+            - ingest: Ingest - places the files in the storage folder (optional, the files are copied by default)
+
+        Returns: dict - the number of songs 'imported', 'skipped' (already imported) and 'failed'
+        """
+        data = Validator.validate_import(jsonPath)
+        ingest = ingest or Ingest()
+        source = os.path.abspath(data["source"])
+        checkpoint_path = os.path.join(storage, Import.CHECKPOINT)
+
+        checkpoint = Import._load_checkpoint(checkpoint_path, source) if data["resume"] else None
+        start = checkpoint["next"] if checkpoint else 0
+        pending = set(checkpoint["pending"]) if checkpoint else set()
+        if start:
+            report(f"Resuming the import of {source} from record {start + 1}.")
+
+        summary = {"imported": 0, "skipped": 0, "failed": 0}
+        records = islice(Import._records(source, data["tags"]), start, None)
+
+        with ThreadPoolExecutor(max_workers=settings["workers"], thread_name_prefix="import") as executor:
+            while batch := list(islice(records, settings["batchSize"])):
+                songs = Import._prepare(batch, repository, storage, ingest, pending, summary, report)
+                next_record = batch[-1][0] + 1
+
+                Import._save_checkpoint(
+                    checkpoint_path, source, batch[0][0], [os.path.basename(song[0]) for song in songs]
+                )
+                copied = Import._copy(songs, executor, ingest, storage, summary, report)
+                try:
+                    Import._insert(copied, repository, ingest)
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    report(f"Batch rolled back ({str(e).strip()}), importing its songs one by one.")
+                    placed = {song[0] for song in copied}
+                    copied = Import._insert_one_by_one(
+                        [song for song in songs if song[0] in placed],
+                        repository,
+                        executor,
+                        ingest,
+                        storage,
+                        summary,
+                        report,
+                    )
+
+                summary["imported"] += len(copied)
+                Import._save_checkpoint(checkpoint_path, source, next_record, [])
+                pending = set()
+                report(
+                    f"Imported {summary['imported']} song(s) from {next_record} record(s), "
+                    f"{summary['failed']} failed."
+                )
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return summary
+
+    @staticmethod
+    def _records(source: str, tags: list) -> Iterator[tuple[int, str, dict]]:
+        """
+        Reads and validates the records of the import, in a stable order so an import can be resumed.
+        Files from a directory must be named <artist1>,<artist2>,...,<artistN>-<name>.<format>; every line of a
+        manifest is an object with the keys of the 'create' command.
+
+            - source: str - the directory or the JSONL manifest
+            - tags: list - the tags added to the songs of a directory
+
+        Returns: Iterator[tuple[int, str, dict]] - the (index, label, data) of the records, data being the exception
+        raised by the validation if the record is not valid
+        """
+        if os.path.isdir(source):
+            with os.scandir(source) as entries:
+                names = sorted(entry.name for entry in entries if entry.is_file())
+            for index, name in enumerate(names):
+                path = os.path.join(source, name)
+                try:
+                    yield index, name, Create._fetch_from_path(path, tags)
+                except Exception as e:
+                    yield index, name, e
+            return
+
+        with open(source, "r") as file:
+            for index, line in enumerate(file):
+                label = f"line {index + 1}"
+                try:
+                    data = Validator.validate_song(json.loads(line))
+                    if data["auto"]:
+                        data = Create._fetch_from_path(data["filePath"], data["tags"])
+                    yield index, label, data
+                except Exception as e:
+                    yield index, label, e
+
+    @staticmethod
+    def _prepare(
+        batch: list,
+        repository: Repository,
+        storage: str,
+        ingest: Ingest,
+        pending: set,
+        summary: dict,
+        report,
+    ) -> list[tuple]:
+        """
+        Turns the valid records of a batch into songs, reporting the invalid ones and the files which already exist in
+        the storage folder. Files left by an interrupted batch ('pending') are removed, to be placed again, unless their
+        song was inserted.
+        With the content-addressed layout, files with the same name or content don't collide, so they aren't checked,
+        but the pending songs already inserted (same file, name, release date and format) are still skipped.
+
+        Returns: list[tuple] - the (source, filePath, name, releaseDate, format, [artists], [tags]) of the songs
+        """
+        songs, names = [], set()
+        for _, label, data in batch:
+            if isinstance(data, Exception):
+                Import._fail(summary, report, label, data)
+                continue
+            name = os.path.basename(data["filePath"])
+            if name in names and not ingest.content_addressed:
+                Import._fail(summary, report, label, f"File {name} is imported twice.")
+                continue
+            if not ingest.content_addressed and len(os.path.join(storage, name)) > Validator.MAX_LENGTH:
+                Import._fail(summary, report, label, f"The path of {name} in storage is too long.")
+                continue
+            names.add(name)
+            songs.append(
+                (
+                    data["filePath"],
+                    os.path.join(storage, name),
+                    data["name"],
+                    data["releaseDate"],
+                    data["format"],
+                    data["artists"],
+                    data["tags"],
+                )
+            )
+
+        if ingest.content_addressed:
+            return Import._skip_inserted(songs, repository, storage, ingest, pending, summary)
+
+        existing = {song[1] for song in songs if os.path.exists(song[1])}
+        tracked = repository.tracked_filepaths(list(existing))
+        result = []
+        for song in songs:
+            name = os.path.basename(song[1])
+            if song[1] in tracked and name in pending:
+                summary["skipped"] += 1
+            elif song[1] in existing and name not in pending:
+                Import._fail(summary, report, name, f"File {name} already exists in storage.")
+            else:
+                if song[1] in existing:
+                    # the leftover of the interrupted batch, which the strategies linking the file can't replace
+                    os.remove(song[1])
+                result.append(song)
+        return result
+
+    @staticmethod
+    def _skip_inserted(
+        songs: list[tuple], repository: Repository, storage: str, ingest: Ingest, pending: set, summary: dict
+    ) -> list[tuple]:
+        """
+        Removes the pending songs of the content-addressed layout which were inserted before the import was
+        interrupted. Their files are hashed to find their storage path; the ones which can't be read are kept, so
+        their error is reported when they are copied.
+
+        Returns: list[tuple] - the songs to import
+        """
+        destinations = {}
+        for song in songs:
+            if os.path.basename(song[0]) in pending:
+                with suppress(OSError):
+                    destinations[song[0]] = ingest.destination(song[0], storage, song[4])[0]
+        if not destinations:
+            return songs
+
+        existing = Counter(repository.songs_by_filepath(list(set(destinations.values()))))
+        result = []
+        for song in songs:
+            key = (destinations.get(song[0]), song[2], str(song[3]), song[4])
+            if existing[key] > 0:
+                existing[key] -= 1
+                summary["skipped"] += 1
+            else:
+                result.append(song)
+        return result
+
+    @staticmethod
+    def _copy(
+        songs: list[tuple], executor: ThreadPoolExecutor, ingest: Ingest, storage: str, summary: dict, report
+    ) -> list[tuple]:
+        """
+        Hashes (for the content-addressed layout) and places the files of a batch in the storage folder on the worker pool.
+        The files removed if the batch is rolled back are the ones no song uses.
+
+        Returns: list[tuple] - the songs whose file is stored, with their storage path and digest
+        """
+        def copy(song: tuple):
+            try:
+                destination, digest = ingest.destination(song[0], storage, song[4])
+                ingest.place(song[0], destination)
+                return destination, digest
+            except OSError as e:
+                return e
+
+        copied = []
+        for song, result in zip(songs, executor.map(copy, songs)):
+            if isinstance(result, Exception):
+                Import._fail(summary, report, os.path.basename(song[0]), result)
+            else:
+                copied.append((song[0], result[0], *song[2:], result[1]))
+        return copied
+
+    @staticmethod
+    def _insert(songs: list[tuple], repository: Repository, ingest: Ingest) -> None:
+        """
+        Inserts the songs whose files are placed in one transaction. If it is rolled back, the files no song uses are
+        removed.
+
+            - songs: list[tuple] - the songs, as returned by _copy()
+            - repository: Repository - the repository object
+            - ingest: Ingest - the ingest which placed the files
+
+        Returns: None
+        """
+        destinations = [song[1] for song in songs]
+        with repository.transaction():
+            repository.on_commit(lambda: Ingest.release(destinations))
+            repository.on_commit(lambda: ingest.remove_sources([song[0] for song in songs]))
+            repository.on_rollback(lambda: Ingest.discard(destinations, repository))
+            repository.insert_songs([song[1:] for song in songs])
+
+    @staticmethod
+    def _insert_one_by_one(
+        songs: list[tuple],
+        repository: Repository,
+        executor: ThreadPoolExecutor,
+        ingest: Ingest,
+        storage: str,
+        summary: dict,
+        report,
+    ) -> list[tuple]:
+        """
+        Imports the songs of a batch which was rolled back one at a time, so the songs the database rejects are
+        reported instead of failing the whole import. Their files are placed again, the rollback removed them; the
+        songs whose file couldn't be placed are already reported, so they aren't retried.
+
+        Returns: list[tuple] - the songs imported
+        """
+        imported = []
+        for song in songs:
+            for copied in Import._copy([song], executor, ingest, storage, summary, report):
+                try:
+                    Import._insert([copied], repository, ingest)
+                    imported.append(copied)
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    Import._fail(summary, report, os.path.basename(song[0]), e)
+        return imported
+
+    @staticmethod
+    def _fail(summary: dict, report, label: str, error) -> None:
+        """Counts and reports a record which couldn't be imported."""
+        summary["failed"] += 1
+        report(f"Skipping {label}: {str(error).strip()}")
+
+    @staticmethod
+    def _load_checkpoint(path: str, source: str) -> dict:
+        """
+        Loads the checkpoint of an interrupted import of 'source'.
+
+        Returns: dict | None - the index of the 'next' record and the 'pending' files, None if there is no checkpoint
+        """
+        try:
+            with open(path, "r") as file:
+                data = json.loads(file.read())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("source") != source:
+            return None
+        return data
+
+    @staticmethod
+    def _save_checkpoint(path: str, source: str, next: int, pending: list[str]) -> None:
+        """Atomically writes the checkpoint of an import: the next record to import and the files being copied."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(json.dumps({"source": source, "next": next, "pending": pending}))
+        os.replace(temporary, path)
+
+    @staticmethod
+    def help() -> str:
+        """Returns the help message for the import command."""
+        return "   > import <path-to-json> => Imports all the songs from a directory or a JSONL manifest"
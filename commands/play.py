@@ -23,8 +23,7 @@ class Play:
         """
         data = Validator.validate_play(jsonPath)
 
-        query = 'SELECT * from "Song" WHERE id = {}'.format(data["songId"])
-        result = repository.execute(query, Repository.QUERY)
+        result = repository.run("fetch_song", (data["songId"],), Repository.QUERY)
         if len(result) == 0:
             raise ValueError(f"Song with id {data['songId']} does not exist.")
 
@@ -0,0 +1,155 @@
+"""Module responsible for the restore command. It rebuilds the songs of a chain of archives."""
+import os
+from collections import Counter
+from tools.validator import Validator
+from tools.repository import Repository
+from tools.archiver import Archiver
+from commands.archive import Archive
+
+
+class Restore:
+    """
+    A class which provides static methods to restore the songs of a chain of archives (see the archive command).
+
+    The manifest of the last archive of the chain describes the whole set of songs, and the archive holding the file
+    of every song; the files are extracted from each archive in one pass, then the songs are inserted in batches in a
+    single transaction, so a failed restore leaves neither songs nor files behind.
+    """
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def serve(jsonPath: str, repository: Repository, storage: str, report=print) -> dict:
+        """
+        Serves the restore command, defining the logic behind it.
+        The songs are restored in the storage folder and the database, skipping the ones already there (same file,
+        name, release date and format), so restoring twice is harmless; with a 'destination', only the files are
+        extracted there, under their names in the archives.
+
+            - jsonPath: str - the path to restore options json file
+            - repository: Repository - the repository object
+            - storage: str - the path to the storage folder
+            - report: callable - receives the progress messages (optional)
+
+        Returns: dict - the number of songs 'restored' and 'skipped', of 'files' extracted and of 'bytes' extracted
+        """
+        data = Validator.validate_restore(jsonPath)
+        chain = Restore.read_chain(data["archives"], storage)
+        songs = chain[-1][1]["songs"]
+
+        summary = {"restored": 0, "skipped": 0, "files": 0, "bytes": 0}
+        extracted = []
+        if data["destination"] is not None:
+            files = {os.path.join(data["destination"], record["entry"]): record for record in songs}
+            Restore.extract(chain, files, extracted, summary, report)
+            summary["restored"] = len(songs)
+            return summary
+
+        targets = [os.path.join(storage, os.path.basename(record["path"])) for record in songs]
+        existing = Counter(repository.songs_by_filepath(list(dict.fromkeys(targets))))
+        missing = []
+        for target, record in zip(targets, songs):
+            key = (target, record["name"], record["releaseDate"], record["format"])
+            if existing[key] > 0:
+                existing[key] -= 1
+            else:
+                missing.append((target, record))
+        summary["skipped"] = len(songs) - len(missing)
+
+        files = {}
+        for target, record in missing:
+            if target in files:
+                continue
+            if os.path.exists(target):
+                # a content-addressed file is the same whoever stored it, any other file belongs to another song
+                if record["digest"] is None:
+                    raise ValueError(f"File {os.path.basename(target)} already exists in storage.")
+                continue
+            files[target] = record
+
+        try:
+            Restore.extract(chain, files, extracted, summary, report)
+            with repository.transaction():
+                for start in range(0, len(missing), Restore.BATCH_SIZE):
+                    batch = missing[start : start + Restore.BATCH_SIZE]
+                    repository.insert_songs(
+                        [
+                            (
+                                target,
+                                record["name"],
+                                record["releaseDate"],
+                                record["format"],
+                                record["artists"],
+                                record["tags"],
+                                record["digest"],
+                            )
+                            for target, record in batch
+                        ]
+                    )
+                    summary["restored"] += len(batch)
+                    report(f"Inserted {summary['restored']}/{len(missing)} song(s).")
+        except Exception:
+            Restore.discard(extracted)
+            raise
+        return summary
+
+    @staticmethod
+    def read_chain(archives: list[str], storage: str) -> list[tuple[str, dict]]:
+        """
+        Reads the manifests of a chain of archives and checks that the chain holds the file of every song.
+
+            - archives: list[str] - the paths or names in the storage folder of the archives, the latest last
+            - storage: str - the path to the storage folder
+
+        Returns: list[tuple[str, dict]] - the path and manifest of every archive, raises an exception if one is missing
+        """
+        chain = []
+        for archive in archives:
+            path = Archive.locate(archive, storage)
+            chain.append((path, Archiver.read_manifest(path)))
+
+        ids = {manifest["id"] for _, manifest in chain}
+        for record in chain[-1][1]["songs"]:
+            if record["archive"] not in ids:
+                raise ValueError(
+                    f"The file of {record['name']} is in the archive {record['archive']}, which is not in the chain."
+                )
+        return chain
+
+    @staticmethod
+    def extract(chain: list[tuple[str, dict]], files: dict, extracted: list, summary: dict, report) -> None:
+        """
+        Extracts files from the archives of the chain holding them, with their modification time.
+
+            - chain: list[tuple[str, dict]] - the path and manifest of every archive (see read_chain)
+            - files: dict - the record of the song (from the latest manifest) whose file is extracted, by destination
+            - extracted: list - receives the files extracted, so they can be removed if the restore fails
+            - summary: dict - the summary of the restore, whose 'files' and 'bytes' are updated
+            - report: callable - receives the progress messages
+
+        Returns: None
+        """
+        for path, manifest in chain:
+            targets = {
+                record["entry"]: target for target, record in files.items() if record["archive"] == manifest["id"]
+            }
+            if not targets:
+                continue
+            extracted.extend(targets.values())
+            summary["bytes"] += Archiver.extract(path, targets)
+            for target in targets.values():
+                os.utime(target, ns=(files[target]["mtime"], files[target]["mtime"]))
+            summary["files"] += len(targets)
+            report(f"Extracted {len(targets)} file(s) from {path}.")
+
+    @staticmethod
+    def discard(paths: list[str]) -> None:
+        """Removes the files extracted by a restore which failed (none of them existed before)."""
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def help() -> str:
+        """Returns a help message for the restore command."""
+        return "   > restore <path-to-json> => Restores the songs of a chain of archives"
@@ -1,4 +1,5 @@
 """Module for the search command."""
+from typing import Iterator
 from tools.repository import Repository
 from tools.validator import Validator
 
@@ -6,6 +7,16 @@ from tools.validator import Validator
 class Search:
     """A class which provides static methods to search for a song in the database."""
 
+    RANKED_LIMIT = 100
+
+    SELECT = 'SELECT "Song".filepath, "Song".name, "Song".releasedate, "Song".format, \
+        ARRAY(SELECT "Artist".name FROM "SongArtist" join "Artist" on "SongArtist".artistid = "Artist".id \
+            WHERE "SongArtist".songid = "Song".id ORDER BY "SongArtist".id) AS artists, \
+        ARRAY(SELECT "Tag".name FROM "SongTag" join "Tag" on "SongTag".tagid = "Tag".id \
+            WHERE "SongTag".songid = "Song".id ORDER BY "SongTag".id) AS tags, \
+        "Song".id \
+        FROM "Song"'
+
     @staticmethod
     def serve(jsonPath: str, repository: Repository) -> list[tuple]:
         """
@@ -14,102 +25,205 @@ class Search:
             - jsonPath: str - the path to search options json file
             - repository: Repository - the repository object
 
-        Returns: list[tuple] - the list of songs found
+        Returns: list[tuple] - the list of songs found, as (filePath, name, releaseDate, format, [artists], [tags], id)
+        """
+        return Search.find(Validator.validate_search(jsonPath), repository)
+
+    @staticmethod
+    def find(data: dict, repository: Repository) -> list[tuple]:
+        """
+        Finds the songs matching validated search criteria, from the in-memory catalog, the cache or the database.
+
+            - data: dict - the search criteria, validated by Validator.validate_criteria
+            - repository: Repository - the repository object
+
+        Returns: list[tuple] - the list of songs found, with the same layout as serve()
+        """
+        if repository.catalog is not None and not data["query"]:
+            return repository.catalog.search(data)
+
+        key = Search.cache_key(data, repository.generation)
+        result = repository.search_cache.get(key)
+        if result is None:
+            query, params = Search.compile(data)
+            result = repository.execute(query, Repository.QUERY, params=params)
+            if len(result) <= repository.search_cache_rows:
+                repository.search_cache.put(key, result)
+
+        return list(result)
+
+    @staticmethod
+    def stream(
+        jsonPath: str, repository: Repository, fetch_size: int = 1000
+    ) -> Iterator[tuple]:
+        """
+        Serves the search command in streaming mode: the songs are read through a server-side cursor,
+        'fetch_size' rows at a time, and yielded as soon as they arrive.
+
+            - jsonPath: str - the path to search options json file
+            - repository: Repository - the repository object
+            - fetch_size: int - the number of rows fetched per round trip (default: 1000)
+
+        Returns: Iterator[tuple] - the songs found, with the same layout as serve()
         """
         data = Validator.validate_search(jsonPath)
+        if repository.catalog is not None and not data["query"]:
+            return iter(repository.catalog.search(data))
+
+        key = Search.cache_key(data, repository.generation)
+        result = repository.search_cache.get(key)
+        if result is not None:
+            return iter(result)
+
+        query, params = Search.compile(data)
+        return Search._stream_into_cache(
+            repository.stream(query, params, fetch_size), key, repository
+        )
+
+    @staticmethod
+    def _stream_into_cache(
+        rows: Iterator[tuple], key: tuple, repository: Repository
+    ) -> Iterator[tuple]:
+        """
+        Yields the streamed rows and caches them once the stream is exhausted, unless there are more than the cache accepts.
+
+            - rows: Iterator[tuple] - the rows streamed from the database
+            - key: tuple - the cache key of the search
+            - repository: Repository - the repository object
 
-        query = 'SELECT id from "Song"'
-        result = repository.execute(query, Repository.QUERY)
+        Returns: Iterator[tuple] - the same rows
+        """
+        collected = []
+        for row in rows:
+            if collected is not None:
+                collected.append(row)
+                if len(collected) > repository.search_cache_rows:
+                    collected = None
+            yield row
 
-        song_ids = set([item[0] for item in result])
-        song_by_artists = Search.search_by_artists(data["artists"], repository)
-        song_by_tags = Search.search_by_tags(data["tags"], repository)
-        song_by_metadata = Search.search_by_metadata(data, repository)
+        if collected is not None:
+            repository.search_cache.put(key, collected)
 
-        song_by_artists, song_by_tags, song_by_metadata = [
-            item if item != None else song_ids
-            for item in [song_by_artists, song_by_tags, song_by_metadata]
-        ]
+    @staticmethod
+    def cache_key(data: dict, generation: int) -> tuple:
+        """
+        Normalizes the search criteria into a cache key. Criteria which always match the same songs get the same key.
 
-        search_results_ids = (
-            song_ids & song_by_artists & song_by_tags & song_by_metadata
+            - data: dict - the validated search criteria
+            - generation: int - the catalog generation the results belong to
+
+        Returns: tuple - the cache key
+        """
+        return (
+            generation,
+            data["name"].lower(),
+            data["format"].lower(),
+            tuple(data["releaseDate"]),
+            tuple(sorted(artist.lower() for artist in data["artists"])),
+            tuple(sorted(tag.lower() for tag in data["tags"])),
+            data.get("limit"),
+            data.get("after"),
+            data.get("query"),
         )
 
-        data = []
-        for id in search_results_ids:
-            song = repository.fetch_song_data(id)
-            data.append(song)
+    @staticmethod
+    def compile(data: dict) -> tuple[str, tuple]:
+        """
+        Compiles the search criteria into a single query which also aggregates the artists and tags of every song.
+        The songs are ordered by id, so 'after' (the last id of the previous page) and 'limit' page through them by key.
+        With a free-text 'query', the songs matching it are ordered by relevance instead and at most 'limit'
+        (by default RANKED_LIMIT) of them are returned.
+
+            - data: dict - the validated search criteria
+
+        Returns: tuple[str, tuple] - the query and its parameters
+        """
+        where_condition, params = [], []
+        for condition in [
+            Search.search_by_metadata(data),
+            Search.search_by_artists(data["artists"]),
+            Search.search_by_tags(data["tags"]),
+        ]:
+            if condition is not None:
+                where_condition.append(condition[0])
+                params.extend(condition[1])
+
+        if data.get("after") is not None:
+            where_condition.append('"Song".id > %s')
+            params.append(data["after"])
+
+        limit = data.get("limit")
+        order = '"Song".id'
+        if data.get("query"):
+            where_condition.append(
+                "\"Song\".searchVector @@ websearch_to_tsquery('simple', %s)"
+            )
+            params.append(data["query"])
+            order = "ts_rank_cd(\"Song\".searchVector, websearch_to_tsquery('simple', %s)) DESC, \"Song\".id"
+            limit = Search.RANKED_LIMIT if limit is None else limit
+
+        query = Search.SELECT
+        if where_condition:
+            query += " WHERE {}".format(" AND ".join(where_condition))
+        query += f" ORDER BY {order}"
+        if data.get("query"):
+            params.append(data["query"])
+
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
 
-        return data
+        return query, tuple(params)
 
     @staticmethod
-    def search_by_artists(artists: list[str], repository: Repository) -> set[int]:
+    def search_by_artists(artists: list[str]) -> tuple[str, list]:
         """
-        Searches for the songs which have ALL the artists from the 'artists' list.
+        Builds the condition matching the songs which have ALL the artists from the 'artists' list.
         Due to pattern matching, an 'artist' can be only a substring of the actual artist name.
 
             - artists: list[str] - the list of artists to search for
-            - repository: Repository - the repository object
 
-        Returns: set[int] | None - the set of ids of the songs found or None if the 'artists' list is empty
+        Returns: tuple[str, list] | None - the condition and its parameters or None if the 'artists' list is empty
         """
 
         if not artists:
             return None
 
-        condition = [f"'%{artist.lower()}%'" for artist in artists]
-        search_condition = ",".join(condition)
-        query = 'SELECT "Song".id from "Song" \
-            join "SongArtist" on "Song".id = "SongArtist".songid \
+        patterns = [f"%{artist.lower()}%" for artist in artists]
+        condition = '"Song".id IN (SELECT "SongArtist".songid from "SongArtist" \
             join "Artist" on "SongArtist".artistid = "Artist".id \
-            WHERE LOWER("Artist".name) LIKE ANY(ARRAY[{}]) GROUP BY "Song".id HAVING COUNT(DISTINCT "Artist".id) = {}'.format(
-            search_condition, len(artists)
-        )
+            WHERE LOWER("Artist".name) LIKE ANY(%s) GROUP BY "SongArtist".songid HAVING COUNT(DISTINCT "Artist".id) = %s)'
 
-        result = repository.execute(query, Repository.QUERY)
-        if not result:
-            return set()
-        else:
-            return set([item[0] for item in result])
+        return condition, [patterns, len(artists)]
 
     @staticmethod
-    def search_by_tags(tags: list[str], repository: Repository) -> set[int]:
+    def search_by_tags(tags: list[str]) -> tuple[str, list]:
         """
-        Searches for the songs which have ALL the tags from the 'tags' list.
+        Builds the condition matching the songs which have ALL the tags from the 'tags' list.
 
             - tags: list[str] - the list of tags to search for
-            - repository: Repository - the repository object
 
-        Returns: set[int] | None - the set of ids of the songs found or None if the 'tags' list is empty
+        Returns: tuple[str, list] | None - the condition and its parameters or None if the 'tags' list is empty
         """
 
         if not tags:
             return None
 
-        condition = [f"'%{tag.lower()}%'" for tag in tags]
-        search_condition = ",".join(condition)
-        query = 'SELECT "Song".id from "Song" \
-            join "SongTag" on "Song".id = "SongTag".songid \
+        patterns = [f"%{tag.lower()}%" for tag in tags]
+        condition = '"Song".id IN (SELECT "SongTag".songid from "SongTag" \
             join "Tag" on "SongTag".tagid = "Tag".id \
-            WHERE LOWER("Tag".name) LIKE ANY (ARRAY[{}]) GROUP BY "Song".id HAVING COUNT(DISTINCT "Tag".id) = {}'.format(
-            search_condition, len(tags)
-        )
-
-        result = repository.execute(query, Repository.QUERY)
-        if not result:
-            return set()
+            WHERE LOWER("Tag".name) LIKE ANY (%s) GROUP BY "SongTag".songid HAVING COUNT(DISTINCT "Tag".id) = %s)'
 
-        return set([item[0] for item in result])
+        return condition, [patterns, len(tags)]
 
     @staticmethod
-    def search_by_metadata(metadata: dict, repository: Repository) -> set[int]:
+    def search_by_metadata(metadata: dict) -> tuple[str, list]:
         """
-        Searches for the songs which have the metadata from the 'metadata' dictionary.
+        Builds the condition matching the songs which have the metadata from the 'metadata' dictionary.
 
             - metadata: dict - the dictionary containing the metadata to search for
-            - repository: Repository - the repository object
 
-        Returns: set[int] | None - the set of ids of the songs found or None if the 'metadata' dictionary does not
+        Returns: tuple[str, list] | None - the condition and its parameters or None if the 'metadata' dictionary does not
         contain the keys 'name', 'format' and 'releaseDate'
         """
         if (
@@ -119,33 +233,23 @@ class Search:
         ):
             return None
 
-        where_condition = []
+        where_condition, params = [], []
         if metadata["name"]:
-            where_condition.append(
-                f'LOWER("Song".name) LIKE \'%{metadata["name"].lower()}%\''
-            )
+            where_condition.append('LOWER("Song".name) LIKE %s')
+            params.append(f'%{metadata["name"].lower()}%')
 
         if metadata["format"]:
-            where_condition.append(
-                f'LOWER("Song".format) LIKE \'%{metadata["format"].lower()}%\''
-            )
+            where_condition.append('LOWER("Song".format) LIKE %s')
+            params.append(f'%{metadata["format"].lower()}%')
 
         if metadata["releaseDate"]:
             if len(metadata["releaseDate"]) == 1:
-                where_condition.append(
-                    f'"Song".releaseDate = \'{metadata["releaseDate"][0]}\''
-                )
+                where_condition.append('"Song".releaseDate = %s')
             else:
-                where_condition.append(
-                    f'"Song".releaseDate BETWEEN \'{metadata["releaseDate"][0]}\' AND \'{metadata["releaseDate"][1]}\''
-                )
-
-        query = 'SELECT id from "Song" WHERE {}'.format(" AND ".join(where_condition))
-        result = repository.execute(query, Repository.QUERY)
-        if not result:
-            return set()
+                where_condition.append('"Song".releaseDate BETWEEN %s AND %s')
+            params.extend(metadata["releaseDate"])
 
-        return set([item[0] for item in result])
+        return " AND ".join(where_condition), params
 
     @staticmethod
     def help() -> str:
@@ -9,7 +9,7 @@ class Update:
     @staticmethod
     def serve(jsonPath: str, repository: Repository) -> None:
         """
-        Serves the update command, defining the logic behind it.
+        Serves the update command, defining the logic behind it, in one transaction.
 
             - jsonPath: str - the path to update options json file
             - repository: Repository - the repository object
@@ -18,16 +18,28 @@ class Update:
         """
         data = Validator.validate_update(jsonPath)
 
-        query = 'SELECT 1 FROM "Song" WHERE id = {}'.format(data["id"])
-        if not repository.execute(query, Repository.QUERY):
-            raise ValueError(f"Song with id {data['id']} does not exist.")
+        with repository.transaction():
+            if not repository.run("song_exists", (data["id"],), Repository.QUERY):
+                raise ValueError(f"Song with id {data['id']} does not exist.")
 
-        repository.update_song(data["id"], data)
-        for artist in data["newArtists"]:
-            repository.create_song_artist(data["id"], artist)
+            repository.update_song(data["id"], data)
+            artists_id = repository.resolve_artists(data["newArtists"])
+            tags_id = repository.resolve_tags(data["newTags"])
+            repository.create_song_artists(data["id"], artists_id)
+            repository.create_song_tags(data["id"], tags_id)
 
-        for tag in data["newTags"]:
-            repository.create_song_tag(data["id"], tag)
+            if repository.catalog is not None:
+                repository.on_commit(lambda: Update._update_catalog(repository.catalog, data, artists_id, tags_id))
+
+    @staticmethod
+    def _update_catalog(catalog, data: dict, artists_id: list[int], tags_id: list[int]) -> None:
+        """Applies a committed update to the in-memory catalog."""
+        catalog.update_song(data["id"], data["newName"], data["newReleaseDate"], data["newFormat"])
+        catalog.add_relations(
+            data["id"],
+            dict(zip(artists_id, dict.fromkeys(data["newArtists"]))),
+            dict(zip(tags_id, dict.fromkeys(data["newTags"]))),
+        )
 
     @staticmethod
     def help() -> str:
@@ -1,28 +1,240 @@
 """The start point of the application which will handle the user input and will call the handler to execute the commands."""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import AsyncIterator
 
 from tools.handler import Handler
 from tools.logger import Logger
+from tools.engine import Engine
 
-handler = Handler(
-    "/Users/razvanchichirau/Desktop/Programare-in-Python/SongStorage/appsettings.json"
-)
-try:
-    handler.start()
-    print(handler.help() + "\n")
-    cmd = input(">>> ").strip()
+
+async def read_command(prompt: str = "") -> str:
+    """Reads a line from the console without blocking the event loop. The end of the input means 'exit'."""
+    try:
+        return (await asyncio.to_thread(input, prompt)).strip()
+    except EOFError:
+        return "exit"
+
+
+async def repl(handler: Handler) -> None:
+    """
+    Reads the commands of the user and runs them on the engine. A command is accepted while the previous ones are
+    still running and its result is printed as soon as it completes.
+
+        - handler: Handler - the started handler
+
+    Returns: None
+    """
+    engine = Engine(handler)
+    cmd = await read_command(">>> ")
     while cmd != "exit":
         if cmd == "help":
             print(handler.help() + "\n")
+        elif cmd == "cache":
+            print(handler.cache_stats() + "\n")
+        elif cmd == "stats":
+            print(handler.stats() + "\n")
+        elif "&&" in cmd:
+            parts = list(filter(None, (item.strip() for item in cmd.split("&&"))))
+            checked = [handler.valid_command(part) for part in parts]
+            if all(is_valid for is_valid, _ in checked):
+                commands = [data for _, data in checked]
+                exclusive = any(command.lower() in Engine.EXCLUSIVE for command, _ in commands)
+                task = engine.spawn(engine.call(handler.handle_atomic, commands, exclusive=exclusive))
+                if exclusive:
+                    await task
+            else:
+                print(f"Unknown command received ({cmd}), nothing was executed")
         else:
-            is_valid, data = handler.valid_command(cmd)
-            handler.handle(*data) if is_valid else print(
-                f"Unknown command received ({cmd})"
-            )
-        cmd = input(">>> ").strip()
-except Exception as err:
-    handler.put_log(str(err).strip(), Logger.CRITICAL)
-    print("A critical error occurred. Please check the logs.")
-    exit(1)
-finally:
-    print("Closing application...")
-    handler.stop()
+            for part in filter(None, (item.strip() for item in cmd.split(";"))):
+                is_valid, data = handler.valid_command(part)
+                if not is_valid:
+                    print(f"Unknown command received ({part})")
+                    continue
+                task = engine.submit(*data)
+                if data[0].lower() in Engine.EXCLUSIVE:
+                    # archive and play read from the console, so the next command is read once they're done
+                    await task
+        cmd = await read_command(">>> ")
+    await engine.drain()
+
+
+async def read_script(script) -> AsyncIterator[tuple[int, str]]:
+    """
+    Reads the commands of a script, one per line, without blocking the event loop.
+    Empty lines and lines starting with '#' are skipped.
+
+        - script: file - the script file or stdin
+
+    Returns: AsyncIterator[tuple[int, str]] - the line number and the command of every line
+    """
+    number = 0
+    while line := await asyncio.to_thread(script.readline):
+        number += 1
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield number, line
+
+
+def write_result(record: dict, results=None) -> None:
+    """Prints the result of a script command as a JSON line, on stdout or to the 'results' file."""
+    print(json.dumps(record, default=str), file=results, flush=True)
+
+
+async def run_script(handler: Handler, script, concurrency: int = None, results=None) -> bool:
+    """
+    Runs the commands of a script pipelined: the next lines are read and started while the previous commands run,
+    at most 'concurrency' at once, and the result of every command is printed as a JSON line as soon as it completes.
+
+        - handler: Handler - the started handler
+        - script: file - the script file or stdin
+        - concurrency: int - the maximum number of commands running at once (optional, the pool size by default)
+        - results: file - the file the results are written to (optional, stdout by default)
+
+    Returns: bool - True if every command succeeded, False otherwise
+    """
+    engine = Engine(handler, concurrency)
+    succeeded = True
+
+    async def run(number: int, line: str) -> None:
+        nonlocal succeeded
+        record = {"line": number, "input": line}
+        started = time.perf_counter()
+        is_valid, data = handler.valid_command(line)
+        try:
+            if not is_valid:
+                raise ValueError(f"Unknown command received ({line})")
+            exclusive = data[0].lower() in Engine.EXCLUSIVE
+            record["result"] = await engine.call(handler.execute, *data, exclusive=exclusive)
+            record["status"] = "ok"
+        except Exception as err:
+            record["status"] = "error"
+            record["error"] = str(err).strip()
+            succeeded = False
+        record["seconds"] = round(time.perf_counter() - started, 6)
+        write_result(record, results)
+
+    pending = set()
+    async for number, line in read_script(script):
+        if len(pending) >= engine.concurrency:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        pending.add(engine.spawn(run(number, line)))
+    await engine.drain()
+    return succeeded
+
+
+async def run_script_atomic(handler: Handler, script, results=None) -> bool:
+    """
+    Runs the commands of a script one after the other in a single transaction and prints their results as JSON
+    lines: if a command fails, none of them is committed. Nothing is executed if a line isn't a valid command.
+
+        - handler: Handler - the started handler
+        - script: file - the script file or stdin
+        - results: file - the file the results are written to (optional, stdout by default)
+
+    Returns: bool - True if every command succeeded and was committed, False otherwise
+    """
+    lines = [item async for item in read_script(script)]
+    checked = [handler.valid_command(line) for _, line in lines]
+    if all(is_valid for is_valid, _ in checked):
+        engine = Engine(handler, 1)
+        exclusive = any(data[0].lower() in Engine.EXCLUSIVE for _, data in checked)
+        outcomes = await engine.call(handler.execute_atomic, [data for _, data in checked], exclusive=exclusive)
+    else:
+        outcomes = [
+            ("skipped", None) if is_valid else ("error", f"Unknown command received ({line})")
+            for (_, line), (is_valid, _) in zip(lines, checked)
+        ]
+
+    for (number, line), (status, result) in zip(lines, outcomes):
+        record = {"line": number, "input": line, "status": status}
+        if status == "error":
+            record["error"] = result
+        elif status == "ok":
+            record["result"] = result
+        write_result(record, results)
+    return all(status == "ok" for status, _ in outcomes)
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Song storage. Without --script, the commands are read interactively from the console."
+    )
+    parser.add_argument(
+        "--settings",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "appsettings.json"),
+        help="the path to the appsettings.json file (default: appsettings.json next to main.py)",
+    )
+    parser.add_argument(
+        "--script",
+        help="runs the commands of a file ('-' for stdin), one per line, and prints their results as JSON lines",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="the maximum number of script commands running at once (default: the pool size)",
+    )
+    parser.add_argument(
+        "--results",
+        help="writes the JSON results of the script to a file instead of stdout, so archives can be streamed to stdout",
+    )
+    parser.add_argument(
+        "--transaction",
+        action="store_true",
+        help="runs the script commands one after the other in a single transaction",
+    )
+    args = parser.parse_args(argv)
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.script is None and (args.concurrency is not None or args.transaction or args.results is not None):
+        parser.error("--concurrency, --transaction and --results require --script")
+    return args
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Starts the application, runs the console or the script and stops the application.
+
+        - argv: list[str] - the command line arguments (optional, sys.argv by default)
+
+    Returns: int - the exit code
+    """
+    args = parse_args(argv)
+    # in script mode the standard output only carries the JSON results, or the archives streamed with --results
+    messages = sys.stderr if args.script is not None else sys.stdout
+    handler = Handler(args.settings)
+    try:
+        handler.start()
+        if args.script is None:
+            print(handler.help() + "\n")
+            asyncio.run(repl(handler))
+            return 0
+        if args.results is not None:
+            # the results go to a file, so stdout is free for the archives with the output '-'
+            handler.stdout = sys.stdout.buffer
+        with (
+            open(args.script, "r") if args.script != "-" else sys.stdin as script,
+            open(args.results, "w") if args.results is not None else contextlib.nullcontext() as results,
+        ):
+            if args.transaction:
+                succeeded = asyncio.run(run_script_atomic(handler, script, results))
+            else:
+                succeeded = asyncio.run(run_script(handler, script, args.concurrency, results))
+        return 0 if succeeded else 1
+    except Exception as err:
+        handler.put_log(str(err).strip(), Logger.CRITICAL)
+        print("A critical error occurred. Please check the logs.", file=messages)
+        return 2
+    finally:
+        print("Closing application...", file=messages)
+        handler.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Tests of the import command, with an in-memory stand-in for the repository."""
+import json
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+import psycopg2
+from commands.importer import Import
+from tools.ingest import Ingest
+
+
+class MemoryRepository:
+    """Keeps the inserted songs in a list, with the transaction callbacks of Repository."""
+
+    def __init__(self, reject=None):
+        self.songs = []
+        self.reject = reject
+        self._transaction = None
+
+    @contextmanager
+    def transaction(self):
+        transaction = self._transaction = {"commit": [], "rollback": [], "songs": []}
+        try:
+            yield
+        except BaseException:
+            for callback in reversed(transaction["rollback"]):
+                callback()
+            raise
+        finally:
+            self._transaction = None
+        self.songs.extend(transaction["songs"])
+        for callback in transaction["commit"]:
+            callback()
+
+    def on_commit(self, callback):
+        self._transaction["commit"].append(callback)
+
+    def on_rollback(self, callback):
+        self._transaction["rollback"].append(callback)
+
+    def insert_songs(self, songs):
+        if self.reject is not None and any(self.reject(song) for song in songs):
+            raise psycopg2.DataError("value rejected")
+        self._transaction["songs"].extend(songs)
+        return list(range(len(songs)))
+
+    def tracked_filepaths(self, file_paths):
+        return {song[0] for song in self.songs if song[0] in file_paths}
+
+    def songs_by_filepath(self, file_paths):
+        return [tuple(song[:4]) for song in self.songs if song[0] in file_paths]
+
+
+class FailingIngest(Ingest):
+    """Fails to place the files whose name is in 'failing'."""
+
+    def __init__(self, failing, **kwargs):
+        super().__init__(**kwargs)
+        self.failing = failing
+
+    def place(self, source, destination):
+        if os.path.basename(source) in self.failing:
+            raise OSError(f"Can't read {source}")
+        return super().place(source, destination)
+
+
+class ImportTest(unittest.TestCase):
+    SETTINGS = {"batchSize": 10, "workers": 2}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source")
+        self.storage = os.path.join(self.directory.name, "storage")
+        os.mkdir(self.source)
+        os.mkdir(self.storage)
+        self.messages = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_songs(self, *names):
+        for name in names:
+            with open(os.path.join(self.source, name), "wb") as file:
+                file.write(name.encode() * 100)
+
+    def serve(self, repository, ingest, resume=False):
+        options = os.path.join(self.directory.name, "import.json")
+        with open(options, "w") as file:
+            json.dump({"source": self.source, "tags": [], "resume": resume}, file)
+        return Import.serve(options, repository, self.storage, self.SETTINGS, self.messages.append, ingest)
+
+    def test_resume_replaces_pending_leftovers_with_hardlinks(self):
+        self.write_songs("a-one.wav", "a-two.wav", "a-three.wav")
+        repository = MemoryRepository()
+        # the batch was interrupted after linking two files, one of which was inserted
+        for name in ("a-one.wav", "a-two.wav"):
+            os.link(os.path.join(self.source, name), os.path.join(self.storage, name))
+        repository.songs.append((os.path.join(self.storage, "a-one.wav"), "one", "2024-01-01", "wav", ["a"], [], None))
+        with open(os.path.join(self.storage, Import.CHECKPOINT), "w") as file:
+            json.dump({"source": self.source, "next": 0, "pending": ["a-one.wav", "a-two.wav", "a-three.wav"]}, file)
+
+        summary = self.serve(repository, Ingest("hardlink"), resume=True)
+
+        self.assertEqual(summary, {"imported": 2, "skipped": 1, "failed": 0})
+        for name in ("a-one.wav", "a-two.wav", "a-three.wav"):
+            self.assertTrue(os.path.samefile(os.path.join(self.source, name), os.path.join(self.storage, name)))
+        self.assertFalse(os.path.exists(os.path.join(self.storage, Import.CHECKPOINT)))
+
+    def test_rejected_batch_retries_only_the_placed_songs(self):
+        self.write_songs("a-good.wav", "a-bad.wav", "a-unreadable.wav")
+        repository = MemoryRepository(reject=lambda song: song[1] == "bad")
+
+        summary = self.serve(repository, FailingIngest({"a-unreadable.wav"}))
+
+        self.assertEqual(summary, {"imported": 1, "skipped": 0, "failed": 2})
+        self.assertEqual([song[1] for song in repository.songs], ["good"])
+        self.assertEqual(len([message for message in self.messages if "a-unreadable.wav" in message]), 1)
+        self.assertEqual(sorted(os.listdir(self.storage)), ["a-good.wav"])
+
+
+if __name__ == "__main__":
+    unittest.main()
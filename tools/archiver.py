@@ -0,0 +1,577 @@
+"""Module responsible for writing and reading the archives of songs."""
+import io
+import json
+import os
+import shutil
+import struct
+import tarfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Archiver:
+    """
+    Writes archives of files as a stream, so the output can be a file, a pipe or stdout.
+
+    ZIP archives are written with ZIP64 extensions when an entry, the archive or the number of entries outgrows the
+    classic format. Every file is read in chunks of 'chunk_size' bytes which are compressed in parallel on 'workers'
+    threads and written in order; each chunk is primed with the end of the previous one, so the ratio is close to a
+    single-threaded compression. At most two chunks per worker are in flight, so the memory used doesn't depend on
+    the size of the files. The formats listed in 'store' (already compressed, e.g. mp3) are stored as they are, the
+    other ones are compressed with 'compression' (deflate, or zstd which fewer unzip tools can read).
+
+    TAR.ZST archives are compressed as a whole by zstd, on 'workers' threads.
+
+    An archive can start with a manifest, a JSON entry describing its content, which read_manifest() reads back
+    without going through the rest of the archive.
+    """
+
+    FORMATS = ("zip",) + (("tar.zst",) if zstandard is not None else ())
+    COMPRESSIONS = ("deflate",) + (("zstd",) if zstandard is not None else ())
+    EXTENSIONS = {"zip": ".zip", "tar.zst": ".tar.zst"}
+
+    STORED = 0
+    DEFLATED = 8
+    ZSTD = 93
+    METHODS = {"deflate": DEFLATED, "zstd": ZSTD}
+    WINDOW = 32768
+    MANIFEST = "manifest.json"
+    MAGIC = {b"PK\x03\x04": "zip", b"\x28\xb5\x2f\xfd": "tar.zst"}
+
+    def __init__(
+        self,
+        format: str = "zip",
+        compression: str = "deflate",
+        store: list[str] = ("mp3",),
+        level: int = 6,
+        workers: int = 0,
+        chunk_size: int = 1 << 20,
+        log=None,
+    ):
+        """
+        Initializes the Archiver class.
+
+            - format: str - 'zip' or 'tar.zst' (optional)
+            - compression: str - the compression of the ZIP entries which aren't stored: 'deflate' or 'zstd' (optional)
+            - store: list[str] - the file formats stored without compression in ZIP archives (optional)
+            - level: int - the compression level (optional)
+            - workers: int - the number of compression threads, 0 for one per CPU (optional)
+            - chunk_size: int - the number of bytes read and compressed at once (optional)
+            - log: callable - receives a message with the throughput of every archive (optional)
+
+        Returns: None
+        """
+        if format not in Archiver.FORMATS:
+            raise ValueError(f"Unknown or unavailable archive format ({format})")
+        if compression not in Archiver.COMPRESSIONS:
+            raise ValueError(f"Unknown or unavailable archive compression ({compression})")
+        self.format = format
+        self.compression = compression
+        self.store = {extension.lower() for extension in store}
+        self.level = level
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._log = log
+        self._lock = threading.Lock()
+        self._stats = {"archives": 0, "entries": 0, "bytes": 0, "written": 0, "seconds": 0.0}
+
+    @property
+    def extension(self) -> str:
+        """The extension of the archives written, with its leading dot."""
+        return Archiver.EXTENSIONS[self.format]
+
+    def create(self, entries: list[tuple[str, str]], path: str, manifest: dict = None) -> dict:
+        """
+        Writes an archive to a file. The file is removed if the archive can't be completed, unless it existed before
+        (e.g. a named pipe or a device).
+
+            - entries: list[tuple[str, str]] - the (path, name inside the archive) of the files to archive
+            - path: str - the path of the archive
+            - manifest: dict - written as the first entry of the archive, in JSON (optional)
+
+        Returns: dict - the statistics of the archive, see write()
+        """
+        created = not os.path.exists(path)
+        try:
+            with open(path, "wb") as output:
+                return self.write(entries, output, os.path.basename(path), manifest)
+        except BaseException:
+            if created and os.path.isfile(path):
+                os.remove(path)
+            raise
+
+    def write(self, entries: list[tuple[str, str]], output, name: str = "archive", manifest: dict = None) -> dict:
+        """
+        Writes an archive to a binary stream, which doesn't need to be seekable.
+
+            - entries: list[tuple[str, str]] - the (path, name inside the archive) of the files to archive
+            - output: BinaryIO - the stream the archive is written to
+            - name: str - the name of the archive in the log message (optional)
+            - manifest: dict - written as the first entry of the archive, in JSON (optional)
+
+        Returns: dict - the number of 'entries', the 'bytes' read, the bytes 'written' and the 'seconds' taken
+        """
+        started = time.perf_counter()
+        counter = _CountingWriter(output)
+        data = json.dumps(manifest).encode("utf-8") if manifest is not None else None
+        if self.format == "zip":
+            read = self._write_zip(entries, counter, data)
+        else:
+            read = self._write_tar(entries, counter, data)
+        counter.flush()
+        stats = {
+            "entries": len(entries),
+            "bytes": read,
+            "written": counter.written,
+            "seconds": time.perf_counter() - started,
+        }
+        with self._lock:
+            self._stats["archives"] += 1
+            for key, value in stats.items():
+                self._stats[key] += value
+        if self._log is not None:
+            self._log(
+                "Archive {}: {} file(s), {:.1f} MiB -> {:.1f} MiB in {:.3f}s ({:.1f} MiB/s).".format(
+                    name,
+                    stats["entries"],
+                    stats["bytes"] / 2**20,
+                    stats["written"] / 2**20,
+                    stats["seconds"],
+                    stats["bytes"] / 2**20 / max(stats["seconds"], 1e-9),
+                )
+            )
+        return stats
+
+    def stats(self) -> dict:
+        """Returns how many archives, files and bytes were written and how long it took."""
+        with self._lock:
+            return dict(self._stats)
+
+    def method(self, path: str) -> int:
+        """Returns the ZIP compression method of a file, from its extension."""
+        extension = os.path.splitext(path)[1][1:].lower()
+        return Archiver.STORED if extension in self.store else Archiver.METHODS[self.compression]
+
+    def _write_zip(self, entries: list[tuple[str, str]], output, manifest: bytes = None) -> int:
+        """
+        Writes the entries as a ZIP archive. The chunks are read and checksummed on the calling thread, compressed on
+        the pool and written in order once the window of chunks in flight is full.
+
+            - entries: list[tuple[str, str]] - the (path, name inside the archive) of the files
+            - output: _CountingWriter - the stream the archive is written to
+            - manifest: bytes - the manifest, deflated so that any unzip tool can read it (optional)
+
+        Returns: int - the number of bytes read
+        """
+        archive = ZipStream(output)
+        pending, window, read = deque(), 2 * self.workers, 0
+
+        if manifest is not None:
+            entry = ZipEntry(Archiver.MANIFEST, Archiver.DEFLATED, len(manifest), time.time(), 0o100644)
+            entry.crc, entry.size = zlib.crc32(manifest), len(manifest)
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            data = compressor.compress(manifest) + compressor.flush()
+            pending.extend((("header", entry, None), ("data", entry, data), ("end", entry, None)))
+
+        def flush(limit: int) -> None:
+            while len(pending) > limit:
+                kind, entry, item = pending.popleft()
+                if kind == "header":
+                    archive.start(entry)
+                elif kind == "data":
+                    archive.data(entry, item if isinstance(item, bytes) else item.result())
+                else:
+                    archive.finish(entry)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="archive") as pool:
+            for path, arcname in entries:
+                with open(path, "rb") as file:
+                    stat = os.fstat(file.fileno())
+                    entry = ZipEntry(arcname, self.method(path), stat.st_size, stat.st_mtime, stat.st_mode)
+                    pending.append(("header", entry, None))
+                    dictionary = b""
+                    chunk = file.read(self.chunk_size)
+                    while True:
+                        following = file.read(self.chunk_size) if chunk else b""
+                        last = not following
+                        entry.crc = zlib.crc32(chunk, entry.crc)
+                        entry.size += len(chunk)
+                        if entry.method == Archiver.STORED:
+                            pending.append(("data", entry, chunk))
+                        else:
+                            future = pool.submit(self._compress, entry.method, chunk, dictionary, last)
+                            pending.append(("data", entry, future))
+                            if len(chunk) < Archiver.WINDOW:
+                                chunk = dictionary + chunk
+                            dictionary = chunk[-Archiver.WINDOW :]
+                        flush(window)
+                        if last:
+                            break
+                        chunk = following
+                read += entry.size
+                pending.append(("end", entry, None))
+            flush(0)
+        archive.close()
+        return read
+
+    def _compress(self, method: int, chunk: bytes, dictionary: bytes, last: bool) -> bytes:
+        """
+        Compresses a chunk of a file so that the compressed chunks of the file can be concatenated.
+
+            - method: int - DEFLATED or ZSTD
+            - chunk: bytes - the chunk
+            - dictionary: bytes - the end of the previous chunk, which the chunk can refer to (deflate only)
+            - last: bool - whether the chunk is the last one of the file
+
+        Returns: bytes - the compressed chunk
+        """
+        if method == Archiver.ZSTD:
+            # every chunk is a zstd frame, and a sequence of frames decompresses to their concatenation
+            return zstandard.ZstdCompressor(level=self.level).compress(chunk)
+        if dictionary:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        # a sync flush ends the chunk on a byte boundary without ending the deflate stream, the last one ends it
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def _write_tar(self, entries: list[tuple[str, str]], output, manifest: bytes = None) -> int:
+        """
+        Writes the entries as a TAR archive compressed by zstd on the worker threads.
+
+            - entries: list[tuple[str, str]] - the (path, name inside the archive) of the files
+            - output: _CountingWriter - the stream the archive is written to
+            - manifest: bytes - the manifest (optional)
+
+        Returns: int - the number of bytes read
+        """
+        compressor = zstandard.ZstdCompressor(level=self.level, threads=self.workers)
+        read = 0
+        with compressor.stream_writer(output, closefd=False) as stream:
+            with tarfile.open(fileobj=stream, mode="w|", bufsize=self.chunk_size) as archive:
+                if manifest is not None:
+                    info = tarfile.TarInfo(Archiver.MANIFEST)
+                    info.size, info.mtime, info.mode = len(manifest), time.time(), 0o644
+                    archive.addfile(info, io.BytesIO(manifest))
+                for path, arcname in entries:
+                    info = archive.gettarinfo(path, arcname)
+                    with open(path, "rb") as file:
+                        archive.addfile(info, file)
+                    read += info.size
+        return read
+
+    @staticmethod
+    def detect(path: str) -> str:
+        """
+        Detects the format of an archive from its first bytes.
+
+            - path: str - the path of the archive
+
+        Returns: str - 'zip' or 'tar.zst', raises an exception if the file is neither
+        """
+        with open(path, "rb") as file:
+            format = Archiver.MAGIC.get(file.read(4))
+        if format is None:
+            raise ValueError(f"{path} isn't a zip or tar.zst archive.")
+        if format == "tar.zst" and zstandard is None:
+            raise ValueError(f"Reading {path} requires the zstandard package.")
+        return format
+
+    @staticmethod
+    def read_manifest(path: str) -> dict:
+        """
+        Reads the manifest of an archive, without reading the rest of it.
+
+            - path: str - the path of the archive
+
+        Returns: dict - the manifest, raises an exception if the archive has none
+        """
+        if Archiver.detect(path) == "zip":
+            with ZipFile(path) as archive:
+                if Archiver.MANIFEST not in archive.namelist():
+                    raise ValueError(f"Archive {path} has no manifest.")
+                data = archive.read(Archiver.MANIFEST)
+        else:
+            with open(path, "rb") as file, Archiver._read_tar(file) as archive:
+                member = archive.next()
+                if member is None or member.name != Archiver.MANIFEST:
+                    raise ValueError(f"Archive {path} has no manifest.")
+                data = archive.extractfile(member).read()
+        return json.loads(data)
+
+    @staticmethod
+    def extract(path: str, targets: dict[str, str]) -> int:
+        """
+        Extracts entries of an archive. Every file is written next to its destination and renamed once complete,
+        so an interrupted extraction never leaves a truncated file at a destination.
+
+            - path: str - the path of the archive
+            - targets: dict[str, str] - the destination of every entry to extract, by name
+
+        Returns: int - the number of bytes extracted, raises an exception if an entry is missing or corrupted
+        """
+        extracted, remaining = 0, dict(targets)
+        if Archiver.detect(path) == "zip":
+            with ZipFile(path) as archive, open(path, "rb") as raw:
+                for name, destination in targets.items():
+                    try:
+                        info = archive.getinfo(name)
+                    except KeyError:
+                        break
+                    if info.compress_type == Archiver.ZSTD:
+                        Archiver._save(destination, lambda target: Archiver._extract_zstd(raw, info, target))
+                    else:
+                        with archive.open(info) as source:
+                            Archiver._save(destination, lambda target: shutil.copyfileobj(source, target, 1 << 20))
+                    extracted += info.file_size
+                    del remaining[name]
+        else:
+            with open(path, "rb") as file, Archiver._read_tar(file) as archive:
+                for member in archive:
+                    if member.name not in remaining:
+                        continue
+                    destination = remaining.pop(member.name)
+                    with archive.extractfile(member) as source:
+                        Archiver._save(destination, lambda target: shutil.copyfileobj(source, target, 1 << 20))
+                    extracted += member.size
+                    if not remaining:
+                        break
+        if remaining:
+            raise ValueError(f"Archive {path} has no entry {next(iter(remaining))}.")
+        return extracted
+
+    @staticmethod
+    def _save(destination: str, copy) -> None:
+        """Writes a file next to its destination with 'copy' and renames it once complete, or removes it on error."""
+        partial = f"{destination}.part"
+        try:
+            with open(partial, "wb") as target:
+                copy(target)
+            os.replace(partial, destination)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    @staticmethod
+    def _read_tar(file) -> tarfile.TarFile:
+        """Opens a TAR.ZST archive for reading its members in order."""
+        reader = zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+        return tarfile.open(fileobj=reader, mode="r|")
+
+    @staticmethod
+    def _extract_zstd(raw, info, target) -> None:
+        """
+        Decompresses a zstd entry of a ZIP archive, which the zipfile module can't read, and checks its CRC.
+
+            - raw: BinaryIO - the archive file
+            - info: ZipInfo - the entry
+            - target: BinaryIO - the file the entry is extracted to
+
+        Returns: None
+        """
+        raw.seek(info.header_offset)
+        name_length, extra_length = struct.unpack("<HH", raw.read(30)[26:30])
+        raw.seek(info.header_offset + 30 + name_length + extra_length)
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            _Slice(raw, info.compress_size), read_across_frames=True
+        )
+        crc = 0
+        while chunk := reader.read(1 << 20):
+            crc = zlib.crc32(chunk, crc)
+            target.write(chunk)
+        if crc != info.CRC:
+            raise ValueError(f"Entry {info.filename} of the archive is corrupted.")
+
+
+class ZipEntry:
+    """An entry of a ZIP archive being written."""
+
+    def __init__(self, name: str, method: int, size: int, mtime: float, mode: int):
+        """
+        Initializes the ZipEntry class.
+
+            - name: str - the name of the entry
+            - method: int - the compression method
+            - size: int - the size of the file when it was opened, which decides if the entry needs ZIP64
+            - mtime: float - the modification time of the file
+            - mode: int - the permissions of the file
+
+        Returns: None
+        """
+        self.name = name.encode("utf-8")
+        self.utf8 = not name.isascii()
+        self.method = method
+        # the deflated size can be slightly larger than the file, so the entries close to the limit use ZIP64 too
+        self.zip64 = size >= 0xFFFFFFFF - (size >> 10) - 65536
+        self.mode = mode
+        year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+        if year < 1980:
+            year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+        self.dostime = hour << 11 | minute << 5 | second // 2
+        self.dosdate = (year - 1980) << 9 | month << 5 | day
+        self.crc = 0
+        self.size = 0
+        self.compressed = 0
+        self.offset = 0
+
+
+class ZipStream:
+    """Writes the records of a ZIP archive to a stream, with data descriptors since the sizes come after the data."""
+
+    LOCAL = struct.Struct("<IHHHHHIIIHH")
+    CENTRAL = struct.Struct("<IHHHHHHIIIHHHHHII")
+    END = struct.Struct("<IHHHHIIH")
+    END64 = struct.Struct("<IQHHIIQQQQ")
+    LOCATOR = struct.Struct("<IIQI")
+    LIMIT = 0xFFFFFFFF
+
+    def __init__(self, output):
+        """
+        Initializes the ZipStream class.
+
+            - output: _CountingWriter - the stream the archive is written to
+
+        Returns: None
+        """
+        self.output = output
+        self.entries = []
+
+    @staticmethod
+    def _version(entry: ZipEntry) -> int:
+        """Returns the version needed to extract an entry (6.3 for zstd, 4.5 for ZIP64, 2.0 otherwise)."""
+        if entry.method == Archiver.ZSTD:
+            return 63
+        return 45 if entry.zip64 else 20
+
+    @staticmethod
+    def _flags(entry: ZipEntry) -> int:
+        """Returns the flags of an entry: its sizes follow its data and, if needed, its name is UTF-8."""
+        return 0x08 | (0x800 if entry.utf8 else 0)
+
+    def start(self, entry: ZipEntry) -> None:
+        """Writes the local header of an entry."""
+        entry.offset = self.output.written
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if entry.zip64 else b""
+        size = ZipStream.LIMIT if entry.zip64 else 0
+        self.output.write(
+            ZipStream.LOCAL.pack(
+                0x04034B50,
+                ZipStream._version(entry),
+                ZipStream._flags(entry),
+                entry.method,
+                entry.dostime,
+                entry.dosdate,
+                0,
+                size,
+                size,
+                len(entry.name),
+                len(extra),
+            )
+            + entry.name
+            + extra
+        )
+
+    def data(self, entry: ZipEntry, data: bytes) -> None:
+        """Writes a chunk of the data of an entry."""
+        entry.compressed += len(data)
+        self.output.write(data)
+
+    def finish(self, entry: ZipEntry) -> None:
+        """Writes the data descriptor of an entry, once its data is written."""
+        if not entry.zip64 and (entry.compressed >= ZipStream.LIMIT or entry.size >= ZipStream.LIMIT):
+            raise ValueError(f"File {entry.name.decode()} grew past 4 GiB while it was archived.")
+        layout = "<IIQQ" if entry.zip64 else "<IIII"
+        self.output.write(struct.pack(layout, 0x08074B50, entry.crc, entry.compressed, entry.size))
+        self.entries.append(entry)
+
+    def close(self) -> None:
+        """Writes the central directory and the end records, in their ZIP64 form when needed."""
+        start = self.output.written
+        for entry in self.entries:
+            values, extra = [], b""
+            for value in (entry.size, entry.compressed, entry.offset):
+                if value >= ZipStream.LIMIT or entry.zip64:
+                    extra += struct.pack("<Q", value)
+                    values.append(ZipStream.LIMIT)
+                else:
+                    values.append(value)
+            version = ZipStream._version(entry)
+            if extra:
+                extra = struct.pack("<HH", 1, len(extra)) + extra
+                version = max(version, 45)
+            self.output.write(
+                ZipStream.CENTRAL.pack(
+                    0x02014B50,
+                    3 << 8 | version,
+                    version,
+                    ZipStream._flags(entry),
+                    entry.method,
+                    entry.dostime,
+                    entry.dosdate,
+                    entry.crc,
+                    values[1],
+                    values[0],
+                    len(entry.name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    (entry.mode & 0xFFFF) << 16,
+                    values[2],
+                )
+                + entry.name
+                + extra
+            )
+
+        end = self.output.written
+        count, size = len(self.entries), end - start
+        if count >= 0xFFFF or size >= ZipStream.LIMIT or start >= ZipStream.LIMIT:
+            self.output.write(ZipStream.END64.pack(0x06064B50, 44, 3 << 8 | 45, 45, 0, 0, count, count, size, start))
+            self.output.write(ZipStream.LOCATOR.pack(0x07064B50, 0, end, 1))
+            count, size, start = min(count, 0xFFFF), min(size, ZipStream.LIMIT), min(start, ZipStream.LIMIT)
+        self.output.write(ZipStream.END.pack(0x06054B50, 0, 0, count, count, size, start, 0))
+
+
+class _CountingWriter:
+    """Wraps a binary stream and counts the bytes written to it."""
+
+    def __init__(self, output):
+        """Initializes the _CountingWriter class."""
+        self.output = output
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        """Writes the data to the stream."""
+        self.output.write(data)
+        self.written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        """Flushes the stream."""
+        self.output.flush()
+
+
+class _Slice:
+    """Reads at most 'size' bytes of a binary stream."""
+
+    def __init__(self, source, size: int):
+        """Initializes the _Slice class."""
+        self.source = source
+        self.remaining = size
+
+    def read(self, size: int = -1) -> bytes:
+        """Reads up to 'size' bytes, all the remaining ones if 'size' is negative."""
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.source.read(size)
+        self.remaining -= len(data)
+        return data
@@ -0,0 +1,87 @@
+"""Module which provides the in-process caches used by the repository."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe mapping bounded to 'maxsize' entries which evicts the least recently used entry first.
+    Entries older than 'ttl' seconds are dropped when they are looked up.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        """
+        Initializes the LRUCache class.
+
+            - maxsize: int - the maximum number of entries kept (0 disables the cache)
+            - ttl: float - the number of seconds an entry stays valid (optional, entries never expire by default)
+
+        Returns: None
+        """
+        if maxsize < 0:
+            raise ValueError("maxsize can't be negative")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "clears": 0}
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for 'key' and marks it as recently used.
+
+            - key: any - the key to look up
+            - default: any - the value returned if the key is not cached (optional)
+
+        Returns: any - the cached value or 'default'
+        """
+        with self._lock:
+            if key not in self._data:
+                self._stats["misses"] += 1
+                return default
+
+            stored_at, value = self._data[key]
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """
+        Caches 'value' under 'key', evicting the least recently used entries if the cache is full.
+
+            - key: any - the key of the entry
+            - value: any - the value of the entry
+
+        Returns: None
+        """
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """Removes all the entries from the cache."""
+        with self._lock:
+            self._data.clear()
+            self._stats["clears"] += 1
+
+    def stats(self) -> dict:
+        """Returns the size of the cache and its hit, miss, eviction, expiration and clear counters."""
+        with self._lock:
+            return dict(self._stats, size=len(self._data), maxsize=self.maxsize)
+
+    def __len__(self) -> int:
+        """Returns the number of cached entries."""
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,380 @@
+"""Module responsible for the in-memory catalog which answers searches without querying the database."""
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import date
+
+
+class Catalog:
+    """
+    An in-memory copy of the Song, Artist, Tag, SongArtist and SongTag tables.
+
+    Songs are stored in columns (one array or list per field, indexed by row) and ordered by id. The artists and tags
+    are kept in inverted indexes mapping every artist/tag id to the rows which reference it. A search turns the rows of
+    the artists and tags matching its patterns into bitsets, intersects them and only looks at the songs left.
+    """
+
+    _NONZERO = re.compile(b"[^\x00]", re.DOTALL)
+
+    def __init__(self):
+        """Initializes an empty catalog."""
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """Removes all the songs, artists and tags from the catalog."""
+        self._ids = array("q")
+        self._rows = {}
+        self._paths = []
+        self._names = []
+        self._lower_names = []
+        self._dates = array("i")
+        self._formats = array("H")
+        self._format_values = []
+        self._song_artists = []
+        self._song_tags = []
+        self._alive = bytearray()
+
+        self._artists = {}
+        self._tags = {}
+        self._artist_rows = {}
+        self._tag_rows = {}
+
+    def load(self, repository) -> int:
+        """
+        Loads the whole catalog from the database, replacing the current content.
+
+            - repository: Repository - the repository object
+
+        Returns: int - the number of songs loaded
+        """
+        with self._lock:
+            self._reset()
+            for id, name in repository.stream('SELECT id, name FROM "Artist"'):
+                self._artists[id] = (name, name.lower())
+            for id, name in repository.stream('SELECT id, name FROM "Tag"'):
+                self._tags[id] = (name, name.lower())
+
+            query = 'SELECT id, filepath, name, releasedate, format FROM "Song" ORDER BY id'
+            for id, filePath, name, releaseDate, format in repository.stream(query):
+                self._append(id, filePath, name, releaseDate, format)
+
+            query = 'SELECT songid, artistid FROM "SongArtist" ORDER BY id'
+            for song_id, artist_id in repository.stream(query):
+                self._link(self._rows[song_id], artist_id, self._song_artists, self._artist_rows)
+            query = 'SELECT songid, tagid FROM "SongTag" ORDER BY id'
+            for song_id, tag_id in repository.stream(query):
+                self._link(self._rows[song_id], tag_id, self._song_tags, self._tag_rows)
+
+            return len(self._rows)
+
+    def add_song(
+        self,
+        song_id: int,
+        filePath: str,
+        name: str,
+        releaseDate,
+        format: str,
+        artists: dict,
+        tags: dict,
+    ) -> None:
+        """
+        Adds a song created in the database to the catalog.
+
+            - song_id: int - the id of the song
+            - filePath: str - the path of the song in the storage
+            - name: str - the name of the song
+            - releaseDate: str | date - the release date of the song
+            - format: str - the format of the song
+            - artists: dict - the artists of the song, as {id: name}
+            - tags: dict - the tags of the song, as {id: name}
+
+        Returns: None
+        """
+        with self._lock:
+            if song_id in self._rows:
+                self.remove_songs([song_id])
+            self._append(song_id, filePath, name, releaseDate, format)
+            self.add_relations(song_id, artists, tags)
+            if len(self._ids) > 1 and song_id < self._ids[-2]:
+                self._compact()
+
+    def update_song(self, song_id: int, name: str, releaseDate, format: str) -> None:
+        """
+        Updates the fields of a song. Empty values leave the field unchanged.
+
+            - song_id: int - the id of the song
+            - name: str - the new name of the song
+            - releaseDate: str | date - the new release date of the song
+            - format: str - the new format of the song
+
+        Returns: None
+        """
+        with self._lock:
+            row = self._rows.get(song_id)
+            if row is None:
+                return
+            if name:
+                self._names[row] = name
+                self._lower_names[row] = name.lower()
+            if releaseDate:
+                self._dates[row] = Catalog._to_date(releaseDate).toordinal()
+            if format:
+                self._formats[row] = self._format_index(format)
+
+    def move_song(self, song_id: int, filePath: str) -> None:
+        """
+        Changes the path of a song's file.
+
+            - song_id: int - the id of the song
+            - filePath: str - the new path of the song
+
+        Returns: None
+        """
+        with self._lock:
+            row = self._rows.get(song_id)
+            if row is not None:
+                self._paths[row] = filePath
+
+    def add_relations(self, song_id: int, artists: dict, tags: dict) -> None:
+        """
+        Links a song to artists and tags, ignoring the relations which already exist.
+
+            - song_id: int - the id of the song
+            - artists: dict - the artists to link, as {id: name}
+            - tags: dict - the tags to link, as {id: name}
+
+        Returns: None
+        """
+        with self._lock:
+            row = self._rows.get(song_id)
+            if row is None:
+                return
+            for id, name in artists.items():
+                self._artists.setdefault(id, (name, name.lower()))
+                self._link(row, id, self._song_artists, self._artist_rows)
+            for id, name in tags.items():
+                self._tags.setdefault(id, (name, name.lower()))
+                self._link(row, id, self._song_tags, self._tag_rows)
+
+    def remove_songs(self, song_ids: list[int]) -> None:
+        """
+        Removes songs from the catalog. Their rows are only marked as deleted and reclaimed by the next compaction.
+
+            - song_ids: list[int] - the ids of the songs
+
+        Returns: None
+        """
+        with self._lock:
+            for song_id in song_ids:
+                row = self._rows.pop(song_id, None)
+                if row is None:
+                    continue
+                self._alive[row >> 3] &= ~(1 << (row & 7))
+                for id in self._song_artists[row]:
+                    self._artist_rows[id].remove(row)
+                for id in self._song_tags[row]:
+                    self._tag_rows[id].remove(row)
+
+            if len(self._ids) > 1024 and len(self._rows) < len(self._ids) // 2:
+                self._compact()
+
+    def search(self, data: dict) -> list[tuple]:
+        """
+        Searches the catalog with the same semantics as the search command.
+
+            - data: dict - the validated search criteria
+
+        Returns: list[tuple] - the songs found, as (filePath, name, releaseDate, format, [artists], [tags], id), ordered by id
+        """
+        with self._lock:
+            candidates = int.from_bytes(self._alive, "little")
+            if data["artists"]:
+                artists = Catalog._matching(self._artists, data["artists"])
+                candidates &= self._bitset(self._artist_rows, artists)
+            if data["tags"]:
+                tags = Catalog._matching(self._tags, data["tags"])
+                candidates &= self._bitset(self._tag_rows, tags)
+
+            if data.get("after") is not None:
+                first = bisect_right(self._ids, data["after"])
+                candidates &= ~((1 << first) - 1)
+
+            name = Catalog._like(data["name"].lower()) if data["name"] else None
+            format = Catalog._like(data["format"].lower()) if data["format"] else None
+            dates = [Catalog._to_date(item).toordinal() for item in data["releaseDate"]]
+            limit = data.get("limit")
+
+            result = []
+            for row in Catalog._rows_of(candidates, len(self._alive)):
+                if limit is not None and len(result) >= limit:
+                    break
+                if name and not name(self._lower_names[row]):
+                    continue
+                if format and not format(self._format_values[self._formats[row]].lower()):
+                    continue
+                if dates and not dates[0] <= self._dates[row] <= dates[-1]:
+                    continue
+                if data["artists"] and not Catalog._count_matches(
+                    self._song_artists[row], artists, len(data["artists"])
+                ):
+                    continue
+                if data["tags"] and not Catalog._count_matches(
+                    self._song_tags[row], tags, len(data["tags"])
+                ):
+                    continue
+                result.append(self._song(row))
+
+            return result
+
+    def memory_usage(self) -> dict:
+        """Returns the number of songs, artists and tags in the catalog and an estimate of the bytes it uses."""
+        with self._lock:
+            columns = [self._ids, self._dates, self._formats, self._paths, self._names, self._lower_names]
+            size = sum(sys.getsizeof(column) for column in columns)
+            size += sum(sys.getsizeof(value) for value in self._paths)
+            size += sum(sys.getsizeof(value) for value in self._names)
+            size += sum(sys.getsizeof(value) for value in self._lower_names)
+            size += sum(sys.getsizeof(value) for value in self._song_artists)
+            size += sum(sys.getsizeof(value) for value in self._song_tags)
+            size += sys.getsizeof(self._rows) + sys.getsizeof(self._alive)
+            for names, index in ((self._artists, self._artist_rows), (self._tags, self._tag_rows)):
+                size += sys.getsizeof(names) + sys.getsizeof(index)
+                size += sum(sys.getsizeof(a) + sys.getsizeof(b) for a, b in names.values())
+                size += sum(sys.getsizeof(rows) for rows in index.values())
+
+            return {
+                "songs": len(self._rows),
+                "artists": len(self._artists),
+                "tags": len(self._tags),
+                "bytes": size,
+            }
+
+    def _append(self, song_id: int, filePath: str, name: str, releaseDate, format: str) -> None:
+        """Appends a song as the last row of the columns."""
+        row = len(self._ids)
+        self._ids.append(song_id)
+        self._rows[song_id] = row
+        self._paths.append(filePath)
+        self._names.append(name)
+        self._lower_names.append(name.lower())
+        self._dates.append(Catalog._to_date(releaseDate).toordinal())
+        self._formats.append(self._format_index(format))
+        self._song_artists.append(array("i"))
+        self._song_tags.append(array("i"))
+        if row >> 3 >= len(self._alive):
+            self._alive.append(0)
+        self._alive[row >> 3] |= 1 << (row & 7)
+
+    def _compact(self) -> None:
+        """Rebuilds the columns ordered by id, without the deleted rows."""
+        rows = sorted(self._rows.values(), key=lambda row: self._ids[row])
+        songs = [
+            (
+                self._ids[row],
+                self._paths[row],
+                self._names[row],
+                date.fromordinal(self._dates[row]),
+                self._format_values[self._formats[row]],
+                self._song_artists[row],
+                self._song_tags[row],
+            )
+            for row in rows
+        ]
+        artists, tags = self._artists, self._tags
+        self._reset()
+        self._artists, self._tags = artists, tags
+        for id, filePath, name, releaseDate, format, song_artists, song_tags in songs:
+            self._append(id, filePath, name, releaseDate, format)
+            row = self._rows[id]
+            for artist_id in song_artists:
+                self._link(row, artist_id, self._song_artists, self._artist_rows)
+            for tag_id in song_tags:
+                self._link(row, tag_id, self._song_tags, self._tag_rows)
+
+    def _format_index(self, format: str) -> int:
+        """Returns the index of an interned format value."""
+        if format not in self._format_values:
+            self._format_values.append(format)
+        return self._format_values.index(format)
+
+    def _song(self, row: int) -> tuple:
+        """Returns the search result tuple of a row."""
+        return (
+            self._paths[row],
+            self._names[row],
+            date.fromordinal(self._dates[row]),
+            self._format_values[self._formats[row]],
+            [self._artists[id][0] for id in self._song_artists[row]],
+            [self._tags[id][0] for id in self._song_tags[row]],
+            self._ids[row],
+        )
+
+    def _bitset(self, index: dict, ids: set[int]) -> int:
+        """Returns the bitset of the rows related to any of the ids."""
+        bitmap = bytearray(len(self._alive))
+        for id in ids:
+            for row in index.get(id, ()):
+                bitmap[row >> 3] |= 1 << (row & 7)
+        return int.from_bytes(bitmap, "little")
+
+    @staticmethod
+    def _link(row: int, id: int, relations: list, index: dict) -> None:
+        """Records the relation between a row and an artist/tag, in both directions."""
+        if id in relations[row]:
+            return
+        relations[row].append(id)
+        index.setdefault(id, array("i")).append(row)
+
+    @staticmethod
+    def _matching(names: dict, patterns: list[str]) -> set[int]:
+        """Returns the ids of the artists/tags whose lowercase name matches any of the patterns, like LIKE '%pattern%'."""
+        matchers = [Catalog._like(pattern.lower()) for pattern in patterns]
+        return {
+            id
+            for id, (_, lower) in names.items()
+            if any(matcher(lower) for matcher in matchers)
+        }
+
+    @staticmethod
+    def _count_matches(relations: array, matched: set[int], expected: int) -> bool:
+        """
+        Checks that a song has exactly 'expected' distinct matching artists/tags, mirroring the
+        HAVING COUNT(DISTINCT ...) = len(patterns) condition of the search query.
+        """
+        return sum(1 for id in relations if id in matched) == expected
+
+    @staticmethod
+    def _rows_of(bits: int, length: int):
+        """Yields the positions of the set bits of a bitset of 'length' bytes, in increasing order."""
+        bitmap = bits.to_bytes(length, "little")
+        for match in Catalog._NONZERO.finditer(bitmap):
+            byte, base = match.group()[0], match.start() << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield base + bit
+
+    @staticmethod
+    def _like(pattern: str):
+        """
+        Returns a predicate with the semantics of LIKE '%pattern%', honouring the '%' and '_' wildcards.
+
+            - pattern: str - the lowercase pattern
+
+        Returns: callable - a function which tells whether a lowercase value matches the pattern
+        """
+        if "%" not in pattern and "_" not in pattern:
+            return lambda value: pattern in value
+        regex = "".join(
+            ".*" if char == "%" else "." if char == "_" else re.escape(char)
+            for char in pattern
+        )
+        compiled = re.compile(regex, re.DOTALL)
+        return lambda value: compiled.search(value) is not None
+
+    @staticmethod
+    def _to_date(value) -> date:
+        """Converts a 'YYYY-MM-DD' string to a date, leaving dates unchanged."""
+        return value if isinstance(value, date) else date.fromisoformat(value)
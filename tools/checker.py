@@ -17,3 +17,15 @@ class Checker:
         """
         file_name = os.path.basename(file_path)
         return os.path.exists(os.path.join(storage_path, file_name))
+
+    @staticmethod
+    def list_storage(storage_path: str) -> set[str]:
+        """
+        Lists the files from the storage folder with a single directory scan.
+
+            - storage_path: str - the path to the storage folder
+
+        Returns: set[str] - the names of the files from the storage folder
+        """
+        with os.scandir(storage_path) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
@@ -0,0 +1,98 @@
+"""Module responsible for running the commands of the application concurrently, on an asyncio event loop."""
+import asyncio
+
+
+class Engine:
+    """
+    Runs the commands received by a Handler as asyncio tasks.
+
+    The blocking work of a command (database round trips, file copies, zip writes) runs on the handler's worker
+    threads, one pooled database connection each, so while a command waits for I/O the others keep going and the
+    event loop stays free to accept new commands. At most 'concurrency' commands run at once.
+
+    The commands which read from the console (archive, play) run alone: they wait for the running commands to finish
+    and the commands received meanwhile wait for them.
+    """
+
+    EXCLUSIVE = ("archive", "play")
+
+    def __init__(self, handler, concurrency: int = None):
+        """
+        Initializes the Engine class.
+
+            - handler: Handler - the started handler which executes the commands
+            - concurrency: int - the maximum number of commands running at once (optional, the pool size by default)
+
+        Returns: None
+        """
+        self.handler = handler
+        self.concurrency = concurrency or handler.concurrency
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._condition = asyncio.Condition()
+        self._running = 0
+        self._exclusive = 0
+        self._tasks = set()
+
+    def submit(self, command: str, jsonPath: str) -> asyncio.Task:
+        """
+        Schedules a command without waiting for it. Its result is printed by the handler when it completes.
+
+            - command: str - the command received from the user
+            - jsonPath: str - the path to the json file containing the command options
+
+        Returns: asyncio.Task - the task running the command
+        """
+        return self.spawn(self.execute(command, jsonPath))
+
+    def spawn(self, coroutine) -> asyncio.Task:
+        """Schedules a coroutine as a task tracked by drain()."""
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def execute(self, command: str, jsonPath: str):
+        """
+        Runs a command and waits for it to complete.
+
+            - command: str - the command received from the user
+            - jsonPath: str - the path to the json file containing the command options
+
+        Returns: any - the value returned by Handler.handle()
+        """
+        exclusive = command.lower() in Engine.EXCLUSIVE
+        return await self.call(self.handler.handle, command, jsonPath, exclusive=exclusive)
+
+    async def call(self, function, *args, exclusive: bool = False):
+        """
+        Runs a blocking function of the handler on its worker threads.
+
+            - function: callable - the function to run
+            - args: any - the arguments of the function
+            - exclusive: bool - whether the function must run alone or not (optional)
+
+        Returns: any - the value returned by the function
+        """
+        async with self._condition:
+            if exclusive:
+                self._exclusive += 1
+                await self._condition.wait_for(lambda: self._running == 0)
+            else:
+                await self._condition.wait_for(lambda: self._exclusive == 0)
+            self._running += 1
+
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.handler.executor, function, *args)
+        finally:
+            async with self._condition:
+                self._running -= 1
+                if exclusive:
+                    self._exclusive -= 1
+                self._condition.notify_all()
+
+    async def drain(self) -> None:
+        """Waits until all the scheduled commands have completed."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -3,24 +3,37 @@ import psycopg2
 import re
 import shutil
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
+from typing import Iterator
 
 from tools.checker import Checker
+from common import extensions
 from commands.create import Create
 from commands.delete import Delete
 from commands.update import Update
 from commands.search import Search
 from commands.archive import Archive
+from commands.restore import Restore
 from commands.play import Play
+from commands.importer import Import
 from .validator import Validator
 from .logger import Logger
 from .repository import Repository
+from .catalog import Catalog
+from .watcher import StorageWatcher
+from .ingest import Ingest
+from .archiver import Archiver
+from .metrics import Metrics, MetricsExporter
+from .profiler import QueryProfiler
 
 
 class Handler:
     """The main class which implements the logic of the application."""
 
-    COMMANDS = [Create, Delete, Update, Search, Archive, Play]
+    COMMANDS = [Create, Import, Delete, Update, Search, Archive, Restore, Play]
 
     def __init__(self, appsettings: str):
         """
@@ -33,6 +46,38 @@ class Handler:
         if not isinstance(appsettings, str):
             raise TypeError("appsettings must be a string")
         self._appsettings = appsettings
+        # the binary stream archives with the output '-' are written to, None while stdout carries other output
+        self.stdout = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The worker threads which run the commands, each one on its own pooled database connection."""
+        return self._executor
+
+    @property
+    def concurrency(self) -> int:
+        """The number of commands which can run at once, one per pooled database connection."""
+        return self._repository.pool_size
+
+    @property
+    def repository(self) -> Repository:
+        """The repository the commands run on."""
+        return self._repository
+
+    @property
+    def storage(self) -> str:
+        """The path to the storage folder."""
+        return self._storage
+
+    @property
+    def ingest(self) -> Ingest:
+        """Places the files of the created and imported songs in the storage folder."""
+        return self._ingest
+
+    @property
+    def archiver(self) -> Archiver:
+        """Writes the archives of the archive command."""
+        return self._archiver
 
     def handle(self, command: str, jsonPath: str) -> None:
         """
@@ -44,83 +89,523 @@ class Handler:
         Returns: None
         """
         try:
-            match command.lower():
-                case "create":
-                    self.put_log("Create command received. Processing...", Logger.INFO)
-                    id = Create.serve(jsonPath, self._repository, self._storage)
-                    self.put_log(f"Song created successfully. ID: {id}", Logger.INFO)
-                    self.print_result(None, id, command)
-
-                case "delete":
-                    self.put_log("Delete command received. Processing...", Logger.INFO)
-                    Delete.serve(jsonPath, self._repository, self._storage)
-                    self.put_log("Song deleted successfully.", Logger.INFO)
-                    self.print_result(None, None, command)
-
-                case "update":
-                    self.put_log("Update command received. Processing...", Logger.INFO)
-                    Update.serve(jsonPath, self._repository)
-                    self.put_log("Song updated successfully.", Logger.INFO)
-                    self.print_result(None, None, command)
-
-                case "search":
-                    self.put_log("Search command received. Processing...", Logger.INFO)
-                    data = Search.serve(jsonPath, self._repository)
-                    self.put_log("Search completed successfully.", Logger.INFO)
-                    self.print_result(None, data, command)
-
-                case "archive":
-                    self.put_log("Archive command received. Processing...", Logger.INFO)
-                    Archive.serve(jsonPath, self._repository, self._storage)
-                    self.put_log("Songs archived successfully.", Logger.INFO)
-                    self.print_result(None, None, command)
-
-                case "play":
-                    self.put_log("Play command received. Processing...", Logger.INFO)
-                    Play.serve(jsonPath, self._repository)
-                    self.put_log("Song played successfully.", Logger.INFO)
-                    self.print_result(None, None, command)
-                case _:
-                    raise ValueError(f"Unknown command received ({command})")
+            with self._repository.session():
+                self._dispatch(command, jsonPath)
         except Exception as err:
             err_msg = str(err).strip()
-            self.put_log(err_msg, Logger.ERROR)
+            self.put_log(err_msg, Logger.ERROR, command=command.lower())
             self.print_result(err_msg, None, command)
 
+    def handle_atomic(self, commands: list[list[str]]) -> None:
+        """
+        Handles several commands one after the other in a single transaction: either all of them are committed,
+        with one commit, or none of them is.
+
+            - commands: list[list[str]] - the (command, jsonPath) pairs received from the user
+
+        Returns: None
+        """
+        command = None
+        try:
+            with self._repository.transaction():
+                for command, jsonPath in commands:
+                    self._dispatch(command, jsonPath)
+        except Exception as err:
+            err_msg = str(err).strip()
+            self.put_log(f"{err_msg} Transaction rolled back.", Logger.ERROR)
+            self.print_result(err_msg, None, command)
+            print("Transaction rolled back, none of the commands was saved.")
+
+    def execute(self, command: str, jsonPath: str):
+        """
+        Executes a command and returns its result instead of printing it, for scripts.
+
+            - command: str - the command received from the user
+            - jsonPath: str - the path to the json file containing the command options
+
+        Returns: any - the JSON serializable result of the command, raises an exception if the command failed
+        """
+        try:
+            with self._repository.session():
+                return self._execute(command, jsonPath)
+        except Exception as err:
+            self.put_log(str(err).strip(), Logger.ERROR, command=command.lower())
+            raise
+
+    def execute_atomic(self, commands: list[list[str]]) -> list[tuple]:
+        """
+        Executes several commands one after the other in a single transaction and returns their results instead
+        of printing them, for scripts. If a command fails, none of them is committed and the next ones are skipped.
+
+            - commands: list[list[str]] - the (command, jsonPath) pairs of the script
+
+        Returns: list[tuple] - the (status, result) of every command: 'ok', 'error' (the result is the error message),
+        'rolled back' (a later command failed) or 'skipped' (an earlier command failed)
+        """
+        results = []
+        try:
+            with self._repository.transaction():
+                for command, jsonPath in commands:
+                    try:
+                        results.append(("ok", self._execute(command, jsonPath)))
+                    except Exception as err:
+                        results.append(("error", str(err).strip()))
+                        raise
+        except Exception as err:
+            self.put_log(f"{str(err).strip()} Transaction rolled back.", Logger.ERROR)
+            results = [("rolled back", None) if status == "ok" else (status, result) for status, result in results]
+            results += [("skipped", None)] * (len(commands) - len(results))
+        return results
+
+    def _execute(self, command: str, jsonPath: str):
+        """Runs a command on the current session and converts its result to JSON serializable data."""
+        with self._metrics.command(command.lower()):
+            data = self._run(command, jsonPath, lambda msg: self.put_log(msg, Logger.INFO), interactive=False)
+            if command.lower() != "search":
+                return data
+            songs = [
+                {
+                    "id": song[6],
+                    "name": song[1],
+                    "releaseDate": str(song[2]),
+                    "format": song[3],
+                    "artists": list(song[4]),
+                    "tags": list(song[5]),
+                }
+                for song in data
+            ]
+            return songs
+
+    def _dispatch(self, command: str, jsonPath: str) -> None:
+        """
+        Executes the command received from the user and prints its result.
+
+            - command: str - the command received from the user
+            - jsonPath: str - the path to the json file containing the command options
+
+        Returns: None
+        """
+        with self._metrics.command(command.lower()):
+            data = self._run(command, jsonPath, self._report)
+            self.print_result(None, data, command)
+
+    def _run(self, command: str, jsonPath: str, report, interactive: bool = True):
+        """
+        Executes the command received from the user.
+
+            - command: str - the command received from the user
+            - jsonPath: str - the path to the json file containing the command options
+            - report: callable - receives the progress messages of long running commands
+            - interactive: bool - whether the command can ask the user on the console (optional)
+
+        Returns: any - the id of a created song, the summary of an import, the songs found by a search
+        (streamed), the summary of an archive or of a restore, or None
+        """
+        started = time.perf_counter()
+        match command.lower():
+            case "create":
+                self.put_log("Create command received. Processing...", Logger.INFO, command="create")
+                id = Create.serve(jsonPath, self._repository, self._storage, self._ingest)
+                self.put_log(
+                    f"Song created successfully. ID: {id}",
+                    Logger.INFO,
+                    command="create",
+                    duration=Handler._elapsed(started),
+                    rows=1,
+                    id=id,
+                )
+                return id
+
+            case "import":
+                self.put_log("Import command received. Processing...", Logger.INFO, command="import")
+                summary = Import.serve(
+                    jsonPath,
+                    self._repository,
+                    self._storage,
+                    self._import,
+                    report,
+                    self._ingest,
+                )
+                self.put_log(
+                    "Import completed: {imported} imported, {skipped} already imported, {failed} failed.".format(
+                        **summary
+                    ),
+                    Logger.INFO,
+                    command="import",
+                    duration=Handler._elapsed(started),
+                    rows=summary["imported"],
+                    **summary,
+                )
+                return summary
+
+            case "delete":
+                self.put_log("Delete command received. Processing...", Logger.INFO, command="delete")
+                Delete.serve(jsonPath, self._repository)
+                self.put_log(
+                    "Song deleted successfully.",
+                    Logger.INFO,
+                    command="delete",
+                    duration=Handler._elapsed(started),
+                    rows=1,
+                )
+
+            case "update":
+                self.put_log("Update command received. Processing...", Logger.INFO, command="update")
+                Update.serve(jsonPath, self._repository)
+                self.put_log(
+                    "Song updated successfully.",
+                    Logger.INFO,
+                    command="update",
+                    duration=Handler._elapsed(started),
+                    rows=1,
+                )
+
+            case "search":
+                self.put_log("Search command received. Processing...", Logger.INFO, command="search")
+                songs = Search.stream(jsonPath, self._repository, self._fetch_size)
+                return self._log_search(songs, started)
+
+            case "archive":
+                self.put_log("Archive command received. Processing...", Logger.INFO, command="archive")
+                summary = Archive.serve(
+                    jsonPath, self._repository, self._storage, self._archiver, interactive, self.stdout
+                )
+                self._metrics.add("archives_total")
+                self._metrics.add("archived_bytes_total", summary["bytes"])
+                self.put_log(
+                    f"Songs archived successfully. Archive: {summary['archive']} ({summary['unchanged']} unchanged)",
+                    Logger.INFO,
+                    command="archive",
+                    duration=Handler._elapsed(started),
+                    rows=summary["songs"],
+                    **summary,
+                )
+                return summary
+
+            case "restore":
+                self.put_log("Restore command received. Processing...", Logger.INFO, command="restore")
+                summary = Restore.serve(jsonPath, self._repository, self._storage, report)
+                self.put_log(
+                    "Restore completed: {restored} restored, {skipped} already in the storage, {files} file(s) "
+                    "extracted.".format(**summary),
+                    Logger.INFO,
+                    command="restore",
+                    duration=Handler._elapsed(started),
+                    rows=summary["restored"],
+                    **summary,
+                )
+                return summary
+
+            case "play":
+                self.put_log("Play command received. Processing...", Logger.INFO, command="play")
+                Play.serve(jsonPath, self._repository)
+                self.put_log(
+                    "Song played successfully.",
+                    Logger.INFO,
+                    command="play",
+                    duration=Handler._elapsed(started),
+                )
+            case _:
+                raise ValueError(f"Unknown command received ({command})")
+
+    def _log_search(self, songs: Iterator[tuple], started: float) -> Iterator[tuple]:
+        """Yields the songs found by a search and logs how many there were once they're all read."""
+        rows = 0
+        for song in songs:
+            rows += 1
+            yield song
+        self.put_log(
+            "Search completed successfully.",
+            Logger.INFO,
+            command="search",
+            duration=Handler._elapsed(started),
+            rows=rows,
+        )
+
+    @staticmethod
+    def _elapsed(started: float) -> float:
+        """Returns the seconds elapsed since 'started' (a perf_counter() value), rounded to microseconds."""
+        return round(time.perf_counter() - started, 6)
+
     def start(self) -> None:
         """Starts the application by validating the settings and initializing the logger and database."""
         data = Validator.validate_appsettings(self._appsettings)
 
-        self._log_queue = Queue()
+        self._log_queue = Queue(maxsize=data["logging"]["queueSize"])
+        self._logger = Logger(
+            data["logger"],
+            self._log_queue,
+            batch_size=data["logging"]["batchSize"],
+            flush_interval=data["logging"]["flushInterval"],
+            flush_bytes=data["logging"]["flushBytes"],
+            format=data["logging"]["format"],
+            max_bytes=data["logging"]["maxBytes"],
+            rotate_every=data["logging"]["rotateEvery"],
+            compression=data["logging"]["compression"],
+            retention=data["logging"]["retention"],
+        )
+        self._logger.start()
         self._storage = data["storage"]
-
-        self._repository = Repository(data["connection"])
+        self._fetch_size = data["search"]["fetchSize"]
+        self._import = data["import"]
+        self._ingest = Ingest(
+            data["ingest"]["strategy"],
+            lambda msg: self.put_log(msg, Logger.INFO),
+            data["ingest"]["contentAddressed"],
+            data["ingest"]["digest"],
+        )
+
+        self._archiver = Archiver(
+            data["archive"]["format"],
+            data["archive"]["compression"],
+            data["archive"]["store"],
+            data["archive"]["level"],
+            data["archive"]["workers"],
+            data["archive"]["chunkSize"],
+            lambda msg: self.put_log(msg, Logger.INFO),
+        )
+
+        self._repository = Repository(data["connection"], data["pool"], data["cache"])
+        self._metrics = Metrics()
+        self._repository.metrics = self._metrics
+        self.register_metrics()
+        self._exporter = None
+        if data["metrics"]["textfile"]:
+            self._exporter = MetricsExporter(
+                self._metrics,
+                data["metrics"]["textfile"],
+                data["metrics"]["interval"],
+                lambda msg: self.put_log(msg, Logger.WARNING),
+            )
+            self._exporter.start()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._repository.pool_size, thread_name_prefix="command"
+        )
+        self._print_lock = threading.Lock()
         self.put_log("Repository initialized successfully.", Logger.INFO)
 
         self.refresh(data["restart"])
-        self.sync_db()
-
-        self._logger = Logger(data["logger"], self._log_queue)
-        self._logger.start()
+        self.migrate_db()
+        self._profiler = None
+        if data["profiling"]["enabled"]:
+            self._profiler = QueryProfiler(
+                data["profiling"]["slowQuery"],
+                data["profiling"]["sampleRate"],
+                data["profiling"]["plans"],
+                lambda msg, **fields: self.put_log(msg, Logger.WARNING, **fields),
+            )
+            self._repository.profiler = self._profiler
+        # the catalog is loaded first so the deletions of the reconciliation and the watcher reach it
+        if data["catalog"]["enabled"]:
+            self.load_catalog()
+        self._watcher = None
+        if data["watcher"]["enabled"]:
+            self.start_watcher(data["watcher"], data["restart"])
+        else:
+            self.sync_db()
 
     def stop(self) -> None:
         """Stops the application by closing the database connection and stopping the logger."""
+        self._executor.shutdown(wait=True)
+        self.stop_watcher()
+        if self._exporter is not None:
+            self._exporter.stop()
+        if self._profiler is not None:
+            self.put_log(self._profiler.report(), Logger.INFO)
+        stats = self._repository.statement_stats().values()
+        self.put_log(
+            "Prepared statements: {} prepared, {} executed, {} plans reused.".format(
+                sum(item["prepared"] for item in stats),
+                sum(item["executed"] for item in stats),
+                sum(item["reused"] for item in stats),
+            ),
+            Logger.INFO,
+        )
+        for strategy, stats in self._ingest.stats().items():
+            self.put_log(
+                "Ingest ({}): {} file(s), {:.1f} MiB in {:.3f}s.".format(
+                    strategy, stats["files"], stats["bytes"] / 2**20, stats["seconds"]
+                ),
+                Logger.INFO,
+            )
+        stats = self._archiver.stats()
+        if stats["archives"]:
+            self.put_log(
+                "Archives: {} archive(s), {} file(s), {:.1f} MiB -> {:.1f} MiB in {:.3f}s.".format(
+                    stats["archives"],
+                    stats["entries"],
+                    stats["bytes"] / 2**20,
+                    stats["written"] / 2**20,
+                    stats["seconds"],
+                ),
+                Logger.INFO,
+            )
         self._repository.close_connection()
         self.put_log("Database connection closed successfully.", Logger.INFO)
         self.put_log("Handler is stopping...", Logger.INFO)
         self._logger.stop()
+        self._logger.join()
 
-    def sync_db(self) -> bool:
-        """Checks if the files from the DB exist in the storage folder, otherwise deletes them from the DB."""
-        query = 'SELECT filepath FROM "Song"'
-        result = self._repository.execute(query, Repository.QUERY)
-        for row in result:
-            if not Checker.check_file_existence(row[0], self._storage):
+    def sync_db(self) -> dict:
+        """
+        Reconciles the DB with the storage folder: the songs whose files don't exist anymore are deleted from the DB
+        and the audio files which have no song in the DB are reported. The storage folder is listed once and the
+        missing songs are deleted with a single statement.
+
+        Returns: dict - the reconciliation report, with the keys 'missing' (ids deleted) and 'orphans' (file names)
+        """
+        files = Checker.list_storage(self._storage)
+        known, missing = set(), []
+        query = 'SELECT id, filepath FROM "Song"'
+        for id, filePath in self._repository.stream(query, fetch_size=self._fetch_size):
+            file_name = os.path.basename(filePath)
+            known.add(file_name)
+            if file_name not in files:
                 self.put_log(
-                    f"File {row[0]} from DB doesn't exist, deleting...", Logger.WARNING
+                    f"File {filePath} from DB doesn't exist, deleting...", Logger.WARNING
                 )
-                self._repository.delete_song("filepath", f"'{row[0]}'")
-        return True
+                missing.append(id)
+
+        self._repository.delete_songs(missing)
+
+        orphans = sorted(
+            name
+            for name in files - known
+            if name.rsplit(".", 1)[-1] in extensions.SUPPORTED_FORMATS
+        )
+        for name in orphans:
+            self.put_log(f"File {name} from storage has no song in DB.", Logger.WARNING)
+
+        self.put_log(
+            f"Storage reconciled: {len(missing)} missing song(s) deleted, {len(orphans)} untracked file(s).",
+            Logger.INFO,
+        )
+        return {"missing": missing, "orphans": orphans}
+
+    def start_watcher(self, settings: dict, restart: bool) -> None:
+        """
+        Starts watching the storage folder. The changes made since the checkpoint written by the previous run are
+        reconciled by file name; without a checkpoint the whole storage folder is reconciled with sync_db().
+
+            - settings: dict - the watcher settings
+            - restart: bool - whether the database and storage folder were restarted or not
+
+        Returns: None
+        """
+        if not StorageWatcher.available():
+            self.put_log(
+                "Storage watcher is only available on Linux, reconciling the storage folder at startup only.",
+                Logger.WARNING,
+            )
+            self.sync_db()
+            return
+
+        self._checkpoint = settings["checkpoint"]
+        self._watcher = StorageWatcher(
+            self._storage,
+            self.apply_storage_changes,
+            settings["debounce"],
+            settings["maxBatch"],
+        )
+        self._watcher.start()
+
+        previous = StorageWatcher.load_checkpoint(self._checkpoint)
+        if previous is None or restart:
+            self.sync_db()
+        else:
+            files = {
+                name
+                for name in Checker.list_storage(self._storage)
+                if StorageWatcher.relevant(name)
+            }
+            self.apply_storage_changes((sorted(files - previous), sorted(previous - files), []))
+        self.put_log("Storage watcher started.", Logger.INFO)
+
+    def stop_watcher(self) -> None:
+        """Stops watching the storage folder and writes the checkpoint used by the next startup."""
+        if self._watcher is None:
+            return
+        watcher, self._watcher = self._watcher, None
+        watcher.stop()
+        if watcher.error is not None:
+            self.put_log(
+                f"Storage changes couldn't be applied, the next startup will reconcile the whole storage folder. {watcher.error}",
+                Logger.ERROR,
+            )
+            return
+
+        files = {
+            name
+            for name in Checker.list_storage(self._storage)
+            if StorageWatcher.relevant(name)
+        }
+        try:
+            StorageWatcher.save_checkpoint(self._checkpoint, files)
+        except OSError as e:
+            err_msg = str(e).strip()
+            self.put_log(f"Storage checkpoint couldn't be written! {err_msg}", Logger.ERROR)
+            return
+        self.put_log(f"Storage checkpoint written ({len(files)} file(s)).", Logger.INFO)
+
+    def apply_storage_changes(self, batch: tuple) -> None:
+        """
+        Applies a batch of changes from the storage folder to the DB: the songs whose files were removed are deleted,
+        the songs whose files were renamed keep their data under the new path and the new files which have no song
+        in the DB are reported, like sync_db() does. Every change is idempotent, so a batch can be applied again.
+
+            - batch: tuple - the (added, removed, renamed) file names, None if the whole folder must be reconciled
+
+        Returns: None
+        """
+        if batch is None:
+            self.put_log(
+                "Storage watcher lost events, reconciling the whole storage folder...", Logger.WARNING
+            )
+            self.sync_db()
+            return
+
+        added, removed, renamed = batch
+        with self._repository.transaction():
+            deleted = self._repository.delete_songs_by_filepath(
+                [os.path.join(self._storage, name) for name in removed]
+            )
+            moved = self._repository.move_songs(
+                [
+                    (os.path.join(self._storage, old), os.path.join(self._storage, new))
+                    for old, new in renamed
+                ]
+            )
+            paths = [
+                os.path.join(self._storage, name)
+                for name in added + [new for _, new in renamed]
+            ]
+            tracked = self._repository.tracked_filepaths(paths)
+
+        for name in removed:
+            self.put_log(f"File {name} was removed from storage.", Logger.WARNING)
+        untracked = [path for path in paths if path not in tracked]
+        for path in untracked:
+            self.put_log(f"File {os.path.basename(path)} from storage has no song in DB.", Logger.WARNING)
+
+        self.put_log(
+            f"Storage changes applied: {len(deleted)} song(s) deleted, {len(moved)} song(s) moved, "
+            f"{len(untracked)} untracked file(s).",
+            Logger.INFO,
+        )
+
+    def load_catalog(self) -> None:
+        """Loads the in-memory catalog, which answers the searches from then on."""
+        catalog = Catalog()
+        catalog.load(self._repository)
+        self._repository.catalog = catalog
+
+        usage = catalog.memory_usage()
+        self.put_log(
+            "Catalog loaded: {} songs, {} artists, {} tags, {:.1f} MiB.".format(
+                usage["songs"], usage["artists"], usage["tags"], usage["bytes"] / 2**20
+            ),
+            Logger.INFO,
+        )
 
     def refresh(self, restart: bool) -> None:
         """
@@ -134,12 +619,21 @@ class Handler:
             self.refresh_db()
             self.refresh_dir()
 
+    def migrate_db(self) -> None:
+        """Creates the missing tables and upgrades the database schema to the latest version."""
+        try:
+            applied = self._repository.migrate()
+        except psycopg2.Error as e:
+            err_msg = str(e).strip()
+            raise psycopg2.Error(f"Database migration failed! {err_msg}")
+        for version in applied:
+            self.put_log(f"Database migrated to schema version {version}.", Logger.INFO)
+
     def refresh_db(self) -> None:
         """Refreshes the database by clearing and recreating the tables."""
         self.put_log("Restarting database...", Logger.INFO)
         try:
             self._repository.clear_tables()
-            self._repository.create_tables()
         except psycopg2.Error as e:
             err_msg = str(e).strip()
             raise psycopg2.Error(f"Database restart failed! {err_msg}")
@@ -156,16 +650,18 @@ class Handler:
             raise OSError(f"Storage clearing failed! {err_msg}")
         self.put_log("Storage cleared successfully.", Logger.INFO)
 
-    def put_log(self, msg: str, level: int) -> None:
+    def put_log(self, msg: str, level: int, **fields) -> None:
         """
-        Puts a log message in the queue for the logger to process.
+        Puts a log message in the queue for the logger to process, without blocking.
+        If the queue is full the message is dropped, and the logger reports how many were.
 
             - msg: str - the message to log
             - level: int - the level of the message
+            - fields: any - structured data written with the message in the json log format (optional)
 
         Returns: None
         """
-        self._log_queue.put((msg, level))
+        self._logger.put(msg, level, **fields)
 
     def valid_command(self, command: str) -> tuple[bool, list]:
         """
@@ -194,12 +690,31 @@ class Handler:
 
         Returns: None
         """
+        with self._print_lock:
+            self._print_result(err, data, command)
+
+    def _report(self, msg: str) -> None:
+        """Prints and logs a progress message of a long running command."""
+        self.put_log(msg, Logger.INFO)
+        with self._print_lock:
+            print(msg)
+
+    def _print_result(self, err: str, data, command: str) -> None:
+        """Prints the result of the command, see print_result()."""
         match command:
             case "create":
                 if err:
                     print(f"Error occured while creating. {err}")
                 else:
                     print(f"Song created successfully. ID: {data}")
+            case "import":
+                if err:
+                    print(f"Error occured while importing. {err}")
+                else:
+                    print(
+                        "Import completed successfully. {imported} song(s) imported, "
+                        "{skipped} already imported, {failed} failed.".format(**data)
+                    )
             case "delete":
                 if err:
                     print(f"Error occured while deleting. {err}")
@@ -214,19 +729,32 @@ class Handler:
                 if err:
                     print(f"Error occured while searching. {err}")
                 else:
-                    print("Search completed successfully.\n --------------------------")
+                    print("Search results:\n --------------------------")
+                    count = 0
                     for song in data:
+                        count += 1
+                        print(f"> id: {song[6]}")
                         print(f"> name: {song[1]}")
                         print(f"> releaseDate: {song[2]}")
                         print(f"> format: {song[3]}")
                         print(f"> artists: {song[4]}")
                         print(f"> tags: {song[5]}\n --------------------------")
+                    print(f"Search completed successfully. {count} song(s) found.")
             case "archive":
                 if err:
                     print(f"Error occured while archiving. {err}")
                 else:
                     print(
-                        "Songs archived successfully. Please check the storage folder."
+                        f"{data['songs']} song(s) archived successfully, {data['unchanged']} unchanged since the base. "
+                        f"Archive: {data['archive']}"
+                    )
+            case "restore":
+                if err:
+                    print(f"Error occured while restoring. {err}")
+                else:
+                    print(
+                        "Restore completed successfully. {restored} song(s) restored, "
+                        "{skipped} already in the storage.".format(**data)
                     )
             case "play":
                 if err:
@@ -236,9 +764,70 @@ class Handler:
             case _:
                 print(f"Unknown command received ({command})")
 
+    def register_metrics(self) -> None:
+        """Registers the values of the ingest, the pool and the logger which are read when the metrics are collected."""
+        self._metrics.register(
+            "ingested_bytes_total",
+            "counter",
+            "Bytes placed in the storage folder",
+            lambda: [({"strategy": name}, stats["bytes"]) for name, stats in self._ingest.stats().items()],
+        )
+        self._metrics.register(
+            "ingested_files_total",
+            "counter",
+            "Files placed in the storage folder",
+            lambda: [({"strategy": name}, stats["files"]) for name, stats in self._ingest.stats().items()],
+        )
+        self._metrics.register(
+            "pool_connections_in_use",
+            "gauge",
+            "Database connections in use",
+            lambda: self._repository.pool_stats()["inUse"],
+        )
+        self._metrics.register(
+            "log_queue_depth", "gauge", "Log messages waiting to be written", self._log_queue.qsize
+        )
+        self._metrics.register(
+            "log_dropped_total", "counter", "Log messages dropped", lambda: self._logger.dropped
+        )
+
+    def stats(self) -> str:
+        """Returns a report of the command latencies, database queries and the other metrics, and of the slowest statements if profiling is enabled."""
+        report = self._metrics.report()
+        if self._profiler is not None:
+            report += "\n" + self._profiler.report()
+        return report
+
+    def cache_stats(self) -> str:
+        """Returns a report of the search result cache counters."""
+        stats = self._repository.search_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups * 100 if lookups else 0.0
+        return "\n".join(
+            [
+                f"Search cache: {stats['size']}/{stats['maxsize']} entries, catalog generation {self._repository.generation}",
+                f"   hits: {stats['hits']} ({ratio:.1f}%), misses: {stats['misses']}",
+                f"   evictions: {stats['evictions']}, expirations: {stats['expirations']}, invalidations: {stats['clears']}",
+            ]
+            + self._catalog_stats()
+        )
+
+    def _catalog_stats(self) -> list[str]:
+        """Returns the report lines of the in-memory catalog, if it is enabled."""
+        if self._repository.catalog is None:
+            return []
+        usage = self._repository.catalog.memory_usage()
+        return [
+            "Catalog: {} songs, {} artists, {} tags, {:.1f} MiB".format(
+                usage["songs"], usage["artists"], usage["tags"], usage["bytes"] / 2**20
+            )
+        ]
+
     def help(self) -> str:
         """Returns the help message for the application."""
         result = []
         for command in Handler.COMMANDS:
             result.append(command.help())
+        result.append("   > cache => Shows the search cache and catalog statistics")
+        result.append("   > stats => Shows the command latencies, database queries and other metrics")
         return "\n".join(result)
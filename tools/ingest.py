@@ -0,0 +1,317 @@
+"""Module responsible for bringing the audio files into the storage folder."""
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+
+class Ingest:
+    """
+    Places files in the storage folder with a configurable strategy:
+
+        - copy: reads and writes the file (shutil.copy)
+        - copy_file_range: copies the file inside the kernel (copy_file_range, or sendfile if it's not supported)
+        - reflink: clones the file on copy-on-write filesystems (btrfs, xfs), sharing the data blocks with the source
+        - hardlink: links the source file in the storage folder, without copying data
+        - move: links the source file in the storage folder, and removes it from its original location once the
+          song using it is committed (see remove_sources()), so a rolled back song never loses the user's file
+
+    A strategy which isn't supported between the source and the storage folder (e.g. a hardlink across filesystems)
+    falls back to the next one: hardlink -> reflink -> copy_file_range -> copy, move -> copy_file_range -> copy.
+
+    With the content-addressed layout, files are stored as <digest>.<format>, the digest being computed from their
+    content: a file whose content is already in the storage folder isn't placed again and the songs share it.
+    """
+
+    STRATEGIES = ("copy", "copy_file_range", "reflink", "hardlink", "move")
+    FALLBACKS = {
+        "hardlink": "reflink",
+        "reflink": "copy_file_range",
+        "copy_file_range": "copy",
+        "move": "copy_file_range",
+    }
+    UNSUPPORTED = {
+        errno.EXDEV,
+        errno.EPERM,
+        errno.EOPNOTSUPP,
+        errno.ENOTTY,
+        errno.EINVAL,
+        errno.ENOSYS,
+        errno.EMLINK,
+    }
+    FICLONE = 0x40049409
+
+    DIGESTS = ("sha256", "blake2b")
+    CHUNK_SIZE = 1 << 20
+    BLOBS = threading.Lock()
+    _claims = Counter()
+
+    def __init__(
+        self, strategy: str = "copy", log=None, content_addressed: bool = False, digest: str = "sha256"
+    ):
+        """
+        Initializes the Ingest class.
+
+            - strategy: str - the preferred strategy (optional)
+            - log: callable - receives a message with the strategy used and the timing of every file (optional)
+            - content_addressed: bool - whether the files are stored under the digest of their content (optional)
+            - digest: str - the hash function of the content-addressed layout, sha256 or blake2b (optional)
+
+        Returns: None
+        """
+        if strategy not in Ingest.STRATEGIES:
+            raise ValueError(f"Unknown ingest strategy ({strategy})")
+        if digest not in Ingest.DIGESTS:
+            raise ValueError(f"Unknown digest ({digest})")
+        self.strategy = strategy
+        self.content_addressed = content_addressed
+        self.digest = digest
+        self._log = log
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def destination(self, source: str, storage: str, format: str) -> tuple[str, str]:
+        """
+        Computes where a file is stored. With the content-addressed layout, its content is hashed for that.
+
+            - source: str - the path of the file to ingest
+            - storage: str - the path to the storage folder
+            - format: str - the format of the song
+
+        Returns: tuple[str, str] - the path of the file in the storage folder and its digest (None if not content-addressed)
+        """
+        if not self.content_addressed:
+            return os.path.join(storage, os.path.basename(source)), None
+        digest = Ingest.hash_file(source, self.digest)
+        return os.path.join(storage, f"{digest}.{format}"), digest
+
+    def place(self, source: str, destination: str) -> str:
+        """
+        Places the file 'source' at 'destination', unless the content-addressed file is already there.
+        The destination stays claimed until release() or discard() is called, so remove_unreferenced() keeps it
+        while the song using it isn't committed yet.
+
+            - source: str - the path of the file to ingest
+            - destination: str - the path returned by destination()
+
+        Returns: str - the strategy which placed the file, 'deduplicated' if it was already stored
+        """
+        with Ingest.BLOBS:
+            Ingest._claims[destination] += 1
+            stored = self.content_addressed and os.path.exists(destination)
+
+        try:
+            if not self.content_addressed:
+                return self.store(source, destination)
+            if not stored:
+                temporary = f"{destination}.{threading.get_ident()}.part"
+                strategy = self.store(source, temporary)
+                with Ingest.BLOBS:
+                    stored = os.path.exists(destination)
+                    if not stored:
+                        os.replace(temporary, destination)
+                        return strategy
+                    os.remove(temporary)
+        except BaseException:
+            Ingest.release([destination])
+            raise
+
+        size = os.path.getsize(destination)
+        self._count("deduplicated", size, 0.0)
+        if self._log is not None:
+            self._log(f"Content of {os.path.basename(source)} is already stored as {os.path.basename(destination)}.")
+        return "deduplicated"
+
+    def remove_sources(self, sources: list[str]) -> None:
+        """
+        Removes the source files of the songs committed with the move strategy. A file which can't be removed is only
+        logged, since its song is already saved.
+
+            - sources: list[str] - the paths of the ingested files
+
+        Returns: None
+        """
+        if self.strategy != "move":
+            return
+        for source in sources:
+            try:
+                os.remove(source)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                if self._log is not None:
+                    self._log(f"Could not remove the moved file {source}: {e}")
+
+    @staticmethod
+    def release(destinations: list[str]) -> None:
+        """
+        Releases the claims taken by place(), once the songs using the files are committed.
+
+            - destinations: list[str] - the paths returned by destination()
+
+        Returns: None
+        """
+        with Ingest.BLOBS:
+            for destination in destinations:
+                Ingest._claims[destination] -= 1
+                if Ingest._claims[destination] <= 0:
+                    del Ingest._claims[destination]
+
+    @staticmethod
+    def discard(destinations: list[str], repository) -> None:
+        """
+        Releases the claims taken by place() and removes the files no song uses, once the songs are rolled back.
+
+            - destinations: list[str] - the paths returned by destination()
+            - repository: Repository - the repository object
+
+        Returns: None
+        """
+        Ingest.release(destinations)
+        for destination in dict.fromkeys(destinations):
+            Ingest.remove_unreferenced(destination, repository)
+
+    @staticmethod
+    def remove_unreferenced(path: str, repository) -> bool:
+        """
+        Removes a file from the storage folder, unless a song uses it or a pending ingest claimed it.
+
+            - path: str - the path of the file
+            - repository: Repository - the repository object
+
+        Returns: bool - True if the file was removed, False otherwise
+        """
+        with Ingest.BLOBS:
+            if Ingest._claims[path] > 0 or repository.tracked_filepaths([path]):
+                return False
+            if os.path.exists(path):
+                os.remove(path)
+            return True
+
+    @staticmethod
+    def hash_file(path: str, digest: str = "sha256") -> str:
+        """
+        Hashes the content of a file, reading it in chunks.
+
+            - path: str - the path of the file
+            - digest: str - the hash function, sha256 or blake2b (optional)
+
+        Returns: str - the hexadecimal digest
+        """
+        hash = hashlib.new(digest)
+        buffer = bytearray(Ingest.CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(path, "rb", buffering=0) as file:
+            while size := file.readinto(buffer):
+                hash.update(view[:size])
+        return hash.hexdigest()
+
+    @staticmethod
+    def is_content_addressed(path: str) -> bool:
+        """Checks if a storage path has the <digest>.<format> form of the content-addressed layout."""
+        stem = os.path.basename(path).rsplit(".", 1)[0]
+        return len(stem) in (64, 128) and all(char in "0123456789abcdef" for char in stem)
+
+    def store(self, source: str, destination: str) -> str:
+        """
+        Places the file 'source' at 'destination', trying the strategies from the preferred one onwards.
+        If every strategy fails, the partial file left at 'destination' is removed.
+
+            - source: str - the path of the file to ingest
+            - destination: str - the path of the file in the storage folder
+
+        Returns: str - the strategy which placed the file
+        """
+        strategy = self.strategy
+        started = time.perf_counter()
+        while True:
+            try:
+                getattr(Ingest, f"_{strategy}")(source, destination)
+                break
+            except OSError as e:
+                # EEXIST: the file at the destination isn't ours
+                if e.errno != errno.EEXIST and os.path.exists(destination):
+                    os.remove(destination)
+                if strategy == "copy" or e.errno not in Ingest.UNSUPPORTED:
+                    raise
+                strategy = Ingest.FALLBACKS[strategy]
+
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(destination)
+        self._count(strategy, size, elapsed)
+        if self._log is not None:
+            fallback = f" (fallback from {self.strategy})" if strategy != self.strategy else ""
+            self._log(
+                f"Ingested {os.path.basename(source)} with {strategy}{fallback}: "
+                f"{size} bytes in {elapsed * 1000:.2f} ms."
+            )
+        return strategy
+
+    def _count(self, strategy: str, size: int, elapsed: float) -> None:
+        """Adds a file to the counters of a strategy."""
+        with self._lock:
+            stats = self._stats.setdefault(strategy, {"files": 0, "bytes": 0, "seconds": 0.0})
+            stats["files"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += elapsed
+
+    def stats(self) -> dict:
+        """Returns how many files and bytes each strategy ingested and how long it took."""
+        with self._lock:
+            return {strategy: dict(stats) for strategy, stats in self._stats.items()}
+
+    @staticmethod
+    def _copy(source: str, destination: str) -> None:
+        """Copies the file through shutil."""
+        shutil.copy(source, destination)
+
+    @staticmethod
+    def _hardlink(source: str, destination: str) -> None:
+        """Links the file in the storage folder."""
+        os.link(source, destination)
+
+    @staticmethod
+    def _move(source: str, destination: str) -> None:
+        """
+        Links the file in the storage folder (only possible on the same filesystem). The source is only removed once
+        the song is committed, by remove_sources().
+        """
+        os.link(source, destination)
+
+    @staticmethod
+    def _reflink(source: str, destination: str) -> None:
+        """Clones the file with the FICLONE ioctl."""
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), Ingest.FICLONE, src.fileno())
+        shutil.copymode(source, destination)
+
+    @staticmethod
+    def _copy_file_range(source: str, destination: str) -> None:
+        """Copies the file inside the kernel, with copy_file_range or else sendfile."""
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            remaining = os.fstat(src.fileno()).st_size
+            transfer = getattr(os, "copy_file_range", None)
+            offset = 0
+            while remaining > 0:
+                try:
+                    if transfer is os.sendfile:
+                        sent = transfer(dst.fileno(), src.fileno(), offset, remaining)
+                    elif transfer is not None:
+                        sent = transfer(src.fileno(), dst.fileno(), remaining)
+                    else:
+                        transfer = os.sendfile
+                        continue
+                except OSError as e:
+                    if transfer is os.sendfile or offset or e.errno not in Ingest.UNSUPPORTED:
+                        raise
+                    transfer = os.sendfile
+                    continue
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+        shutil.copymode(source, destination)
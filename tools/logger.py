@@ -1,78 +1,273 @@
 """Module responsible for logging the application's activity."""
+import gzip
+import io
+import json
 import os
+import re
+import shutil
 import threading
 import time
-from queue import Queue
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 class Logger(threading.Thread):
-    """A class which provides static methods to log the application's activity."""
+    """
+    A thread which writes the application's activity to the log file.
+
+    The messages are put in a bounded queue without blocking (when the queue is full they are dropped and counted)
+    and the thread waits on the queue instead of polling it. Every message which is waiting is written with a single
+    call, and the file is flushed once 'flush_interval' seconds passed or 'flush_bytes' bytes were written since the
+    last flush, so a crash loses at most that much.
+
+    The log file is appended to and rotated once it reaches 'max_bytes' bytes or is 'rotate_every' seconds old: it is
+    renamed to <log>.<YYYYmmdd-HHMMSS> and a new one is started. The rotated segments are compressed and the ones
+    beyond 'retention' are removed on a separate thread, so the writer isn't held up.
+    """
 
     INFO = 0
     WARNING = 1
     ERROR = 2
     CRITICAL = 3
 
-    def __init__(self, log_path: str, queue: Queue):
+    LEVELS = {INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR", CRITICAL: "CRITICAL"}
+    FORMATS = ("text", "json")
+    COMPRESSIONS = ("none", "gzip") + (("zstd",) if zstandard is not None else ())
+    EXTENSIONS = ("", ".gz", ".zst")
+
+    def __init__(
+        self,
+        log_path: str,
+        queue: Queue,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        flush_bytes: int = 65536,
+        format: str = "text",
+        max_bytes: int = 0,
+        rotate_every: float = 0.0,
+        compression: str = "gzip",
+        retention: int = 5,
+    ):
         """
         Initializes the Logger class.
 
             - log_path: str - the path to the log file
-            - queue: Queue - the queue object
+            - queue: Queue - the queue object, bounded by its maxsize
+            - batch_size: int - the maximum number of messages written at once (optional)
+            - flush_interval: float - the maximum number of seconds a written message waits to be flushed (optional)
+            - flush_bytes: int - the number of written bytes which triggers a flush (optional)
+            - format: str - 'text' or 'json' (one JSON object per line) (optional)
+            - max_bytes: int - the size which triggers a rotation, 0 to disable (optional)
+            - rotate_every: float - the age in seconds which triggers a rotation, 0 to disable (optional)
+            - compression: str - the compression of the rotated segments: 'none', 'gzip' or 'zstd' (optional)
+            - retention: int - the number of rotated segments kept, 0 to keep all of them (optional)
 
         Returns: None
         """
-        super().__init__()
+        super().__init__(name="logger", daemon=True)
         if not isinstance(log_path, str):
             raise TypeError("log_path must be a string")
         if not os.path.isabs(log_path):
             raise ValueError("log_path must be an absolute or valid path")
+        if format not in Logger.FORMATS:
+            raise ValueError(f"Unknown log format ({format})")
+        if compression not in Logger.COMPRESSIONS:
+            raise ValueError(f"Unknown or unavailable log compression ({compression})")
         self.log_path = log_path
         self.queue = queue
-        self._stop = threading.Event()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.format = format
+        self.max_bytes = max_bytes
+        self.rotate_every = rotate_every
+        self.compression = compression
+        self.retention = retention
+        self.dropped = 0
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._second = None
+        self._timestamp = ""
+        self._file = None
+        self._size = 0
+        self._rotate_at = None
+        self._segment = re.compile(
+            re.escape(os.path.basename(log_path)) + r"\.(\d{8}-\d{6})(?:-(\d+))?(?:\.gz|\.zst)?$"
+        )
+
+    def put(self, msg: str, level: int, **fields) -> bool:
+        """
+        Puts a message in the queue without blocking. If the queue is full, the message is dropped and counted.
+
+            - msg: str - the message to log
+            - level: int - the severity level of the message
+            - fields: any - structured data written with the message in the json format (e.g. command, duration)
 
-    def log(self, msg: str, level: int) -> str:
+        Returns: bool - True if the message was queued, False if it was dropped
+        """
+        try:
+            self.queue.put_nowait((msg, level, fields))
+            return True
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def log(self, msg: str, level: int, fields: dict = None) -> str:
         """
         Logs the message to the log file.
         The message is formatted as follows: (<timestamp>)[<severity>] - <msg>
+        or, in the json format: {"time": <ISO 8601 timestamp>, "level": <severity>, "message": <msg>, <fields>...}
 
             - msg: str - the message to be logged
             - level: int - the severity level of the message
+            - fields: dict - structured data written with the message in the json format (optional)
 
         Returns: str - the formatted message
         """
+        now = time.time()
+        second = int(now)
+        if second != self._second:
+            # the timestamp only changes once per second, so it is formatted once per second
+            self._second = second
+            pattern = "%Y-%m-%dT%H:%M:%S" if self.format == "json" else "(%d/%m/%Y, %H:%M:%S)"
+            self._timestamp = time.strftime(pattern, time.localtime(now))
 
-        timestamp = datetime.now().strftime("(%d/%m/%Y, %H:%M:%S)")
-
-        severity = "[INFO]"
-        match level:
-            case Logger.WARNING:
-                severity = "[WARNING]"
-            case Logger.ERROR:
-                severity = "[ERROR]"
-            case Logger.CRITICAL:
-                severity = "[CRITICAL]"
-            case _:
-                pass
-
-        return f"{timestamp}{severity} - {msg}\n"
+        severity = Logger.LEVELS.get(level, "INFO")
+        if self.format == "json":
+            record = {"time": f"{self._timestamp}.{int(now * 1000) % 1000:03d}", "level": severity, "message": msg}
+            record.update(fields or {})
+            return json.dumps(record, default=str) + "\n"
+        return f"{self._timestamp}[{severity}] - {msg}\n"
 
     def stop(self) -> None:
-        """Stops the logger thread."""
-        self._stop.set()
+        """Stops the logger thread once the queued messages are written."""
+        try:
+            # the thread is draining the queue, so a free slot comes up quickly even if it is full
+            self.queue.put(None, timeout=5.0)
+        except Full:
+            pass
 
     def run(self) -> None:
         """Starts the execution of the logger thread."""
-        with open(self.log_path, "w") as file:
-            file.write(self.log("Logger initialized successfully.", Logger.INFO))
-            while not self._stop.is_set():
-                if self.queue.empty():
-                    time.sleep(0.2)
-                    continue
-                msg, level = self.queue.get()
-                file.write(self.log(msg, level))
-            while not self.queue.empty():
-                msg, level = self.queue.get()
-                file.write(self.log(msg, level))
-            file.flush()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-rotation") as rotation:
+            self._open()
+            try:
+                self._write(rotation)
+            finally:
+                self._file.close()
+
+    def _write(self, rotation: ThreadPoolExecutor) -> None:
+        """Writes the messages of the queue until the logger is stopped."""
+        self._file.write(self.log("Logger initialized successfully.", Logger.INFO))
+        self._file.flush()
+        unflushed, last_flush = 0, time.monotonic()
+        stopping = False
+        while True:
+            if stopping:
+                timeout = 0.0
+            elif unflushed:
+                timeout = max(last_flush + self.flush_interval - time.monotonic(), 0.0)
+            else:
+                # nothing to flush, so the thread sleeps until a message comes
+                timeout = None
+            items = self._take(timeout)
+            if stopping and not items:
+                break
+            stopping = stopping or None in items
+
+            lines = [self.log(*item) for item in items if item is not None]
+            with self._lock:
+                dropped, self._reported = self.dropped - self._reported, self.dropped
+            if dropped:
+                lines.append(self.log(f"{dropped} log message(s) dropped, the log queue was full.", Logger.WARNING))
+            if lines:
+                text = "".join(lines)
+                self._file.write(text)
+                unflushed += len(text)
+                self._size += len(text)
+
+            if self._rotation_due():
+                self._rotate(rotation)
+                unflushed, last_flush = 0, time.monotonic()
+            elif unflushed and (
+                unflushed >= self.flush_bytes or time.monotonic() - last_flush >= self.flush_interval
+            ):
+                self._file.flush()
+                unflushed, last_flush = 0, time.monotonic()
+
+    def _take(self, timeout: float) -> list:
+        """
+        Waits up to 'timeout' seconds (forever if None) for a message, then takes the ones already waiting.
+
+            - timeout: float - the number of seconds to wait for the first message
+
+        Returns: list - at most 'batch_size' (msg, level, fields) tuples, None standing for the stop signal
+        """
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except Empty:
+            return []
+        while len(items) < self.batch_size and items[-1] is not None:
+            try:
+                items.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return items
+
+    def _open(self) -> None:
+        """Opens the log file for appending and schedules its next rotation."""
+        self._file = open(self.log_path, "a", buffering=max(self.flush_bytes, io.DEFAULT_BUFFER_SIZE))
+        self._size = self._file.tell()
+        self._rotate_at = time.time() + self.rotate_every if self.rotate_every else None
+
+    def _rotation_due(self) -> bool:
+        """Checks if the log file reached its maximum size or age."""
+        if self.max_bytes and self._size >= self.max_bytes:
+            return True
+        return self._rotate_at is not None and time.time() >= self._rotate_at
+
+    def _rotate(self, rotation: ThreadPoolExecutor) -> None:
+        """
+        Renames the log file to a new segment and opens a new log file. The segment is compressed and the old
+        segments are removed on the rotation thread.
+
+            - rotation: ThreadPoolExecutor - the rotation thread
+
+        Returns: None
+        """
+        self._file.close()
+        segment = f"{self.log_path}.{time.strftime('%Y%m%d-%H%M%S')}"
+        candidate, index = segment, 0
+        while any(os.path.exists(candidate + extension) for extension in Logger.EXTENSIONS):
+            index += 1
+            candidate = f"{segment}-{index}"
+        os.replace(self.log_path, candidate)
+        self._open()
+        rotation.submit(self._archive, candidate)
+
+    def _archive(self, segment: str) -> None:
+        """Compresses a rotated segment and removes the oldest segments beyond the retention count."""
+        if self.compression == "gzip":
+            with open(segment, "rb") as source, gzip.open(segment + ".gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(segment)
+        elif self.compression == "zstd":
+            with open(segment, "rb") as source, open(segment + ".zst", "wb") as target:
+                zstandard.ZstdCompressor().copy_stream(source, target)
+            os.remove(segment)
+
+        if not self.retention:
+            return
+        folder = os.path.dirname(self.log_path)
+        segments = []
+        for name in os.listdir(folder):
+            if match := self._segment.match(name):
+                segments.append((match.group(1), int(match.group(2) or 0), name))
+        for _, _, name in sorted(segments)[: -self.retention]:
+            os.remove(os.path.join(folder, name))
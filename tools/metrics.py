@@ -0,0 +1,313 @@
+"""Module responsible for measuring the activity of the application."""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+class Histogram:
+    """A thread-safe latency histogram with fixed buckets, in the layout of Prometheus histograms."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        """
+        Initializes the Histogram class.
+
+            - buckets: tuple - the upper bounds of the buckets, in seconds and in increasing order (optional)
+
+        Returns: None
+        """
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Adds a value to the bucket whose bound is the first one greater than or equal to it."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """
+        Returns the state of the histogram.
+
+        Returns: dict - the 'count' and 'sum' of the values and the cumulative 'buckets' as (bound, count) pairs,
+        the last bound being infinity
+        """
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {"count": cumulative, "sum": total, "buckets": buckets}
+
+    @staticmethod
+    def quantile(snapshot: dict, q: float) -> float:
+        """
+        Estimates a quantile from a snapshot, interpolating linearly inside the bucket which contains it.
+
+            - snapshot: dict - the value returned by snapshot()
+            - q: float - the quantile, between 0 and 1
+
+        Returns: float - the estimated value, None if the histogram is empty
+        """
+        if snapshot["count"] == 0:
+            return None
+        rank = q * snapshot["count"]
+        lower, below = 0.0, 0
+        for bound, cumulative in snapshot["buckets"]:
+            if cumulative >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - below) / max(cumulative - below, 1)
+            lower, below = bound, cumulative
+        return lower
+
+
+class Metrics:
+    """
+    The metrics of the application: a latency histogram, the outcomes and the database queries of every command,
+    counters, and values read from the other components when the metrics are collected.
+
+    The queries are counted for the command running on the current thread, see command().
+    """
+
+    PREFIX = "songstorage"
+    BACKGROUND = "background"
+
+    def __init__(self):
+        """Initializes the Metrics class."""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._commands = {}
+        self._counters = {}
+        self._collectors = []
+
+    @contextmanager
+    def command(self, name: str):
+        """
+        Measures the block as an execution of the command 'name': its duration, whether it raised and the queries
+        run on the current thread meanwhile. Nested blocks are measured as well.
+
+            - name: str - the name of the command
+
+        Returns: None
+        """
+        previous = getattr(self._local, "command", None)
+        self._local.command = name
+        started = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            elapsed = time.perf_counter() - started
+            self._local.command = previous
+            stats = self._command_stats(name)
+            stats["latency"].observe(elapsed)
+            with self._lock:
+                stats[status] += 1
+
+    def query(self, seconds: float) -> None:
+        """
+        Counts a database query for the command running on the current thread.
+
+            - seconds: float - the time spent on the query
+
+        Returns: None
+        """
+        stats = self._command_stats(getattr(self._local, "command", None) or Metrics.BACKGROUND)
+        with self._lock:
+            stats["queries"] += 1
+            stats["querySeconds"] += seconds
+
+    def add(self, name: str, value: float = 1) -> None:
+        """
+        Increments a counter.
+
+            - name: str - the name of the counter
+            - value: float - the increment (optional)
+
+        Returns: None
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register(self, name: str, type: str, help: str, collect) -> None:
+        """
+        Registers a value read from another component when the metrics are collected.
+
+            - name: str - the name of the metric, without the prefix
+            - type: str - 'counter' or 'gauge'
+            - help: str - the description of the metric
+            - collect: callable - returns the value, or a list of (labels: dict, value) pairs
+
+        Returns: None
+        """
+        self._collectors.append((name, type, help, collect))
+
+    def _command_stats(self, name: str) -> dict:
+        """Returns the statistics of a command, creating them the first time."""
+        with self._lock:
+            if name not in self._commands:
+                self._commands[name] = {"latency": Histogram(), "ok": 0, "error": 0, "queries": 0, "querySeconds": 0.0}
+            return self._commands[name]
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current values of the metrics.
+
+        Returns: dict - the 'commands' (histogram snapshot, outcomes and queries of every command), the 'counters'
+        and the 'collected' values as {name: (type, help, [(labels, value)])}
+        """
+        with self._lock:
+            commands = {name: dict(stats) for name, stats in self._commands.items()}
+            counters = dict(self._counters)
+        for stats in commands.values():
+            stats["latency"] = stats["latency"].snapshot()
+
+        collected = {}
+        for name, type, help, collect in self._collectors:
+            value = collect()
+            collected[name] = (type, help, value if isinstance(value, list) else [({}, value)])
+        return {"commands": commands, "counters": counters, "collected": collected}
+
+    def report(self) -> str:
+        """Returns a human readable report of the metrics, for the 'stats' console command."""
+        data = self.snapshot()
+        lines = ["Commands:"]
+        for name, stats in sorted(data["commands"].items()):
+            latency = stats["latency"]
+            executions = stats["ok"] + stats["error"]
+            if executions == 0:
+                lines.append(
+                    f"   {name}: {stats['queries']} queries in {stats['querySeconds']:.3f}s outside of the commands"
+                )
+                continue
+            quantiles = ", ".join(
+                f"p{int(q * 100)} {Histogram.quantile(latency, q) * 1000:.1f} ms" for q in (0.5, 0.95, 0.99)
+            )
+            lines.append(
+                f"   {name}: {stats['ok']} ok, {stats['error']} failed, {quantiles}, "
+                f"avg {latency['sum'] / executions * 1000:.1f} ms, "
+                f"{stats['queries'] / executions:.1f} queries and {stats['querySeconds'] / executions * 1000:.1f} ms "
+                "in the database per command"
+            )
+        if len(lines) == 1:
+            lines.append("   no command executed yet")
+
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f"{name}: {Metrics._format(value)}")
+        for name, (_, help, values) in data["collected"].items():
+            for labels, value in values:
+                label = " ".join(f"{key}={item}" for key, item in labels.items())
+                lines.append(f"{help}{f' ({label})' if label else ''}: {Metrics._format(value)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format(value: float) -> str:
+        """Formats a value of the report."""
+        return str(value) if isinstance(value, int) else f"{value:.3f}"
+
+    def prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        data = self.snapshot()
+        prefix = Metrics.PREFIX
+        lines = [
+            f"# HELP {prefix}_command_duration_seconds The duration of the commands.",
+            f"# TYPE {prefix}_command_duration_seconds histogram",
+        ]
+        for name, stats in sorted(data["commands"].items()):
+            latency = stats["latency"]
+            if latency["count"] == 0:
+                continue
+            for bound, count in latency["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_command_duration_seconds_bucket{{command="{name}",le="{le}"}} {count}')
+            lines.append(f'{prefix}_command_duration_seconds_sum{{command="{name}"}} {latency["sum"]}')
+            lines.append(f'{prefix}_command_duration_seconds_count{{command="{name}"}} {latency["count"]}')
+
+        lines += [
+            f"# HELP {prefix}_commands_total The number of commands executed, by outcome.",
+            f"# TYPE {prefix}_commands_total counter",
+        ]
+        for name, stats in sorted(data["commands"].items()):
+            for status in ("ok", "error"):
+                if stats["ok"] + stats["error"]:
+                    lines.append(f'{prefix}_commands_total{{command="{name}",status="{status}"}} {stats[status]}')
+
+        for metric, key, help in (
+            ("queries_total", "queries", "The number of database queries, by command."),
+            ("query_seconds_total", "querySeconds", "The time spent on database queries, by command."),
+        ):
+            lines += [f"# HELP {prefix}_{metric} {help}", f"# TYPE {prefix}_{metric} counter"]
+            for name, stats in sorted(data["commands"].items()):
+                lines.append(f'{prefix}_{metric}{{command="{name}"}} {stats[key]}')
+
+        for name, value in sorted(data["counters"].items()):
+            lines += [f"# TYPE {prefix}_{name} counter", f"{prefix}_{name} {value}"]
+        for name, (type, help, values) in data["collected"].items():
+            lines += [f"# HELP {prefix}_{name} {help}.", f"# TYPE {prefix}_{name} {type}"]
+            for labels, value in values:
+                label = ",".join(f'{key}="{item}"' for key, item in labels.items())
+                lines.append(f"{prefix}_{name}{{{label}}} {value}" if label else f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Atomically writes the metrics to a file, for the textfile collector of node_exporter.
+
+            - path: str - the path of the file, which should end with .prom
+
+        Returns: None
+        """
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.prometheus())
+        os.replace(temporary, path)
+
+
+class MetricsExporter(threading.Thread):
+    """A thread which writes the metrics to a textfile every 'interval' seconds, and once more when it is stopped."""
+
+    def __init__(self, metrics: Metrics, path: str, interval: float, log=None):
+        """
+        Initializes the MetricsExporter class.
+
+            - metrics: Metrics - the metrics to export
+            - path: str - the path of the textfile
+            - interval: float - the number of seconds between two writes
+            - log: callable - receives the error message if a write fails (optional)
+
+        Returns: None
+        """
+        super().__init__(name="metrics-exporter", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._log = log
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        """Starts the execution of the exporter thread."""
+        while not self._stopping.wait(self.interval):
+            self._export()
+        self._export()
+
+    def stop(self) -> None:
+        """Stops the exporter thread after a last write."""
+        self._stopping.set()
+        self.join()
+
+    def _export(self) -> None:
+        """Writes the textfile, logging the errors instead of stopping the thread."""
+        try:
+            self.metrics.write_textfile(self.path)
+        except OSError as e:
+            if self._log is not None:
+                self._log(f"Metrics textfile couldn't be written. {str(e).strip()}")
@@ -0,0 +1,177 @@
+"""Module which defines the forward migrations applied on top of the tables from tools/tables.py."""
+
+
+class Migrations:
+    """
+    A class which provides static methods to fetch the schema migrations.
+
+    The tables created by Tables.fetch_templates() are version 0. Every migration upgrades the schema by one
+    version and is applied at most once, its version being recorded in the 'SchemaVersion' table.
+    """
+
+    @staticmethod
+    def fetch_version_table() -> str:
+        """Returns the template for the SchemaVersion table."""
+        return """
+            CREATE TABLE IF NOT EXISTS "SchemaVersion" (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                appliedAt TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """
+
+    @staticmethod
+    def fetch_migrations() -> list[tuple[int, str, list[str]]]:
+        """Returns a list of (version, description, statements) tuples, ordered by version."""
+        return [
+            (1, "Indexes and unique constraints", Migrations._indexes()),
+            (2, "Full-text search vector", Migrations._search_vector()),
+            (3, "Content digest", Migrations._digest()),
+        ]
+
+    @staticmethod
+    def _indexes() -> list[str]:
+        """
+        Returns the statements of migration 1: unique names, unique relations and the lookup indexes.
+        Duplicated names and relations are merged first so the unique indexes can be built.
+        """
+        statements = []
+        for table, relation, column in (
+            ("Artist", "SongArtist", "artistId"),
+            ("Tag", "SongTag", "tagId"),
+        ):
+            duplicates = f"""
+                SELECT id, MIN(id) OVER (PARTITION BY name) AS keep FROM "{table}"
+            """
+            statements.extend(
+                [
+                    f"""
+                    UPDATE "{relation}" SET {column} = duplicate.keep
+                    FROM ({duplicates}) AS duplicate
+                    WHERE "{relation}".{column} = duplicate.id AND duplicate.id <> duplicate.keep
+                    """,
+                    f"""
+                    DELETE FROM "{table}" USING ({duplicates}) AS duplicate
+                    WHERE "{table}".id = duplicate.id AND duplicate.id <> duplicate.keep
+                    """,
+                    f"""
+                    DELETE FROM "{relation}" AS relation USING "{relation}" AS other
+                    WHERE relation.songId = other.songId AND relation.{column} = other.{column}
+                    AND relation.id > other.id
+                    """,
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_name_key" ON "{table}" (name)',
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS "{relation}_song_{table.lower()}_key" '
+                    f'ON "{relation}" (songId, {column})',
+                    f'CREATE INDEX IF NOT EXISTS "{relation}_{column}_idx" ON "{relation}" ({column})',
+                ]
+            )
+
+        statements.extend(
+            [
+                'CREATE INDEX IF NOT EXISTS "Song_filePath_idx" ON "Song" (filePath)',
+                'CREATE INDEX IF NOT EXISTS "Song_releaseDate_idx" ON "Song" (releaseDate)',
+                Migrations._trigram_indexes(),
+            ]
+        )
+        return statements
+
+    @staticmethod
+    def _trigram_indexes() -> str:
+        """
+        Returns the statement creating the trigram indexes used by the LIKE '%x%' search predicates.
+        They are skipped, with a notice, on servers where the pg_trgm extension is not available or can't be created.
+        """
+        return """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                    RAISE NOTICE 'pg_trgm is not available, skipping the trigram indexes';
+                    RETURN;
+                END IF;
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS "Song_name_trgm_idx" ON "Song" USING gin (LOWER(name) gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS "Artist_name_trgm_idx" ON "Artist" USING gin (LOWER(name) gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS "Tag_name_trgm_idx" ON "Tag" USING gin (LOWER(name) gin_trgm_ops);
+            EXCEPTION WHEN insufficient_privilege THEN
+                RAISE NOTICE 'Not allowed to create pg_trgm, skipping the trigram indexes';
+            END
+            $$
+        """
+
+    @staticmethod
+    def _search_vector() -> list[str]:
+        """
+        Returns the statements of migration 2: a tsvector column over the song name (weight A), its artists (weight B)
+        and its tags (weight C), kept up to date by triggers and indexed with GIN.
+        """
+        statements = [
+            'ALTER TABLE "Song" ADD COLUMN IF NOT EXISTS searchVector tsvector',
+            """
+            CREATE OR REPLACE FUNCTION song_search_vector(song_id INTEGER, song_name TEXT) RETURNS tsvector AS $$
+                SELECT setweight(to_tsvector('simple', COALESCE(song_name, '')), 'A')
+                    || setweight(to_tsvector('simple', COALESCE((
+                        SELECT string_agg("Artist".name, ' ') FROM "SongArtist"
+                        JOIN "Artist" ON "SongArtist".artistId = "Artist".id
+                        WHERE "SongArtist".songId = song_id), '')), 'B')
+                    || setweight(to_tsvector('simple', COALESCE((
+                        SELECT string_agg("Tag".name, ' ') FROM "SongTag"
+                        JOIN "Tag" ON "SongTag".tagId = "Tag".id
+                        WHERE "SongTag".songId = song_id), '')), 'C')
+            $$ LANGUAGE sql STABLE
+            """,
+            """
+            CREATE OR REPLACE FUNCTION song_search_vector_row() RETURNS trigger AS $$
+            BEGIN
+                NEW.searchVector := song_search_vector(NEW.id, NEW.name);
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE OR REPLACE FUNCTION song_search_vector_relations() RETURNS trigger AS $$
+            BEGIN
+                UPDATE "Song" SET searchVector = song_search_vector(id, name)
+                WHERE id IN (SELECT songId FROM changed);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            'DROP TRIGGER IF EXISTS song_search_vector ON "Song"',
+            """
+            CREATE TRIGGER song_search_vector BEFORE INSERT OR UPDATE OF name ON "Song"
+            FOR EACH ROW EXECUTE FUNCTION song_search_vector_row()
+            """,
+        ]
+
+        for relation in ("SongArtist", "SongTag"):
+            for event, table in (("INSERT", "NEW"), ("DELETE", "OLD")):
+                trigger = f"{relation.lower()}_search_vector_{event.lower()}"
+                statements.extend(
+                    [
+                        f'DROP TRIGGER IF EXISTS {trigger} ON "{relation}"',
+                        f"""
+                        CREATE TRIGGER {trigger} AFTER {event} ON "{relation}"
+                        REFERENCING {table} TABLE AS changed
+                        FOR EACH STATEMENT EXECUTE FUNCTION song_search_vector_relations()
+                        """,
+                    ]
+                )
+
+        statements.extend(
+            [
+                'UPDATE "Song" SET searchVector = song_search_vector(id, name)',
+                'CREATE INDEX IF NOT EXISTS "Song_searchVector_idx" ON "Song" USING gin (searchVector)',
+            ]
+        )
+        return statements
+
+    @staticmethod
+    def _digest() -> list[str]:
+        """
+        Returns the statements of migration 3: the digest of the song's content, set when the storage folder uses the
+        content-addressed layout, and its index, used to find the songs sharing a file.
+        """
+        return [
+            'ALTER TABLE "Song" ADD COLUMN IF NOT EXISTS digest VARCHAR(128)',
+            'CREATE INDEX IF NOT EXISTS "Song_digest_idx" ON "Song" (digest)',
+        ]
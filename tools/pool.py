@@ -0,0 +1,185 @@
+"""Module responsible for pooling the connections to the database."""
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A psycopg2 connection which keeps the bookkeeping needed by the pool."""
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initializes the PooledConnection class.
+
+            - args, kwargs - forwarded to psycopg2.extensions.connection
+
+        Returns: None
+        """
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self.prepared = set()
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections with checkout/return semantics.
+
+    Connections are created lazily up to 'max_size' and are health checked when they are
+    checked out after being idle for more than 'health_check' seconds.
+    """
+
+    def __init__(
+        self,
+        connection: dict,
+        min_size: int = 1,
+        max_size: int = 4,
+        timeout: float = 10.0,
+        health_check: float = 30.0,
+    ):
+        """
+        Initializes the ConnectionPool class.
+
+            - connection: dict - a dictionary containing the connection parameters
+            - min_size: int - the number of connections opened up front (optional)
+            - max_size: int - the maximum number of open connections (optional)
+            - timeout: float - seconds to wait for a free connection before failing (optional)
+            - health_check: float - idle seconds after which a connection is checked before reuse (optional)
+
+        Keys: host, port, database, user, password
+        Returns: None
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= minSize <= maxSize and maxSize >= 1.")
+
+        self._params = connection
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check = health_check
+
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self) -> PooledConnection:
+        """Opens a new connection to the database."""
+        return psycopg2.connect(connection_factory=PooledConnection, **self._params)
+
+    def acquire(self) -> PooledConnection:
+        """
+        Checks out a connection from the pool, waiting for one to be returned if the pool is exhausted.
+
+        Returns: PooledConnection - a healthy connection which must be given back with release()
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed.")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError(
+                        f"No database connection available after {self.timeout}s (pool size {self.max_size})."
+                    )
+                self._cond.wait(remaining)
+
+        if conn is not None and self._healthy(conn):
+            return conn
+
+        if conn is not None:
+            self._close_quietly(conn)
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: PooledConnection) -> None:
+        """
+        Returns a connection to the pool. Unfinished transactions are rolled back and broken connections are discarded.
+
+            - conn: PooledConnection - the connection obtained from acquire()
+
+        Returns: None
+        """
+        if not conn.closed:
+            try:
+                if (
+                    conn.get_transaction_status()
+                    != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    conn.rollback()
+            except psycopg2.Error:
+                self._close_quietly(conn)
+
+        with self._cond:
+            if conn.closed or self._closed:
+                self._close_quietly(conn)
+                self._size -= 1
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Closes the idle connections and refuses further checkouts. Checked out connections are closed on release."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close_quietly(self._idle.pop())
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Returns a dictionary with the current size of the pool."""
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "inUse": self._size - len(self._idle),
+                "maxSize": self.max_size,
+            }
+
+    def _healthy(self, conn: PooledConnection) -> bool:
+        """
+        Checks if an idle connection can still be used.
+
+            - conn: PooledConnection - the connection to check
+
+        Returns: bool - True if the connection is usable, False otherwise
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn: PooledConnection) -> None:
+        """Closes a connection, ignoring the errors of an already broken one."""
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
@@ -0,0 +1,183 @@
+"""Module responsible for profiling the statements executed on the database."""
+import json
+import random
+import re
+import threading
+import time
+from tools.metrics import Histogram
+
+
+class QueryProfiler:
+    """
+    Times the statements executed through the Repository and aggregates them by fingerprint: the statement with its
+    literals and parameters replaced by '?', so the executions of the same statement with different values add up.
+
+    The statements slower than 'threshold' seconds are logged, and a 'sample_rate' fraction of the read-only ones
+    is executed again with EXPLAIN (ANALYZE, BUFFERS), their plan being appended to the 'plans' file.
+    """
+
+    BUCKETS = (0.0001, 0.00025, 0.0005) + Histogram.BUCKETS
+    MAX_FINGERPRINTS = 1000
+    OTHER = "<other statements>"
+    EXPLAINABLE = ("select", "execute")
+
+    _COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+    _STRINGS = re.compile(r"'(?:[^']|'')*'")
+    _VALUES = re.compile(r"%s|\$\d+|\b\d+(?:\.\d+)?\b")
+    _LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _SPACES = re.compile(r"\s+")
+
+    def __init__(self, threshold: float = 0.5, sample_rate: float = 0.0, plans: str = None, log=None):
+        """
+        Initializes the QueryProfiler class.
+
+            - threshold: float - the duration in seconds above which a statement is logged as slow (optional)
+            - sample_rate: float - the fraction of the read-only statements whose plan is captured, 0 to 1 (optional)
+            - plans: str - the path of the JSON lines file the plans are appended to (optional)
+            - log: callable - receives the slow statement messages and their fields (optional)
+
+        Returns: None
+        """
+        self.threshold = threshold
+        self.sample_rate = sample_rate if plans else 0.0
+        self.plans = plans
+        self._log = log
+        self._lock = threading.Lock()
+        self._plans_lock = threading.Lock()
+        self._statements = {}
+
+    @staticmethod
+    def fingerprint(statement: str) -> str:
+        """
+        Normalizes a statement: comments are removed, literals and placeholders become '?', lists of values
+        become '(?, ...)' and whitespace is collapsed.
+
+            - statement: str - the SQL statement
+
+        Returns: str - the fingerprint of the statement
+        """
+        statement = QueryProfiler._COMMENTS.sub(" ", statement)
+        statement = QueryProfiler._STRINGS.sub("?", statement)
+        statement = QueryProfiler._VALUES.sub("?", statement)
+        statement = QueryProfiler._LISTS.sub("(?, ...)", statement)
+        return QueryProfiler._SPACES.sub(" ", statement).strip()
+
+    def record(self, statement: str, seconds: float, rows: int) -> str:
+        """
+        Adds an execution of a statement to the aggregates of its fingerprint and logs it if it was slow.
+
+            - statement: str - the SQL statement
+            - seconds: float - the time spent on the statement
+            - rows: int - the number of rows returned (or changed, for commands)
+
+        Returns: str - the fingerprint of the statement
+        """
+        fingerprint = QueryProfiler.fingerprint(statement)
+        with self._lock:
+            key = fingerprint
+            if key not in self._statements and len(self._statements) >= QueryProfiler.MAX_FINGERPRINTS:
+                key = QueryProfiler.OTHER
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = {
+                    "count": 0,
+                    "seconds": 0.0,
+                    "max": 0.0,
+                    "rows": 0,
+                    "latency": Histogram(QueryProfiler.BUCKETS),
+                }
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["rows"] += rows
+        stats["latency"].observe(seconds)
+
+        if seconds >= self.threshold and self._log is not None:
+            self._log(
+                f"Slow statement ({seconds * 1000:.1f} ms, {rows} row(s)): {fingerprint}",
+                fingerprint=fingerprint,
+                duration=round(seconds, 6),
+                rows=rows,
+            )
+        return fingerprint
+
+    def sample(self, statement: str, query: bool) -> bool:
+        """
+        Decides if the plan of a statement is captured. Only read-only statements (queries starting with SELECT or
+        EXECUTE) are explained, since EXPLAIN ANALYZE executes the statement again.
+
+            - statement: str - the SQL statement
+            - query: bool - whether the statement was executed as a query (Repository.QUERY) or not
+
+        Returns: bool - True if the plan of the statement should be captured
+        """
+        if not query or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        words = statement.lstrip().split(None, 1)
+        return bool(words) and words[0].lower() in QueryProfiler.EXPLAINABLE
+
+    def save_plan(self, fingerprint: str, seconds: float, plan: list[str]) -> None:
+        """
+        Appends the plan of a statement to the plans file, as a JSON line.
+
+            - fingerprint: str - the fingerprint of the statement
+            - seconds: float - the time the profiled execution took
+            - plan: list[str] - the lines returned by EXPLAIN
+
+        Returns: None
+        """
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "fingerprint": fingerprint,
+            "duration": round(seconds, 6),
+            "plan": "\n".join(plan),
+        }
+        try:
+            with self._plans_lock, open(self.plans, "a") as file:
+                file.write(json.dumps(record) + "\n")
+        except OSError as e:
+            if self._log is not None:
+                self._log(f"Query plan couldn't be saved. {str(e).strip()}")
+
+    def snapshot(self) -> dict:
+        """
+        Returns the aggregates of every fingerprint.
+
+        Returns: dict - {fingerprint: {count, seconds, max, rows, p50, p95}}
+        """
+        with self._lock:
+            items = [(fingerprint, dict(stats)) for fingerprint, stats in self._statements.items()]
+        result = {}
+        for fingerprint, stats in items:
+            latency = stats.pop("latency").snapshot()
+            # the quantiles are interpolated inside the buckets, so they can't be trusted past the maximum
+            stats["p50"] = min(Histogram.quantile(latency, 0.5), stats["max"])
+            stats["p95"] = min(Histogram.quantile(latency, 0.95), stats["max"])
+            result[fingerprint] = stats
+        return result
+
+    def report(self, limit: int = 10) -> str:
+        """
+        Returns a report of the statements which took the most time overall.
+
+            - limit: int - the number of statements in the report (optional)
+
+        Returns: str - the report, one statement per line
+        """
+        statements = sorted(self.snapshot().items(), key=lambda item: item[1]["seconds"], reverse=True)
+        lines = [f"Statements (top {limit} by total time):"]
+        for fingerprint, stats in statements[:limit]:
+            lines.append(
+                "   {:.1f} ms total, {} call(s), p50 {:.2f} ms, p95 {:.2f} ms, max {:.2f} ms, {} row(s): {}".format(
+                    stats["seconds"] * 1000,
+                    stats["count"],
+                    stats["p50"] * 1000,
+                    stats["p95"] * 1000,
+                    stats["max"] * 1000,
+                    stats["rows"],
+                    fingerprint if len(fingerprint) <= 200 else fingerprint[:197] + "...",
+                )
+            )
+        if len(lines) == 1:
+            lines.append("   no statement executed yet")
+        return "\n".join(lines)
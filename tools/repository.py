@@ -1,6 +1,16 @@
 """Module responsible with handling the database connection."""
+import threading
+import time
+import itertools
+from contextlib import contextmanager, suppress
+from typing import Iterator
 import psycopg2
+import psycopg2.extras
 from .tables import Tables
+from .migrations import Migrations
+from .pool import ConnectionPool, PooledConnection
+from .statements import Statements
+from .cache import LRUCache
 
 
 class Repository:
@@ -13,266 +23,618 @@ class Repository:
     QUERY = 0
     COMMAND = 1
 
-    def __init__(self, connection: dict):
+    MIGRATION_LOCK = 7466251
+
+    _cursor_ids = itertools.count(1)
+
+    def __init__(self, connection: dict, pool: dict = None, cache: dict = None):
         """
         Initializes the Repository class.
 
             - connection: dict - a dictionary containing the connection parameters
+            - pool: dict - the pool settings (optional)
+            - cache: dict - the cache settings (optional)
 
         Keys: host, port, database, user, password
+        Pool keys: minSize, maxSize, timeout, healthCheck
+        Cache keys: names, searches, ttl, maxRows
         Returns: None
         """
-        self.conn = self.try_connection(**connection)
-        if self.conn is None:
-            raise Exception("Connection failed.")
+        pool = pool or {}
+        cache = cache or {}
+        self._pool = ConnectionPool(
+            connection,
+            min_size=pool.get("minSize", 1),
+            max_size=pool.get("maxSize", 4),
+            timeout=pool.get("timeout", 10.0),
+            health_check=pool.get("healthCheck", 30.0),
+        )
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._statement_stats = {}
+        self._artist_ids = LRUCache(cache.get("names", 4096))
+        self._tag_ids = LRUCache(cache.get("names", 4096))
+        self.search_cache = LRUCache(cache.get("searches", 256), cache.get("ttl", 300.0))
+        self.search_cache_rows = cache.get("maxRows", 10000)
+        self._generation = 0
+        self.catalog = None
+        self.metrics = None
+        self.profiler = None
+
+    @property
+    def pool_size(self) -> int:
+        """Returns the maximum number of connections the repository can use at once."""
+        return self._pool.max_size
+
+    @contextmanager
+    def session(self) -> PooledConnection:
+        """
+        Binds a pooled connection to the current thread for the duration of the block.
+        Nested sessions on the same thread reuse the outer connection.
+
+        Returns: PooledConnection - the connection bound to the current thread
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
 
-    def try_connection(self, **kwargs) -> psycopg2.connect:
+        conn = self._pool.acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._pool.release(conn)
+
+    @property
+    def in_transaction(self) -> bool:
+        """Returns True if the current thread is inside a transaction() block."""
+        return getattr(self._local, "transaction", None) is not None
+
+    @contextmanager
+    def transaction(self) -> PooledConnection:
         """
-        Tries to connect to the database.
+        Runs the block as a single unit of work: the commands executed inside it are not committed one by one,
+        the whole block is committed once at its end, or rolled back if it raises. Nested blocks join the outer one.
 
-                - kwargs: dict - a dictionary containing the connection parameters
+        The callbacks registered with on_commit() run after the commit and the ones registered with on_rollback()
+        run, in reverse order, after a rollback; their errors are ignored so the error which caused the rollback is raised.
 
-        Keys: host, port, database, user, password
-        Returns: None | psycopg2.connection - the connection object or None if the connection failed
+        Returns: PooledConnection - the connection of the transaction
         """
-        conn = psycopg2.connect(**kwargs)
-        return conn
+        with self.session() as conn:
+            if self.in_transaction:
+                yield conn
+                return
+
+            transaction = self._local.transaction = {"commit": [], "rollback": [], "dirty": False}
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                self._local.transaction = None
+                if not conn.closed:
+                    conn.rollback()
+                for callback in reversed(transaction["rollback"]):
+                    with suppress(Exception):
+                        callback()
+                raise
+            finally:
+                self._local.transaction = None
+
+            if transaction["dirty"]:
+                self.touch()
+            for callback in transaction["commit"]:
+                callback()
+
+    def on_commit(self, callback) -> None:
+        """
+        Registers a callback to run once the current transaction is committed, or right away outside of a transaction.
+
+            - callback: callable - the function to run, without arguments
+
+        Returns: None
+        """
+        transaction = getattr(self._local, "transaction", None)
+        if transaction is None:
+            callback()
+        else:
+            transaction["commit"].append(callback)
+
+    def on_rollback(self, callback) -> None:
+        """
+        Registers a callback to run if the current transaction is rolled back. Outside of a transaction it is ignored.
+
+            - callback: callable - the function to run, without arguments
+
+        Returns: None
+        """
+        transaction = getattr(self._local, "transaction", None)
+        if transaction is not None:
+            transaction["rollback"].append(callback)
+
+    @property
+    def generation(self) -> int:
+        """Returns the catalog generation, which changes every time a command is committed."""
+        return self._generation
+
+    def touch(self) -> None:
+        """Starts a new catalog generation, invalidating the cached search results."""
+        with self._stats_lock:
+            self._generation += 1
+        self.search_cache.clear()
 
     def close_connection(self) -> None:
-        """Closes the connection to the database."""
-        self.conn.close()
+        """Closes the connections to the database."""
+        self._pool.close()
+
+    def pool_stats(self) -> dict:
+        """Returns the current usage of the connection pool."""
+        return self._pool.stats()
 
     def clear_tables(self) -> None:
-        """Deletes all the tables from the database if they exist."""
-        cursor = self.conn.cursor()
-        table_names = ["Artist", "Song", "Tag", "SongArtist", "SongTag"]
+        """Deletes all the tables from the database if they exist, together with the cached ids."""
+        table_names = ["Artist", "Song", "Tag", "SongArtist", "SongTag", "SchemaVersion"]
 
-        for table_name in table_names:
-            cursor.execute(f'DROP TABLE IF EXISTS "{table_name}" CASCADE')
+        with self.session() as conn:
+            cursor = conn.cursor()
+            for table_name in table_names:
+                cursor.execute(f'DROP TABLE IF EXISTS "{table_name}" CASCADE')
 
-        cursor.close()
-        self.conn.commit()
+            cursor.close()
+            conn.commit()
+
+        self._artist_ids.clear()
+        self._tag_ids.clear()
+        self.touch()
 
     def create_tables(self) -> None:
         """Creates all the tables in the database."""
-        cursor = self.conn.cursor()
+        with self.session() as conn:
+            cursor = conn.cursor()
+            for table in Tables.fetch_templates():
+                cursor.execute(table)
 
-        for table in Tables.fetch_templates():
-            cursor.execute(table)
+            cursor.close()
+            conn.commit()
 
-        cursor.close()
-        self.conn.commit()
+    def migrate(self) -> list[int]:
+        """
+        Creates the missing tables and applies the migrations newer than the current schema version,
+        each one in its own transaction. Concurrent runs are serialized through an advisory lock.
 
-    def execute(self, command: str, type: int, fetchall: bool = True) -> list:
+        Returns: list[int] - the versions applied
+        """
+        self.create_tables()
+        self.execute(Migrations.fetch_version_table(), Repository.COMMAND, fetchall=False)
+
+        applied = []
+        with self.session() as conn:
+            for version, description, statements in Migrations.fetch_migrations():
+                self.execute(
+                    "SELECT pg_advisory_xact_lock(%s)",
+                    Repository.QUERY,
+                    params=(Repository.MIGRATION_LOCK,),
+                )
+                query = 'SELECT 1 FROM "SchemaVersion" WHERE version = %s'
+                if self.execute(query, Repository.QUERY, params=(version,)):
+                    conn.commit()
+                    continue
+
+                for statement in statements:
+                    self.execute(statement, Repository.QUERY, fetchall=False)
+
+                command = 'INSERT INTO "SchemaVersion" (version, description) VALUES (%s, %s)'
+                self.execute(
+                    command, Repository.COMMAND, fetchall=False, params=(version, description)
+                )
+                applied.append(version)
+
+        return applied
+
+    def execute(
+        self, command: str, type: int, fetchall: bool = True, params: tuple = None
+    ) -> list:
         """
         Executes a command or a query on the database.
+        Commands are committed right away, unless they run inside a transaction() block.
 
-            - command: str - the command to be executed
+            - command: str - the command to be executed, with %s placeholders for the parameters
             - type: int - the type of the command (Repository.COMMAND or Repository.QUERY)
             - fetchall: bool - whether to fetch all the results or not (default: True)
+            - params: tuple - the parameters bound to the placeholders (optional)
 
         Returns: list - the result of the command or query
         """
-        cursor = self.conn.cursor()
-        cursor.execute(command)
-        result = cursor.fetchall() if fetchall else None
-        cursor.close()
-        if type == Repository.COMMAND:
-            self.conn.commit()
+        with self.session() as conn:
+            transaction = getattr(self._local, "transaction", None)
+            cursor = conn.cursor()
+            started = time.perf_counter()
+            try:
+                cursor.execute(command, params)
+                result = cursor.fetchall() if fetchall else None
+                rows = len(result) if fetchall else max(cursor.rowcount, 0)
+            except psycopg2.Error:
+                if transaction is None:
+                    conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                elapsed = time.perf_counter() - started
+                if self.metrics is not None:
+                    self.metrics.query(elapsed)
+            if self.profiler is not None:
+                self._profile(conn, command, params, type, elapsed, rows)
+            if type == Repository.COMMAND and transaction is not None:
+                transaction["dirty"] = True
+            elif type == Repository.COMMAND:
+                conn.commit()
+                self.touch()
 
         return result
 
+    def stream(
+        self, query: str, params: tuple = None, fetch_size: int = 1000
+    ) -> Iterator[tuple]:
+        """
+        Executes a query through a named server-side cursor and yields its rows, fetching 'fetch_size' rows per round trip.
+        The connection stays bound to the current thread until the generator is exhausted or closed, and no command should
+        be committed on it in the meantime, since that would close the cursor.
+
+            - query: str - the query to be executed, with %s placeholders for the parameters
+            - params: tuple - the parameters bound to the placeholders (optional)
+            - fetch_size: int - the number of rows fetched per round trip (default: 1000)
+
+        Returns: Iterator[tuple] - the rows of the query
+        """
+        with self.session() as conn:
+            cursor = conn.cursor(name=f"stream_{next(Repository._cursor_ids)}")
+            cursor.itersize = fetch_size
+            started = time.perf_counter()
+            elapsed, count, completed = 0.0, 0, False
+            try:
+                cursor.execute(query, params)
+                rows = iter(cursor)
+                # only the time spent in the database is measured, not the time the consumer takes per row
+                while (row := next(rows, None)) is not None:
+                    elapsed += time.perf_counter() - started
+                    count += 1
+                    yield row
+                    started = time.perf_counter()
+                elapsed += time.perf_counter() - started
+                completed = True
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+            finally:
+                if self.metrics is not None:
+                    self.metrics.query(elapsed)
+                if not cursor.closed and not conn.closed:
+                    try:
+                        cursor.close()
+                    except psycopg2.Error:
+                        conn.rollback()
+            if completed and self.profiler is not None:
+                self._profile(conn, query, params, Repository.QUERY, elapsed, count)
+
+    def _profile(self, conn: PooledConnection, statement: str, params: tuple, type: int, seconds: float, rows: int) -> None:
+        """
+        Records an executed statement in the profiler and, if it is sampled, captures its plan with
+        EXPLAIN (ANALYZE, BUFFERS). The plan is captured inside a savepoint, so a failure doesn't abort the transaction.
+
+            - conn: PooledConnection - the connection the statement was executed on
+            - statement: str - the statement, with %s placeholders for the parameters
+            - params: tuple - the parameters bound to the placeholders
+            - type: int - the type of the statement (Repository.COMMAND or Repository.QUERY)
+            - seconds: float - the time spent on the statement
+            - rows: int - the number of rows returned or changed
+
+        Returns: None
+        """
+        fingerprint = self.profiler.record(statement, seconds, rows)
+        if not self.profiler.sample(statement, type == Repository.QUERY):
+            return
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SAVEPOINT explain_statement")
+            started = time.perf_counter()
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", params)
+            plan = [row[0] for row in cursor.fetchall()]
+            seconds = time.perf_counter() - started
+            cursor.execute("RELEASE SAVEPOINT explain_statement")
+        except psycopg2.Error:
+            with suppress(psycopg2.Error):
+                cursor.execute("ROLLBACK TO SAVEPOINT explain_statement")
+            return
+        finally:
+            cursor.close()
+        self.profiler.save_plan(fingerprint, seconds, plan)
+
+    def run(
+        self, name: str, params: tuple, type: int, fetchall: bool = True
+    ) -> list:
+        """
+        Executes a statement from the Statements registry, preparing it first if the current connection hasn't yet.
+
+            - name: str - the name of the prepared statement
+            - params: tuple - the parameters of the statement
+            - type: int - the type of the statement (Repository.COMMAND or Repository.QUERY)
+            - fetchall: bool - whether to fetch all the results or not (default: True)
+
+        Returns: list - the result of the statement
+        """
+        with self.session() as conn:
+            if name not in conn.prepared:
+                self.execute(Statements.prepare(name), Repository.QUERY, fetchall=False)
+                conn.prepared.add(name)
+                self._count_statement(name, "prepared")
+
+            try:
+                result = self.execute(
+                    Statements.execute(name, len(params)), type, fetchall, params
+                )
+            except psycopg2.errors.InvalidSqlStatementName:
+                conn.prepared.clear()
+                if self.in_transaction:
+                    raise
+                return self.run(name, params, type, fetchall)
+
+        self._count_statement(name, "executed")
+        return result
+
+    def _count_statement(self, name: str, counter: str) -> None:
+        """Increments one of the counters of a prepared statement."""
+        with self._stats_lock:
+            stats = self._statement_stats.setdefault(name, {"prepared": 0, "executed": 0})
+            stats[counter] += 1
+
+    def statement_stats(self) -> dict:
+        """
+        Returns how many times each prepared statement was prepared and executed.
+        'reused' counts the executions which reused an existing plan instead of parsing the statement again.
+        """
+        with self._stats_lock:
+            return {
+                name: dict(stats, reused=stats["executed"] - stats["prepared"])
+                for name, stats in self._statement_stats.items()
+            }
+
     def delete_song(self, param: str, data) -> None:
         """
         Deletes a song from the database by a given parameter.
 
-            - param: str - the parameter to search by
+            - param: str - the parameter to search by ('id' or 'filepath')
             - data: any - the value of the parameter
 
         Returns: None
         """
+        if param not in ("id", "filepath"):
+            raise ValueError(f"Songs can't be deleted by {param}.")
         try:
-            command = 'DELETE FROM "Song" WHERE {} = {}'.format(param, data)
-            self.execute(command, Repository.COMMAND, fetchall=False)
+            self.run(f"delete_song_by_{param}", (data,), Repository.COMMAND, fetchall=False)
         except psycopg2.Error as e:
             raise psycopg2.Error(f"Deleting song by {param} failed, error: {e}")
 
-    def create_artist(self, artist: str) -> int:
+    def delete_songs(self, song_ids: list[int]) -> None:
         """
-        Tries to fetch an artist from the database. If it doesn't exist, creates it.
+        Deletes several songs from the database with a single statement.
 
-              - artist: str - the name of the artist to be created
+            - song_ids: list[int] - the ids of the songs
 
-        Returns: int - the id of the artist from the database
+        Returns: None
         """
-        result = self.fetch_artist_id(artist)
-        if result == -1:
-            command = "INSERT INTO \"Artist\" (name) VALUES ('{}') RETURNING id".format(
-                artist
-            )
-            result = self.execute(command, Repository.COMMAND)
-            return result[0][0]
-        return result
+        if not song_ids:
+            return
+        self.run("delete_songs", (song_ids,), Repository.COMMAND, fetchall=False)
+        if self.catalog is not None:
+            self.on_commit(lambda: self.catalog.remove_songs(song_ids))
 
-    def create_tag(self, tag: str) -> int:
+    def delete_songs_by_filepath(self, file_paths: list[str]) -> list[int]:
         """
-        Tries to fetch a tag from the database. If it doesn't exist, creates it.
+        Deletes the songs stored at several paths with a single statement.
 
-            - tag: str - the name of the tag to be created
+            - file_paths: list[str] - the paths of the songs
 
-        Returns: int - the id of the tag from the database
+        Returns: list[int] - the ids of the deleted songs
         """
-        result = self.fetch_tag_id(tag)
-        if result == -1:
-            command = "INSERT INTO \"Tag\" (name) VALUES ('{}') RETURNING id".format(
-                tag
-            )
-            result = self.execute(command, Repository.COMMAND)
-            return result[0][0]
-        return result
+        if not file_paths:
+            return []
+        result = self.run("delete_songs_by_filepath", (file_paths,), Repository.COMMAND)
+        song_ids = [row[0] for row in result]
+        if self.catalog is not None:
+            self.on_commit(lambda: self.catalog.remove_songs(song_ids))
+        return song_ids
+
+    def move_songs(self, moves: list[tuple[str, str]]) -> list[int]:
+        """
+        Changes the paths of several songs with a single statement.
 
-    def create_song_artists(self, song_id: int, artists_id: list) -> None:
+            - moves: list[tuple[str, str]] - the (old path, new path) pairs
+
+        Returns: list[int] - the ids of the moved songs
         """
-        Creates the relations between a song and its artists.
+        if not moves:
+            return []
+        old, new = [list(paths) for paths in zip(*moves)]
+        result = self.run("move_songs", (old, new), Repository.COMMAND)
+        if self.catalog is not None:
+            self.on_commit(lambda: [self.catalog.move_song(*row) for row in result])
+        return [row[0] for row in result]
+
+    def tracked_filepaths(self, file_paths: list[str]) -> set[str]:
+        """
+        Checks which of the given paths belong to a song.
 
-            - song_id: int - the id of the song
-            - artists_id: list - the list of ids of the artists
+            - file_paths: list[str] - the paths to check
 
-        Returns: None
+        Returns: set[str] - the paths which have a song in the DB
         """
-        if len(artists_id) == 0:
-            return None
-        command = 'INSERT INTO "SongArtist" (songId, artistId) VALUES '
-        for artist_id in artists_id:
-            command += f"({song_id}, {artist_id}),"
-        command = command[:-1]
-        command += " RETURNING id"
-        self.execute(command, Repository.COMMAND)
+        if not file_paths:
+            return set()
+        return {row[0] for row in self.run("tracked_filepaths", (file_paths,), Repository.QUERY)}
 
-    def create_song_tags(self, song_id: int, tags_id: list) -> None:
+    def songs_by_filepath(self, file_paths: list[str]) -> list[tuple]:
         """
-        Creates the relations between a song and its tags.
+        Fetches the songs using the given paths.
 
-            - song_id: int - the id of the song
-            - tags_id: list - the list of ids of the tags
+            - file_paths: list[str] - the paths to look up
 
-        Returns: None
+        Returns: list[tuple] - the (filePath, name, releaseDate, format) of the songs, releaseDate as YYYY-MM-DD
         """
-        if len(tags_id) == 0:
-            return
-        command = 'INSERT INTO "SongTag" (songId, tagId) VALUES '
-        for tag_id in tags_id:
-            command += f"({song_id}, {tag_id}),"
-        command = command[:-1]
-        command += " RETURNING id"
-        self.execute(command, Repository.COMMAND)
+        if not file_paths:
+            return []
+        rows = self.run("songs_by_filepath", (file_paths,), Repository.QUERY)
+        return [(path, name, str(release_date), format) for path, name, release_date, format in rows]
 
-    def fetch_artist_id(self, artist: str) -> int:
+    def insert_songs(self, songs: list[tuple]) -> list[int]:
         """
-        Tries to fetch an artist from the database.
+        Inserts several songs and their relations with multi-row statements, in a single transaction.
+        The artists and tags are resolved first, with one upsert per table for the whole batch.
+        Inside a transaction() block, the songs are committed with it.
 
-            - artist: str - the name of the artist to be fetched
+            - songs: list[tuple] - the (filePath, name, releaseDate, format, [artists], [tags], digest) of the songs
 
-        Returns: int - the id of the artist from the database or -1 if it doesn't exist
+        Returns: list[int] - the ids of the inserted songs, in order
         """
-        query = "SELECT * FROM \"Artist\" WHERE name = '{}'".format(artist)
-        result = self.execute(query, Repository.QUERY)
-        if len(result) == 0:
-            return -1
-        else:
-            return result[0][0]
+        if not songs:
+            return []
+        artists = list(dict.fromkeys(name for song in songs for name in song[4]))
+        tags = list(dict.fromkeys(name for song in songs for name in song[5]))
+        with self.transaction() as conn:
+            artist_ids = dict(zip(artists, self.resolve_artists(artists)))
+            tag_ids = dict(zip(tags, self.resolve_tags(tags)))
+
+            with conn.cursor() as cursor:
+                result = psycopg2.extras.execute_values(
+                    cursor,
+                    'INSERT INTO "Song" (filepath, name, releasedate, format, digest) VALUES %s RETURNING id',
+                    [(*song[:4], song[6]) for song in songs],
+                    page_size=len(songs),
+                    fetch=True,
+                )
+                song_ids = [row[0] for row in result]
+                for table, column, position, ids in (
+                    ("SongArtist", "artistId", 4, artist_ids),
+                    ("SongTag", "tagId", 5, tag_ids),
+                ):
+                    relations = [
+                        (song_id, ids[name])
+                        for song_id, song in zip(song_ids, songs)
+                        for name in dict.fromkeys(song[position])
+                    ]
+                    if relations:
+                        psycopg2.extras.execute_values(
+                            cursor,
+                            f'INSERT INTO "{table}" (songId, {column}) VALUES %s '
+                            f"ON CONFLICT (songId, {column}) DO NOTHING",
+                            relations,
+                            page_size=len(relations),
+                        )
+            self._local.transaction["dirty"] = True
+
+            if self.catalog is not None:
+                self.on_commit(
+                    lambda: Repository._catalog_add(self.catalog, song_ids, songs, artist_ids, tag_ids)
+                )
+        return song_ids
+
+    @staticmethod
+    def _catalog_add(catalog, song_ids: list[int], songs: list[tuple], artist_ids: dict, tag_ids: dict) -> None:
+        """Adds the songs inserted by insert_songs() to the in-memory catalog."""
+        for song_id, song in zip(song_ids, songs):
+            catalog.add_song(
+                song_id,
+                *song[:4],
+                {artist_ids[name]: name for name in song[4]},
+                {tag_ids[name]: name for name in song[5]},
+            )
 
-    def fetch_tag_id(self, tag: str) -> int:
+    def resolve_artists(self, artists: list[str]) -> list[int]:
         """
-        Tries to fetch a tag from the database.
+        Fetches the ids of the given artists, creating the missing ones, with one statement for the whole list.
 
-            - tag: str - the name of the tag to be fetched
+            - artists: list[str] - the names of the artists
 
-        Returns: int - the id of the tag from the database or -1 if it doesn't exist
+        Returns: list[int] - the ids of the artists, in the order of their first occurrence in 'artists'
         """
-        query = "SELECT * FROM \"Tag\" WHERE name = '{}'".format(tag)
-        result = self.execute(query, Repository.QUERY)
-        if len(result) == 0:
-            return -1
-        else:
-            return result[0][0]
+        return self._resolve("upsert_artists", self._artist_ids, artists)
 
-    def fetch_song_data(self, song_id: int) -> tuple:
+    def resolve_tags(self, tags: list[str]) -> list[int]:
         """
-        Fetches the data of a song from the database.
+        Fetches the ids of the given tags, creating the missing ones, with one statement for the whole list.
 
-            - song_id: int - the id of the song to be fetched
+            - tags: list[str] - the names of the tags
 
-        Returns a tuple containing (filePath, name, releaseDate, format, [artists], [tags]).
+        Returns: list[int] - the ids of the tags, in the order of their first occurrence in 'tags'
         """
+        return self._resolve("upsert_tags", self._tag_ids, tags)
 
-        query = 'SELECT filepath, name, releasedate, format from "Song" WHERE id = {}'.format(
-            song_id
-        )
-        result = self.execute(query, Repository.QUERY)
-
-        filePath, name, releaseDate, format = result[0]
+    def _resolve(self, statement: str, cache: LRUCache, names: list[str]) -> list[int]:
+        """
+        Maps names to ids through 'cache', resolving all the cache misses with a single upsert statement.
+        The new ids are only cached once the transaction which created them is committed, so a concurrent
+        transaction never links a row to a name it can't see yet.
 
-        query = 'SELECT "Artist".name from "Artist" \
-            join "SongArtist" on "Artist".id = "SongArtist".artistid \
-            WHERE "SongArtist".songid = {}'.format(
-            song_id
-        )
+            - statement: str - the name of the prepared upsert statement
+            - cache: LRUCache - the name->id cache of the table
+            - names: list[str] - the names to be resolved
 
-        result = self.execute(query, Repository.QUERY)
-        artists = [item[0] for item in result]
+        Returns: list[int] - the ids of the distinct names, in order
+        """
+        names = list(dict.fromkeys(names))
+        ids = {name: cache.get(name) for name in names}
+        missing = [name for name, id in ids.items() if id is None]
 
-        query = 'SELECT "Tag".name from "Tag" \
-            join "SongTag" on "Tag".id = "SongTag".tagid \
-            WHERE "SongTag".songid = {}'.format(
-            song_id
-        )
-        result = self.execute(query, Repository.QUERY)
-        tags = [item[0] for item in result]
+        if missing:
+            rows = self.run(statement, (missing,), Repository.COMMAND)
+            for id, name in rows:
+                ids[name] = id
+            self.on_commit(lambda: [cache.put(name, id) for id, name in rows])
 
-        return filePath, name, releaseDate, format, artists, tags
+        return [ids[name] for name in names]
 
-    def create_song_tag(self, song_id: int, tag: str) -> int:
+    def create_song_artists(self, song_id: int, artists_id: list) -> None:
         """
-        Creates a relation between a song and a tag in the 'SongTag' table.
+        Creates the relations between a song and its artists, skipping the ones which already exist.
 
             - song_id: int - the id of the song
-            - tag: str - the name of the tag
+            - artists_id: list - the list of ids of the artists
 
-        Returns: int - the id of the relation
+        Returns: None
         """
-        tag_id = self.fetch_tag_id(tag)
-        if tag_id == -1:
-            tag_id = self.create_tag(tag)
-
-        command = 'INSERT INTO "SongTag" (songid, tagid) SELECT {}, {} WHERE NOT EXISTS (SELECT 1 FROM "SongTag" WHERE songId = {} AND tagId = {}) RETURNING id'.format(
-            song_id, tag_id, song_id, tag_id
-        )
-
-        return self.execute(command, Repository.COMMAND)
+        if len(artists_id) == 0:
+            return None
+        self.run("insert_song_artists", (song_id, artists_id), Repository.COMMAND)
 
-    def create_song_artist(self, song_id: int, artist: str) -> int:
+    def create_song_tags(self, song_id: int, tags_id: list) -> None:
         """
-        Creates a relation between a song and an artist in the 'SongArtist' table.
+        Creates the relations between a song and its tags, skipping the ones which already exist.
 
             - song_id: int - the id of the song
-            - artist: str - the name of the artist
+            - tags_id: list - the list of ids of the tags
 
-        Returns: int - the id of the relation
+        Returns: None
         """
-        artist_id = self.fetch_artist_id(artist)
-        if artist_id == -1:
-            artist_id = self.create_artist(artist)
+        if len(tags_id) == 0:
+            return
+        self.run("insert_song_tags", (song_id, tags_id), Repository.COMMAND)
 
-        command = 'INSERT INTO "SongArtist" (songid, artistid) SELECT {}, {} WHERE NOT EXISTS (SELECT 1 FROM "SongArtist" WHERE songId = {} AND artistId = {}) RETURNING id'.format(
-            song_id, artist_id, song_id, artist_id
-        )
+    def fetch_song_data(self, song_id: int) -> tuple:
+        """
+        Fetches the data of a song from the database.
+
+            - song_id: int - the id of the song to be fetched
 
-        return self.execute(command, Repository.COMMAND)
+        Returns a tuple containing (filePath, name, releaseDate, format, [artists], [tags]).
+        """
+        result = self.run("fetch_song_data", (song_id,), Repository.QUERY)
+        return result[0]
 
     def update_song(self, song_id: int, data: dict) -> None:
         """
-        Updates a song from the database.
+        Updates a song from the database. Empty values leave the column unchanged.
 
             - song_id: int - the id of the song to be updated
             - data: dict - the data to be updated
@@ -280,15 +642,10 @@ class Repository:
         Keys: newName, newReleaseDate, newFormat
         Returns: None
         """
-        setters = []
-        if data["newName"]:
-            setters.append(f"name = '{data['newName']}'")
-        if data["newReleaseDate"]:
-            setters.append(f"releaseDate = '{data['newReleaseDate']}'")
-        if data["newFormat"]:
-            setters.append(f"format = '{data['newFormat']}'")
-
-        command = 'UPDATE "Song" SET {} WHERE id = {} RETURNING id'.format(
-            ", ".join(setters), song_id
+        params = (
+            song_id,
+            data["newName"] or None,
+            data["newReleaseDate"] or None,
+            data["newFormat"] or None,
         )
-        self.execute(command, Repository.COMMAND)
+        self.run("update_song", params, Repository.COMMAND)
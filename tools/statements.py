@@ -0,0 +1,104 @@
+"""Module which defines the statements prepared on the server for every connection."""
+
+
+class Statements:
+    """
+    A registry of the parameterized statements used by the application.
+
+    Each statement is PREPAREd once per connection, the first time it is needed, and then executed by name,
+    so Postgres parses and plans it only once per connection.
+    """
+
+    PREPARED = {
+        "insert_song": (
+            "varchar, varchar, date, varchar, varchar",
+            'INSERT INTO "Song" (filepath, name, releasedate, format, digest) VALUES ($1, $2, $3, $4, $5) RETURNING id',
+        ),
+        "fetch_song": ("int", 'SELECT * FROM "Song" WHERE id = $1'),
+        "fetch_song_filepath": ("int", 'SELECT filepath FROM "Song" WHERE id = $1'),
+        "song_exists": ("int", 'SELECT 1 FROM "Song" WHERE id = $1'),
+        "update_song": (
+            "int, varchar, date, varchar",
+            'UPDATE "Song" SET name = COALESCE($2, name), releasedate = COALESCE($3, releasedate), '
+            "format = COALESCE($4, format) WHERE id = $1 RETURNING id",
+        ),
+        "delete_song_by_id": ("int", 'DELETE FROM "Song" WHERE id = $1'),
+        "delete_song_by_filepath": ("varchar", 'DELETE FROM "Song" WHERE filepath = $1'),
+        "delete_songs": ("int[]", 'DELETE FROM "Song" WHERE id = ANY($1)'),
+        "delete_songs_by_filepath": ("varchar[]", 'DELETE FROM "Song" WHERE filepath = ANY($1) RETURNING id'),
+        "move_songs": (
+            "varchar[], varchar[]",
+            'UPDATE "Song" SET filepath = moved.new FROM unnest($1::varchar[], $2::varchar[]) AS moved(old, new) '
+            'WHERE "Song".filepath = moved.old RETURNING "Song".id, "Song".filepath',
+        ),
+        "tracked_filepaths": ("varchar[]", 'SELECT filepath FROM "Song" WHERE filepath = ANY($1)'),
+        "songs_by_filepath": (
+            "varchar[]",
+            'SELECT filepath, name, releasedate, format FROM "Song" WHERE filepath = ANY($1)',
+        ),
+        "upsert_artists": (
+            "varchar[]",
+            'WITH input AS (SELECT DISTINCT unnest($1::varchar[]) AS name), '
+            'existing AS (SELECT "Artist".id, "Artist".name FROM "Artist" JOIN input USING (name)), '
+            'inserted AS (INSERT INTO "Artist" (name) SELECT name FROM input '
+            "WHERE name NOT IN (SELECT name FROM existing) ORDER BY name "
+            "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id, name) "
+            "SELECT id, name FROM existing UNION ALL SELECT id, name FROM inserted",
+        ),
+        "upsert_tags": (
+            "varchar[]",
+            'WITH input AS (SELECT DISTINCT unnest($1::varchar[]) AS name), '
+            'existing AS (SELECT "Tag".id, "Tag".name FROM "Tag" JOIN input USING (name)), '
+            'inserted AS (INSERT INTO "Tag" (name) SELECT name FROM input '
+            "WHERE name NOT IN (SELECT name FROM existing) ORDER BY name "
+            "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id, name) "
+            "SELECT id, name FROM existing UNION ALL SELECT id, name FROM inserted",
+        ),
+        "insert_song_artists": (
+            "int, int[]",
+            'INSERT INTO "SongArtist" (songId, artistId) SELECT $1, unnest($2::int[]) '
+            "ON CONFLICT (songId, artistId) DO NOTHING RETURNING id",
+        ),
+        "insert_song_tags": (
+            "int, int[]",
+            'INSERT INTO "SongTag" (songId, tagId) SELECT $1, unnest($2::int[]) '
+            "ON CONFLICT (songId, tagId) DO NOTHING RETURNING id",
+        ),
+        "fetch_song_data": (
+            "int",
+            'SELECT filepath, name, releasedate, format, '
+            'ARRAY(SELECT "Artist".name FROM "SongArtist" JOIN "Artist" ON "SongArtist".artistid = "Artist".id '
+            'WHERE "SongArtist".songid = "Song".id ORDER BY "SongArtist".id), '
+            'ARRAY(SELECT "Tag".name FROM "SongTag" JOIN "Tag" ON "SongTag".tagid = "Tag".id '
+            'WHERE "SongTag".songid = "Song".id ORDER BY "SongTag".id) '
+            'FROM "Song" WHERE id = $1',
+        ),
+    }
+
+    @staticmethod
+    def prepare(name: str) -> str:
+        """
+        Returns the PREPARE command of a registered statement.
+
+            - name: str - the name of the statement
+
+        Returns: str - the PREPARE command, raises an exception if the statement is not registered
+        """
+        if name not in Statements.PREPARED:
+            raise ValueError(f"Unknown prepared statement ({name})")
+        types, sql = Statements.PREPARED[name]
+        return f"PREPARE {name} ({types}) AS {sql}"
+
+    @staticmethod
+    def execute(name: str, arity: int) -> str:
+        """
+        Returns the EXECUTE command of a registered statement, with placeholders for its parameters.
+
+            - name: str - the name of the statement
+            - arity: int - the number of parameters passed to the statement
+
+        Returns: str - the EXECUTE command
+        """
+        if arity == 0:
+            return f"EXECUTE {name}"
+        return "EXECUTE {} ({})".format(name, ", ".join(["%s"] * arity))
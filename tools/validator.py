@@ -3,11 +3,49 @@ import os
 import json
 from datetime import datetime
 from common import extensions
+from tools.ingest import Ingest
+from tools.logger import Logger
+from tools.archiver import Archiver
 
 
 class Validator:
     """A class which provides static methods to validate the json files."""
 
+    POOL_DEFAULTS = {"minSize": 1, "maxSize": 4, "timeout": 10.0, "healthCheck": 30.0}
+    CACHE_DEFAULTS = {"names": 4096, "searches": 256, "ttl": 300.0, "maxRows": 10000}
+    SEARCH_DEFAULTS = {"fetchSize": 1000}
+    CATALOG_DEFAULTS = {"enabled": False}
+    INGEST_DEFAULTS = {"strategy": "copy", "contentAddressed": False, "digest": "sha256"}
+    IMPORT_DEFAULTS = {"batchSize": 1000, "workers": 4}
+    LOGGING_DEFAULTS = {
+        "queueSize": 10000,
+        "batchSize": 256,
+        "flushInterval": 1.0,
+        "flushBytes": 65536,
+        "format": "text",
+        "maxBytes": 10485760,
+        "rotateEvery": 0.0,
+        "compression": "gzip",
+        "retention": 5,
+    }
+    METRICS_DEFAULTS = {"textfile": "", "interval": 15.0}
+    PROFILING_DEFAULTS = {"enabled": False, "slowQuery": 0.5, "sampleRate": 0.0, "plans": ""}
+    ARCHIVE_DEFAULTS = {
+        "format": "zip",
+        "compression": "deflate",
+        "store": ["mp3"],
+        "level": 6,
+        "workers": 0,
+        "chunkSize": 1048576,
+    }
+    WATCHER_DEFAULTS = {"enabled": False, "debounce": 1.0, "maxBatch": 1000, "checkpoint": ""}
+
+    MAX_LENGTH = 255
+
+    CREATE_KEYS = {"filePath", "name", "format", "releaseDate", "artists", "tags", "auto"}
+    SEARCH_KEYS = {"name", "format", "releaseDate", "artists", "tags"}
+    SEARCH_OPTIONAL_KEYS = {"limit", "after", "query"}
+
     @staticmethod
     def _check_file(path: str) -> bool:
         """
@@ -42,7 +80,20 @@ class Validator:
         Returns: dict - the dictionary with the data if successful, raises an exception otherwise
         """
         valid_keys = {"storage", "logger", "restart", "connection"}
-        data = Validator.primary_validator(jsonPath, valid_keys)
+        optional_keys = {
+            "pool",
+            "cache",
+            "search",
+            "catalog",
+            "watcher",
+            "import",
+            "ingest",
+            "logging",
+            "metrics",
+            "profiling",
+            "archive",
+        }
+        data = Validator.primary_validator(jsonPath, valid_keys, optional_keys)
 
         valid_connection_keys = {"host", "user", "password", "database", "port"}
         if valid_connection_keys != set(data["connection"].keys()):
@@ -71,8 +122,157 @@ class Validator:
                 "Logger path doesn't exist or it's not a file or can't be read."
             )
 
+        data["pool"] = Validator._validate_section(
+            data, "pool", Validator.POOL_DEFAULTS
+        )
+        if not 0 <= data["pool"]["minSize"] <= data["pool"]["maxSize"]:
+            raise ValueError("Pool sizes must satisfy 0 <= minSize <= maxSize.")
+        if data["pool"]["maxSize"] < 1:
+            raise ValueError("Pool maxSize must be at least 1.")
+
+        data["cache"] = Validator._validate_section(
+            data, "cache", Validator.CACHE_DEFAULTS
+        )
+        data["search"] = Validator._validate_section(
+            data, "search", Validator.SEARCH_DEFAULTS
+        )
+        if data["search"]["fetchSize"] < 1:
+            raise ValueError("Search fetchSize must be at least 1.")
+
+        data["catalog"] = Validator._validate_section(
+            data, "catalog", Validator.CATALOG_DEFAULTS
+        )
+
+        data["ingest"] = Validator._validate_section(
+            data, "ingest", Validator.INGEST_DEFAULTS
+        )
+        if data["ingest"]["strategy"] not in Ingest.STRATEGIES:
+            raise ValueError(
+                f"Ingest strategy must be one of {', '.join(Ingest.STRATEGIES)}."
+            )
+        if data["ingest"]["digest"] not in Ingest.DIGESTS:
+            raise ValueError(f"Ingest digest must be one of {', '.join(Ingest.DIGESTS)}.")
+
+        data["import"] = Validator._validate_section(
+            data, "import", Validator.IMPORT_DEFAULTS
+        )
+        if data["import"]["batchSize"] < 1 or data["import"]["workers"] < 1:
+            raise ValueError("Import batchSize and workers must be at least 1.")
+
+        data["logging"] = Validator._validate_section(
+            data, "logging", Validator.LOGGING_DEFAULTS
+        )
+        if any(data["logging"][key] < 1 for key in ("queueSize", "batchSize", "flushBytes")):
+            raise ValueError("Logging queueSize, batchSize and flushBytes must be at least 1.")
+        if data["logging"]["flushInterval"] <= 0:
+            raise ValueError("Logging flushInterval must be positive.")
+        if any(data["logging"][key] < 0 for key in ("maxBytes", "rotateEvery", "retention")):
+            raise ValueError("Logging maxBytes, rotateEvery and retention can't be negative.")
+        if data["logging"]["format"] not in Logger.FORMATS:
+            raise ValueError(f"Logging format must be one of {', '.join(Logger.FORMATS)}.")
+        if data["logging"]["compression"] not in Logger.COMPRESSIONS:
+            raise ValueError(
+                f"Logging compression must be one of {', '.join(Logger.COMPRESSIONS)} "
+                "(zstd requires the zstandard package)."
+            )
+
+        data["metrics"] = Validator._validate_section(
+            data, "metrics", Validator.METRICS_DEFAULTS
+        )
+        if data["metrics"]["interval"] <= 0:
+            raise ValueError("Metrics interval must be positive.")
+        textfile = data["metrics"]["textfile"]
+        if textfile and not Validator._check_dir(os.path.dirname(os.path.abspath(textfile))):
+            raise ValueError("Metrics textfile must be in an existing directory.")
+
+        data["profiling"] = Validator._validate_section(
+            data, "profiling", Validator.PROFILING_DEFAULTS
+        )
+        if data["profiling"]["slowQuery"] < 0:
+            raise ValueError("Profiling slowQuery can't be negative.")
+        if not 0 <= data["profiling"]["sampleRate"] <= 1:
+            raise ValueError("Profiling sampleRate must be between 0 and 1.")
+        if not data["profiling"]["plans"]:
+            data["profiling"]["plans"] = os.path.join(
+                os.path.dirname(data["logger"]), "query-plans.jsonl"
+            )
+
+        data["archive"] = Validator._validate_section(
+            data, "archive", Validator.ARCHIVE_DEFAULTS
+        )
+        if data["archive"]["format"] not in Archiver.FORMATS:
+            raise ValueError(
+                f"Archive format must be one of {', '.join(Archiver.FORMATS)} "
+                "(tar.zst requires the zstandard package)."
+            )
+        if data["archive"]["compression"] not in Archiver.COMPRESSIONS:
+            raise ValueError(
+                f"Archive compression must be one of {', '.join(Archiver.COMPRESSIONS)} "
+                "(zstd requires the zstandard package)."
+            )
+        if not all(isinstance(format, str) for format in data["archive"]["store"]):
+            raise TypeError("Archive store must be a list of formats.")
+        deflated = data["archive"]["format"] == "zip" and data["archive"]["compression"] == "deflate"
+        if deflated and data["archive"]["level"] > 9:
+            raise ValueError("Archive level must be between 0 and 9 with deflate.")
+        if data["archive"]["chunkSize"] < 1:
+            raise ValueError("Archive chunkSize must be at least 1.")
+
+        data["watcher"] = Validator._validate_section(
+            data, "watcher", Validator.WATCHER_DEFAULTS
+        )
+        if data["watcher"]["maxBatch"] < 1:
+            raise ValueError("Watcher maxBatch must be at least 1.")
+        if not data["watcher"]["checkpoint"]:
+            data["watcher"]["checkpoint"] = os.path.join(
+                data["storage"], ".storage-checkpoint.json"
+            )
+
         return data
 
+    @staticmethod
+    def _validate_section(data: dict, key: str, defaults: dict) -> dict:
+        """
+        Validates an optional section of appsettings.json and fills in the missing values.
+        Every value must have the same type as its default (integers are accepted for floats).
+
+            - data: dict - the appsettings data
+            - key: str - the name of the section
+            - defaults: dict - the default values of the section
+
+        Returns: dict - the section with the defaults applied, raises an exception otherwise
+        """
+        section = data.get(key, {})
+        if not isinstance(section, dict):
+            raise TypeError(f"Appsettings '{key}' must be an object.")
+
+        unknown = set(section.keys()) - set(defaults.keys())
+        if unknown:
+            raise TypeError(
+                f"Unknown keys in appsettings '{key}': {unknown}. Valid keys are {set(defaults.keys())}"
+            )
+
+        result = dict(defaults)
+        result.update(section)
+        for name, default in defaults.items():
+            value = result[name]
+            if isinstance(default, bool):
+                valid = isinstance(value, bool)
+            elif isinstance(default, float):
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            elif isinstance(default, int):
+                valid = isinstance(value, int) and not isinstance(value, bool)
+            else:
+                valid = isinstance(value, type(default))
+            if not valid:
+                raise TypeError(
+                    f"Appsettings '{key}.{name}' must be of type {type(default).__name__}."
+                )
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value < 0:
+                raise ValueError(f"Appsettings '{key}.{name}' can't be negative.")
+
+        return result
+
     @staticmethod
     def validate_create(jsonPath: str) -> dict:
         """
@@ -82,16 +282,19 @@ class Validator:
 
         Returns: dict - the dictionary with the data if successful, raises an exception otherwise
         """
-        valid_keys = {
-            "filePath",
-            "name",
-            "format",
-            "releaseDate",
-            "artists",
-            "tags",
-            "auto",
-        }
-        data = Validator.primary_validator(jsonPath, valid_keys)
+        data = Validator.primary_validator(jsonPath, Validator.CREATE_KEYS)
+        return Validator.validate_song(data)
+
+    @staticmethod
+    def validate_song(data: dict) -> dict:
+        """
+        Validates the data of a song, as received by the 'create' command or read from an import manifest.
+
+            - data: dict - the data of the song
+
+        Returns: dict - the dictionary with the data if successful, raises an exception otherwise
+        """
+        Validator.check_keys(data, Validator.CREATE_KEYS)
 
         if not isinstance(data["artists"], list):
             raise TypeError("Artists value must be a list.")
@@ -130,8 +333,22 @@ class Validator:
                 f"Format date needs to be YEAR-MONTH-DAY ({str(e).strip()})"
             )
 
+        Validator.check_lengths(data)
         return data
 
+    @staticmethod
+    def check_lengths(data: dict) -> None:
+        """
+        Checks that the name, the artists and the tags of a song fit in their columns of the database.
+
+            - data: dict - the data of the song
+
+        Returns: None, raises an exception if a value is longer than MAX_LENGTH characters
+        """
+        for value in (data["name"], *data["artists"], *data["tags"]):
+            if len(value) > Validator.MAX_LENGTH:
+                raise ValueError(f"{value[:32]}... is longer than {Validator.MAX_LENGTH} characters.")
+
     @staticmethod
     def validate_delete(jsonPath: str) -> dict:
         """
@@ -214,9 +431,73 @@ class Validator:
 
         Returns: dict - the dictionary with the data if successful, raises an exception otherwise
         """
-        valid_keys = {"name", "format", "releaseDate", "artists", "tags"}
-        data = Validator.primary_validator(jsonPath, valid_keys)
+        data = Validator.primary_validator(jsonPath, Validator.SEARCH_KEYS, Validator.SEARCH_OPTIONAL_KEYS)
+        return Validator.validate_criteria(data)
+
+    @staticmethod
+    def validate_archive(jsonPath: str) -> dict:
+        """
+        Validates the json file for 'archive' command: the search criteria, the optional 'selection' ('all' or
+        Opt,Opt,... where Opt = <number> or <number>..<number>), the optional 'output' (a path or '-' for stdout) and
+        the optional 'base' (the archive an incremental archive is based on).
+
+            - jsonPath: str - the path to archive options json file
+
+        Returns: dict - the dictionary with the data if successful, raises an exception otherwise
+        """
+        data = Validator.primary_validator(
+            jsonPath, Validator.SEARCH_KEYS, Validator.SEARCH_OPTIONAL_KEYS | {"selection", "output", "base"}
+        )
+        Validator.validate_criteria(data)
+
+        for key in ("selection", "output", "base"):
+            data.setdefault(key, None)
+            if data[key] is not None and (not isinstance(data[key], str) or not data[key].strip()):
+                raise TypeError(f"{key.capitalize()} value must be a non-empty string.")
+
+        output = data["output"]
+        if output is not None and output != "-":
+            if not Validator._check_dir(os.path.dirname(os.path.abspath(output))):
+                raise ValueError(f"Archive output {output} must be in an existing directory.")
+            if os.path.isfile(output):
+                raise ValueError(f"Archive output {output} already exists.")
 
+        return data
+
+    @staticmethod
+    def validate_restore(jsonPath: str) -> dict:
+        """
+        Validates the json file for 'restore' command.
+
+            - jsonPath: str - the path to restore options json file
+
+        Returns: dict - the dictionary with the data if successful, raises an exception otherwise
+        """
+        data = Validator.primary_validator(jsonPath, {"archives"}, {"destination"})
+
+        if not isinstance(data["archives"], list) or not data["archives"]:
+            raise TypeError("Archives value must be a non-empty list.")
+        if not all(isinstance(archive, str) for archive in data["archives"]):
+            raise TypeError("Archives must be strings.")
+
+        data.setdefault("destination", None)
+        if data["destination"] is not None:
+            if not isinstance(data["destination"], str):
+                raise TypeError("Destination value must be a string.")
+            if not Validator._check_dir(data["destination"]):
+                raise ValueError(f"Destination {data['destination']} must be an existing directory.")
+
+        return data
+
+    @staticmethod
+    def validate_criteria(data: dict) -> dict:
+        """
+        Validates the search criteria of the 'search' and 'archive' commands.
+
+            - data: dict - the data loaded from the json file
+
+        Returns: dict - the dictionary with the data if successful, raises an exception otherwise
+        """
         list_only = [data["releaseDate"], data["artists"], data["tags"]]
         if not all(isinstance(value, list) for value in list_only):
             raise TypeError("Release date, artists and tags must be lists.")
@@ -239,6 +520,54 @@ class Validator:
                 f"Format date needs to be YEAR-MONTH-DAY ({str(e).strip()})"
             )
 
+        data["query"] = data.get("query") or ""
+        if not isinstance(data["query"], str):
+            raise TypeError("Query value must be a string.")
+        if data["query"] and data.get("after") is not None:
+            raise ValueError("'after' can't be used with 'query', results are ordered by relevance.")
+
+        for key in ("limit", "after"):
+            data.setdefault(key, None)
+            if data[key] is None:
+                continue
+            if not isinstance(data[key], int) or isinstance(data[key], bool):
+                raise TypeError(f"{key.capitalize()} value must be an integer.")
+            if data[key] < 0:
+                raise ValueError(f"{key.capitalize()} value must be a positive integer.")
+
+        return data
+
+    @staticmethod
+    def validate_import(jsonPath: str) -> dict:
+        """
+        Validates the json file for 'import' command.
+
+            - jsonPath: str - the path to import options json file
+
+        Returns: dict - the dictionary with the data if successful, raises an exception otherwise
+        """
+        data = Validator.primary_validator(jsonPath, {"source"}, {"tags", "resume"})
+
+        if not isinstance(data["source"], str):
+            raise TypeError("Source value must be a string.")
+        if not Validator._check_dir(data["source"]):
+            if not data["source"].endswith(".jsonl"):
+                raise ValueError("Source must be a directory or a .jsonl manifest.")
+            if not Validator._check_file(data["source"]):
+                raise TypeError(
+                    f"File {data['source']} not found or it's not a file or can't be read."
+                )
+
+        data.setdefault("tags", [])
+        if not isinstance(data["tags"], list) or not all(
+            isinstance(tag, str) for tag in data["tags"]
+        ):
+            raise TypeError("Tags value must be a list of strings.")
+
+        data.setdefault("resume", True)
+        if not isinstance(data["resume"], bool):
+            raise TypeError("Resume value must be a boolean.")
+
         return data
 
     @staticmethod
@@ -259,12 +588,15 @@ class Validator:
         return data
 
     @staticmethod
-    def primary_validator(jsonPath: str, valid_keys: set) -> dict:
+    def primary_validator(
+        jsonPath: str, valid_keys: set, optional_keys: set = frozenset()
+    ) -> dict:
         """
         Checks if the json file is accessible and has the required keys.
 
                 - jsonPath: str - the path to the json file
                 - valid_keys: set - the set of required keys
+                - optional_keys: set - the set of keys which may be missing (optional)
 
         Returns: dict - the dictionary with the data if successful, raises an exception otherwise
         """
@@ -277,7 +609,26 @@ class Validator:
         with open(jsonPath, "r") as file:
             data = json.loads(file.read())
 
-        if valid_keys != set(data.keys()):
-            raise TypeError(f"Required keys for command are {valid_keys}")
-
+        Validator.check_keys(data, valid_keys, optional_keys)
         return data
+
+    @staticmethod
+    def check_keys(data, valid_keys: set, optional_keys: set = frozenset()) -> None:
+        """
+        Checks if the data is an object with the required keys.
+
+                - data: any - the data loaded from json
+                - valid_keys: set - the set of required keys
+                - optional_keys: set - the set of keys which may be missing (optional)
+
+        Returns: None, raises an exception if the keys are not valid
+        """
+        if not isinstance(data, dict):
+            raise TypeError("Json data must be an object.")
+
+        if not valid_keys <= set(data.keys()) <= valid_keys | optional_keys:
+            if optional_keys:
+                raise TypeError(
+                    f"Required keys for command are {valid_keys}, optional keys are {set(optional_keys)}"
+                )
+            raise TypeError(f"Required keys for command are {valid_keys}")
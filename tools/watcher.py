@@ -0,0 +1,250 @@
+"""Module responsible for watching the storage folder and keeping the DB in sync with it while the application runs."""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from common import extensions
+
+
+class StorageWatcher(threading.Thread):
+    """
+    A thread which receives the inotify events of the storage folder (Linux only), coalesces them per file name and
+    hands them over in batches, once no new event arrived for 'debounce' seconds or 'max_batch' files changed.
+
+    The batches are passed to 'apply' as (added, removed, renamed), where added and removed are lists of file names and
+    renamed is a list of (old name, new name) tuples. A None batch means events were lost and a full scan is needed.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, storage: str, apply, debounce: float = 1.0, max_batch: int = 1000):
+        """
+        Initializes the StorageWatcher class.
+
+            - storage: str - the path to the storage folder
+            - apply: callable - receives the batches of changes (added, removed, renamed)
+            - debounce: float - seconds without events after which the pending changes are applied (optional)
+            - max_batch: int - number of changed files after which the pending changes are applied right away (optional)
+
+        Returns: None
+        """
+        super().__init__(name="storage-watcher", daemon=True)
+        self.storage = storage
+        self.apply = apply
+        self.debounce = debounce
+        self.max_batch = max(1, max_batch)
+        self.error = None
+
+        self._pending = OrderedDict()
+        self._moves = {}
+        self._stop_event = threading.Event()
+        self._ready = threading.Event()
+        self._fd = None
+
+    @staticmethod
+    def available() -> bool:
+        """Returns True if inotify can be used on this platform, False otherwise."""
+        if not sys.platform.startswith("linux"):
+            return False
+        libc = ctypes.util.find_library("c")
+        return libc is not None and hasattr(ctypes.CDLL(libc), "inotify_init1")
+
+    def start(self) -> None:
+        """Starts the watcher thread and waits until the storage folder is being watched."""
+        super().start()
+        self._ready.wait()
+        if self.error is not None:
+            raise OSError(f"Storage watcher failed to start! {self.error}")
+
+    def stop(self) -> None:
+        """Stops the watcher thread, after the pending changes are applied. 'error' is set if they couldn't be."""
+        self._stop_event.set()
+        self.join()
+
+    def run(self) -> None:
+        """Starts the execution of the watcher thread."""
+        try:
+            self._fd = self._watch()
+        except OSError as e:
+            self.error = str(e).strip()
+            self._ready.set()
+            return
+        self._ready.set()
+
+        try:
+            last_event = time.monotonic()
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([self._fd], [], [], min(self.debounce, 0.5))
+                if readable:
+                    self._read_events()
+                    last_event = time.monotonic()
+
+                idle = time.monotonic() - last_event >= self.debounce
+                if self._pending and (idle or len(self._pending) >= self.max_batch):
+                    self._flush()
+
+            self._read_events()
+            self._flush()
+        finally:
+            os.close(self._fd)
+
+    def _watch(self) -> int:
+        """Creates the inotify instance and adds the watch on the storage folder."""
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(StorageWatcher.IN_NONBLOCK | StorageWatcher.IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        path = os.fsencode(self.storage)
+        if libc.inotify_add_watch(fd, path, StorageWatcher.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed on {self.storage}")
+        return fd
+
+    def _read_events(self) -> None:
+        """Reads all the available events and records them as pending changes."""
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                _, mask, cookie, length = StorageWatcher.EVENT.unpack_from(buffer, offset)
+                offset += StorageWatcher.EVENT.size
+                name = os.fsdecode(buffer[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                self._record(mask, cookie, name)
+
+        for name in self._moves.values():
+            self._removed(name)
+        self._moves.clear()
+
+    def _record(self, mask: int, cookie: int, name: str) -> None:
+        """Records one inotify event, pairing the two halves of a rename by their cookie."""
+        if mask & StorageWatcher.IN_Q_OVERFLOW:
+            self._pending.clear()
+            self._pending[None] = None
+            return
+        if mask & StorageWatcher.IN_ISDIR:
+            return
+
+        relevant = StorageWatcher.relevant(name)
+        if mask & StorageWatcher.IN_MOVED_FROM:
+            if relevant:
+                self._moves[cookie] = name
+        elif mask & StorageWatcher.IN_MOVED_TO:
+            old = self._moves.pop(cookie, None)
+            if old is not None and relevant:
+                self._renamed(old, name)
+            elif old is not None:
+                self._removed(old)
+            elif relevant:
+                self._added(name)
+        elif not relevant:
+            return
+        elif mask & (StorageWatcher.IN_CREATE | StorageWatcher.IN_CLOSE_WRITE):
+            self._added(name)
+        elif mask & StorageWatcher.IN_DELETE:
+            self._removed(name)
+
+    def _added(self, name: str) -> None:
+        """Records that a file appeared. A file replacing a renamed one keeps the rename."""
+        if not isinstance(self._pending.get(name), tuple):
+            self._pending[name] = "added"
+
+    def _removed(self, name: str) -> None:
+        """Records that a file disappeared, together with the original file if it was renamed in the same batch."""
+        previous = self._pending.pop(name, None)
+        if isinstance(previous, tuple):
+            self._pending[previous[1]] = "removed"
+        self._pending[name] = "removed"
+
+    def _renamed(self, old: str, new: str) -> None:
+        """Records that a file was renamed, chaining it to the previous rename of the old name."""
+        previous = self._pending.pop(old, None)
+        self._pending[new] = previous if isinstance(previous, tuple) else ("renamed", old)
+
+    def _flush(self) -> None:
+        """Hands the pending changes over to 'apply'. Failures are kept for the next batch."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, OrderedDict()
+
+        if None in pending:
+            batch = None
+        else:
+            added = [name for name, change in pending.items() if change == "added"]
+            removed = [name for name, change in pending.items() if change == "removed"]
+            renamed = [(change[1], name) for name, change in pending.items() if isinstance(change, tuple)]
+            batch = (added, removed, renamed)
+
+        try:
+            self.apply(batch)
+        except Exception as e:
+            pending.update(self._pending)
+            self._pending = pending
+            if self._stop_event.is_set():
+                self.error = str(e).strip()
+                return
+            time.sleep(self.debounce)
+
+    @staticmethod
+    def relevant(name: str) -> bool:
+        """Checks if a file name from the storage folder is an audio file handled by the application."""
+        return name.rsplit(".", 1)[-1] in extensions.SUPPORTED_FORMATS and "." in name
+
+    @staticmethod
+    def load_checkpoint(path: str) -> set[str]:
+        """
+        Loads and removes the checkpoint written by save_checkpoint(), so a crash before the next one leads to a full scan.
+
+            - path: str - the path to the checkpoint file
+
+        Returns: set[str] | None - the file names reconciled when the checkpoint was written, None if there is no valid checkpoint
+        """
+        try:
+            with open(path, "r") as file:
+                data = json.loads(file.read())
+            os.remove(path)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict) or not isinstance(data.get("files"), list):
+            return None
+        return set(data["files"])
+
+    @staticmethod
+    def save_checkpoint(path: str, files: set[str]) -> None:
+        """
+        Atomically writes the checkpoint of the storage folder.
+
+            - path: str - the path to the checkpoint file
+            - files: set[str] - the file names reconciled with the DB
+
+        Returns: None
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(json.dumps({"version": 1, "savedAt": time.time(), "files": sorted(files)}))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)